@@ -6,10 +6,17 @@
 """
 
 import os
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response
 from flask_cors import CORS
 from backend.models import db, init_db
 from backend.routes import setup_routes
+from backend.cache import install_invalidation_listeners
+from backend.serializers import FastJSONProvider
+from backend.metrics import init_metrics, render_metrics
+from backend.profiling import init_profiling
+from backend.storage import start_storage_reconciler
+from backend.jobs import start_job_workers
+from backend.utils import resolve_photo_path
 import re
 
 
@@ -17,6 +24,9 @@ def create_app():
     """创建Flask应用实例"""
     app = Flask(__name__, static_folder='../frontend', static_url_path='/')
     
+    # 使用更快的JSON后端（安装了orjson时使用orjson）
+    app.json = FastJSONProvider(app)
+    
     # 配置应用
     basedir = os.path.abspath(os.path.dirname(__file__))
     # 从环境变量获取数据目录，默认为原始路径
@@ -32,6 +42,7 @@ def create_app():
     # 设置应用配置
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(data_dir, "love_story.db")}'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['DATA_DIR'] = data_dir
     app.config['UPLOAD_FOLDER'] = uploads_dir
     app.config['THUMBNAILS_FOLDER'] = thumbnails_dir
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 限制上传文件大小为16MB
@@ -39,6 +50,15 @@ def create_app():
     # 允许的图片扩展名
     app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     
+    # 存储用量后台对账间隔（秒），0表示不启用
+    app.config['STORAGE_RECONCILE_INTERVAL'] = int(os.environ.get('LOVE_STORY_STORAGE_RECONCILE_INTERVAL', 6 * 3600))
+    
+    # 后台任务工作线程数，0表示不启动
+    app.config['JOB_WORKERS'] = int(os.environ.get('LOVE_STORY_JOB_WORKERS', 2))
+    
+    # 写入提交后自动使相关缓存失效
+    install_invalidation_listeners()
+    
     # 初始化数据库
     db.init_app(app)
     with app.app_context():
@@ -47,9 +67,27 @@ def create_app():
     # 启用CORS
     CORS(app)
     
+    # 运行指标（请求延迟、数据库查询等），设置LOVE_STORY_METRICS=0可以关闭
+    if os.environ.get('LOVE_STORY_METRICS', '1') != '0':
+        init_metrics(app, db)
+    
+    # SQL性能分析（Server-Timing头和慢查询日志），设置LOVE_STORY_SQL_PROFILE=1启用
+    if os.environ.get('LOVE_STORY_SQL_PROFILE', '0') == '1':
+        init_profiling(
+            app, db,
+            slow_query_ms=float(os.environ.get('LOVE_STORY_SLOW_QUERY_MS', 100)),
+            log_path=os.path.join(data_dir, 'slow_queries.log')
+        )
+    
     # 设置路由
     setup_routes(app)
     
+    # 启动存储用量后台对账
+    start_storage_reconciler(app, app.config['STORAGE_RECONCILE_INTERVAL'])
+    
+    # 启动后台任务工作线程
+    start_job_workers(app, app.config['JOB_WORKERS'])
+    
     # 上传文件的静态文件服务
     @app.route('/api/uploads/<path:filename>')
     def serve_uploads(filename):
@@ -81,6 +119,11 @@ def create_app():
     def health_check():
         return jsonify({'status': 'healthy', 'app': 'Love Story App'})
     
+    # 运行指标端点（Prometheus文本格式）
+    @app.route('/api/metrics')
+    def metrics_endpoint():
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+    
     # 静态文件路由
     @app.route('/')
     def serve_index():
@@ -91,10 +134,10 @@ def create_app():
     def serve_root_images(filename):
         # 检查文件名是否为图片格式
         if re.match(r'^\w+\.(jpg|jpeg|png|gif|webp)$', filename):
-            # 检查文件是否存在于上传目录
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            if os.path.exists(file_path):
-                return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+            # 检查文件是否存在于上传目录（分片布局或旧版平铺布局）
+            file_path = resolve_photo_path(app.config['UPLOAD_FOLDER'], filename)
+            if file_path:
+                return send_from_directory(os.path.dirname(file_path), filename)
             # 如果文件不存在，返回404而不是500错误
             return jsonify({'error': 'Image not found'}), 404
         # 如果不是图片，继续到下一个路由处理
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+恋爱故事记录应用 - 照片批量操作
+
+移动相册/事件、修改拍摄日期和删除都按ID分批执行集合式的UPDATE/DELETE语句，
+存储计数器按原相册/事件聚合后增量调整。所有函数只写入当前会话，由调用方负责提交；
+删除照片返回的文件名应在提交之后交给后台队列删除。
+"""
+
+from sqlalchemy import select, update, delete
+
+from backend.models import db, Photo
+from backend.storage import SCOPE_ALBUM, record_photos_moved, record_photos_removed
+from backend.tags import IN_CHUNK_SIZE
+
+# 支持的批量操作
+BULK_OPERATIONS = ('set_album', 'set_event', 'set_date', 'delete')
+
+
+def _chunks(values):
+    for start in range(0, len(values), IN_CHUNK_SIZE):
+        yield values[start:start + IN_CHUNK_SIZE]
+
+
+def _update_photos(photo_ids, values):
+    updated = 0
+    for chunk in _chunks(photo_ids):
+        result = db.session.execute(update(Photo).where(Photo.id.in_(chunk)).values(**values))
+        updated += max(result.rowcount, 0)
+    return updated
+
+
+def move_photos(photo_ids, scope, target_id):
+    """
+    把一组照片移动到指定相册（scope为SCOPE_ALBUM）或事件（SCOPE_EVENT），
+    target_id为None时移出相册或事件。返回更新的照片数量
+    """
+    column = 'album_id' if scope == SCOPE_ALBUM else 'event_id'
+    updated = 0
+    for chunk in _chunks(photo_ids):
+        record_photos_moved(chunk, scope, target_id)
+        updated += _update_photos(chunk, {column: target_id})
+    return updated
+
+
+def set_photos_date(photo_ids, date_taken):
+    """修改一组照片的拍摄日期，返回更新的照片数量"""
+    return _update_photos(photo_ids, {'date_taken': date_taken})
+
+
+def delete_photos(photo_ids):
+    """
+    删除一组照片的数据库记录，返回它们的文件名
+
+    标签关联和空间索引由photo表上的触发器同步删除
+    """
+    filenames = []
+    for chunk in _chunks(photo_ids):
+        filenames.extend(db.session.execute(select(Photo.filename).where(Photo.id.in_(chunk))).scalars())
+        record_photos_removed(chunk)
+        db.session.execute(delete(Photo).where(Photo.id.in_(chunk)))
+    return filenames
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+"""
+恋爱故事记录应用 - 进程内缓存
+
+缓存项按依赖的数据表记录版本号，任何写入提交后对应表的版本号递增，
+缓存项随之失效。表的写入通过SQLAlchemy会话事件自动捕获：
+ORM对象的增删改（after_flush）以及query.update/delete、insert等语句（do_orm_execute）。
+删除行时由数据库触发器同步修改的其他表通过register_delete_cascade登记。
+只修改缓存内容不涉及的列（例如存储用量记账）的语句可以带上执行选项invalidates_cache=False，不使缓存失效。
+"""
+
+import threading
+import time
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+_lock = threading.Lock()
+
+# 各数据表的版本号
+_versions = {}
+
+# 缓存项: key -> (依赖表的版本号, 过期时间, 值)
+_entries = {}
+
+# 删除某表的行时由触发器同步修改的其他表 {表名: (表名, ...)}
+_delete_cascades = {}
+
+# 命中统计
+_stats = {'hits': 0, 'misses': 0}
+
+_listeners_installed = False
+
+
+def get_versions(tables):
+    """获取一组数据表当前的版本号"""
+    return tuple(_versions.get(table, 0) for table in tables)
+
+
+def invalidate(*tables):
+    """使依赖指定数据表的缓存项失效"""
+    with _lock:
+        for table in tables:
+            _versions[table] = _versions.get(table, 0) + 1
+
+
+def register_delete_cascade(table, *dependent_tables):
+    """登记删除table的行时由触发器同步修改的表，删除提交后这些表的缓存也一起失效"""
+    _delete_cascades[table] = _delete_cascades.get(table, ()) + dependent_tables
+
+
+def invalidate_all():
+    """清空所有缓存项（例如恢复数据库之后）"""
+    with _lock:
+        for table in list(_versions):
+            _versions[table] += 1
+        _entries.clear()
+
+
+def get_or_build(key, tables, builder, ttl=None):
+    """
+    读取缓存，不存在或已失效时调用builder重新生成
+
+    参数:
+    - key: 缓存键
+    - tables: 依赖的数据表名列表
+    - builder: 无参函数，返回要缓存的值
+    - ttl: 可选的过期时间（秒）
+    """
+    versions = get_versions(tables)
+    now = time.time()
+    entry = _entries.get(key)
+    if entry is not None and entry[0] == versions and (entry[1] is None or entry[1] > now):
+        _stats['hits'] += 1
+        return entry[2]
+
+    _stats['misses'] += 1
+    value = builder()
+    # 只有在生成期间没有新的写入时才保存，避免缓存旧数据
+    with _lock:
+        if get_versions(tables) == versions:
+            _entries[key] = (versions, now + ttl if ttl else None, value)
+    return value
+
+
+def get_cache_stats():
+    """返回缓存命中统计"""
+    hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else 0.0,
+        'entries': len(_entries)
+    }
+
+
+def _touched(session):
+    return session.info.setdefault('cache_touched_tables', set())
+
+
+def _after_flush(session, flush_context):
+    touched = _touched(session)
+    deleted = set(session.deleted)
+    for obj in list(session.new) + list(session.dirty) + list(deleted):
+        table = getattr(obj, '__table__', None)
+        if table is not None:
+            touched.add(table.name)
+            # 多对多关系的变化体现在关联表上；新增和修改的对象只有关系本身变化时才算写入关联表
+            state = inspect(obj)
+            for relationship in obj.__mapper__.relationships:
+                if relationship.secondary is None:
+                    continue
+                if obj not in deleted and not state.attrs[relationship.key].history.has_changes():
+                    continue
+                touched.add(relationship.secondary.name)
+    for obj in session.deleted:
+        table = getattr(obj, '__table__', None)
+        if table is not None:
+            touched.update(_delete_cascades.get(table.name, ()))
+
+
+def _do_orm_execute(orm_execute_state):
+    if not orm_execute_state.execution_options.get('invalidates_cache', True):
+        return
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            touched = _touched(orm_execute_state.session)
+            touched.add(table.name)
+            if orm_execute_state.is_delete:
+                touched.update(_delete_cascades.get(table.name, ()))
+
+
+def _after_commit(session):
+    touched = session.info.pop('cache_touched_tables', None)
+    if touched:
+        invalidate(*touched)
+
+
+def _after_rollback(session):
+    session.info.pop('cache_touched_tables', None)
+
+
+def install_invalidation_listeners():
+    """注册会话事件，写入提交后自动使相关缓存失效（只注册一次）"""
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_soft_rollback', lambda session, previous_transaction: _after_rollback(session))
+    _listeners_installed = True
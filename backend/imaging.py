@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+"""
+恋爱故事记录应用 - 图片解码限制
+
+16MB以内的PNG或GIF也可能解码出数GB的像素数据。解码前先从文件头读取尺寸和帧数：
+
+- 像素数超过 LOVE_STORY_MAX_IMAGE_PIXELS 或帧数超过 LOVE_STORY_MAX_IMAGE_FRAMES 的图片直接拒绝
+- 动图（GIF/WebP）的缩略图只解码第一帧；预览动画逐帧解码，同一时间只保留一帧原尺寸画布
+- JPEG按目标尺寸使用draft模式，在解码时按1/2、1/4、1/8缩小
+- 每个进程同时解码占用的内存不超过 LOVE_STORY_DECODE_MEMORY_MB，超出时后来的解码排队等待，
+  单张图片的估算内存超过预算时拒绝
+
+批量重建缩略图的每个工作进程各自有一份预算。
+"""
+
+import os
+import warnings
+import threading
+from contextlib import contextmanager
+
+from backend import metrics
+
+# 单张图片允许的最大像素数（宽×高）
+MAX_IMAGE_PIXELS = int(os.environ.get('LOVE_STORY_MAX_IMAGE_PIXELS', 64 * 1000 * 1000))
+# 动图允许的最大帧数
+MAX_IMAGE_FRAMES = int(os.environ.get('LOVE_STORY_MAX_IMAGE_FRAMES', 500))
+# 每个进程同时解码可使用的内存（字节）
+DECODE_MEMORY_BUDGET = int(os.environ.get('LOVE_STORY_DECODE_MEMORY_MB', 512)) * 1024 * 1024
+
+# 拒绝原因
+REJECT_PIXELS = 'pixels'
+REJECT_FRAMES = 'frames'
+REJECT_MEMORY = 'memory'
+
+_budget_in_use = 0
+_budget_changed = threading.Condition()
+_pillow_configured = False
+
+
+class ImageRejected(ValueError):
+    """图片超出解码限制"""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+def _configure_pillow():
+    """让Pillow自身的解压炸弹检查与这里的像素上限一致（Pillow在导入时才加载，这里延迟配置）"""
+    global _pillow_configured
+    if _pillow_configured:
+        return
+    from PIL import Image
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    # 超过上限的图片由check_image_limits拒绝，不需要Pillow再发出警告
+    warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+    _pillow_configured = True
+
+
+def _reject(reason, message):
+    metrics.inc('love_story_images_rejected_total', labels=(('reason', reason),))
+    raise ImageRejected(reason, message)
+
+
+def _bytes_per_pixel(img):
+    """解码后每个像素占用的字节数"""
+    if img.mode in ('I', 'F', 'I;32'):
+        return 4
+    if img.mode.startswith('I;16'):
+        return 2
+    return len(img.getbands())
+
+
+def check_image_limits(img):
+    """检查已打开（尚未解码）图片的像素数和帧数，超出限制时抛出ImageRejected"""
+    width, height = img.size
+    if width * height > MAX_IMAGE_PIXELS:
+        _reject(REJECT_PIXELS, f'图片尺寸过大（{width}×{height}），最多允许{MAX_IMAGE_PIXELS}像素')
+    frames = getattr(img, 'n_frames', 1)
+    if frames > MAX_IMAGE_FRAMES:
+        _reject(REJECT_FRAMES, f'动图帧数过多（{frames}帧），最多允许{MAX_IMAGE_FRAMES}帧')
+
+
+def inspect_image(image_path):
+    """只读取文件头检查图片是否超出解码限制，超出时抛出ImageRejected"""
+    _configure_pillow()
+    from PIL import Image
+
+    try:
+        img = Image.open(image_path)
+    except Image.DecompressionBombError as e:
+        _reject(REJECT_PIXELS, str(e))
+    with img:
+        check_image_limits(img)
+
+
+@contextmanager
+def decode_budget(nbytes):
+    """在进程的解码内存预算中占用nbytes，预算不足时等待"""
+    global _budget_in_use
+    if nbytes > DECODE_MEMORY_BUDGET:
+        _reject(REJECT_MEMORY, f'解码图片约需{nbytes // (1024 * 1024)}MB内存，超过预算'
+                               f'{DECODE_MEMORY_BUDGET // (1024 * 1024)}MB')
+    with _budget_changed:
+        if _budget_in_use + nbytes > DECODE_MEMORY_BUDGET:
+            metrics.inc('love_story_decode_budget_waits_total')
+            _budget_changed.wait_for(lambda: _budget_in_use + nbytes <= DECODE_MEMORY_BUDGET)
+        _budget_in_use += nbytes
+    try:
+        yield
+    finally:
+        with _budget_changed:
+            _budget_in_use -= nbytes
+            _budget_changed.notify_all()
+
+
+@contextmanager
+def open_image_limited(image_path, target_size=None):
+    """
+    在解码限制内打开图片，返回的图片已经解码了第一帧
+
+    target_size为最终需要的尺寸，JPEG会据此在解码时直接缩小；
+    超出限制时抛出ImageRejected
+    """
+    _configure_pillow()
+    from PIL import Image
+
+    try:
+        img = Image.open(image_path)
+    except Image.DecompressionBombError as e:
+        _reject(REJECT_PIXELS, str(e))
+    with img:
+        check_image_limits(img)
+        if getattr(img, 'is_animated', False):
+            img.seek(0)
+        if target_size and img.format == 'JPEG':
+            img.draft('RGB', target_size)
+
+        with decode_budget(img.size[0] * img.size[1] * _bytes_per_pixel(img)):
+            img.load()
+            yield img
+
+
+@contextmanager
+def open_animation_limited(image_path, target_size, max_frames):
+    """
+    在解码限制内打开动图，用于逐帧生成缩小的预览动画，不是动图时返回None
+
+    预算按一帧原尺寸画布加上max_frames个缩小后的帧估算；超出限制时抛出ImageRejected
+    """
+    _configure_pillow()
+    from PIL import Image
+
+    try:
+        img = Image.open(image_path)
+    except Image.DecompressionBombError as e:
+        _reject(REJECT_PIXELS, str(e))
+    with img:
+        check_image_limits(img)
+        if not getattr(img, 'is_animated', False):
+            yield None
+            return
+
+        width, height = img.size
+        scale = min(1.0, target_size[0] / width, target_size[1] / height)
+        frame_bytes = max(1, int(width * scale)) * max(1, int(height * scale)) * 4
+        with decode_budget(width * height * 4 + frame_bytes * min(img.n_frames, max_frames)):
+            yield img
+
+
+@metrics.register_collector
+def _collect_decode_limits(data):
+    with _budget_changed:
+        in_use = _budget_in_use
+    return [
+        ('love_story_image_max_pixels', (), MAX_IMAGE_PIXELS),
+        ('love_story_image_max_frames', (), MAX_IMAGE_FRAMES),
+        ('love_story_decode_memory_budget_bytes', (), DECODE_MEMORY_BUDGET),
+        ('love_story_decode_memory_in_use_bytes', (), in_use),
+    ]
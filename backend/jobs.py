@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+"""
+恋爱故事记录应用 - 后台任务
+
+备份、恢复、批量上传、孤立文件清理等耗时操作作为任务写入jobs表，由固定数量的工作线程执行，
+接口立即返回任务ID，客户端轮询 /api/jobs/<id> 或通过SSE订阅进度。
+
+运行中的进度只保存在内存中（避免与任务自身的数据库事务争用SQLite的写锁），
+任务开始、结束和取消时写回jobs表。进程重启时，正在运行的任务标记为interrupted，
+排队中的任务重新入队。
+"""
+
+import json
+import queue
+import logging
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+
+from sqlalchemy import update
+
+from backend import metrics
+from backend.models import db, Job
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+JOB_INTERRUPTED = 'interrupted'
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED, JOB_INTERRUPTED)
+
+# 已注册的任务类型: {kind: (处理函数, 是否独占)}
+_handlers = {}
+
+_queue = queue.Queue()
+_workers = []
+_workers_lock = threading.Lock()
+_app = None
+
+# 独占任务（备份、恢复等整体读写数据库文件的任务）之间互斥执行
+_exclusive_lock = threading.Lock()
+
+# 运行中任务的进度 {job_id: {'done', 'total', 'message'}}、已请求取消的任务和每个任务的变更序号，
+# 都由_changed保护；状态变化时通知等待中的SSE连接
+_live = {}
+_cancel_requested = set()
+_versions = {}
+_changed = threading.Condition()
+
+
+class JobCancelled(Exception):
+    """任务已被请求取消，由JobContext.progress()抛出"""
+
+
+def job_handler(kind, exclusive=False):
+    """
+    注册任务类型的处理函数
+
+    处理函数的参数为(JobContext, **params)，在应用上下文中执行，返回值（可JSON序列化）作为任务结果。
+    exclusive为True的任务之间不会同时执行
+    """
+    def decorator(func):
+        _handlers[kind] = (func, exclusive)
+        return func
+    return decorator
+
+
+def _notify(job_id):
+    """记录任务状态变化并唤醒等待者（需持有_changed）"""
+    _versions[job_id] = _versions.get(job_id, 0) + 1
+    _changed.notify_all()
+
+
+class JobContext:
+    """传给处理函数的任务上下文，用于报告进度和检查取消"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    @property
+    def cancelled(self):
+        return self.job_id in _cancel_requested
+
+    def progress(self, done, total=None, message=None):
+        """更新进度；任务已被请求取消时抛出JobCancelled"""
+        with _changed:
+            state = _live.setdefault(self.job_id, {'done': 0, 'total': None, 'message': None})
+            state['done'] = done
+            if total is not None:
+                state['total'] = total
+            if message is not None:
+                state['message'] = message
+            _notify(self.job_id)
+        if self.cancelled:
+            raise JobCancelled()
+
+
+def submit_job(kind, params=None):
+    """创建任务记录并放入队列，返回任务字典"""
+    if kind not in _handlers:
+        raise ValueError(f'未知的任务类型: {kind}')
+    job = Job(kind=kind, status=JOB_QUEUED, params=json.dumps(params or {}, ensure_ascii=False))
+    db.session.add(job)
+    db.session.commit()
+    _queue.put(job.id)
+    return job.to_dict()
+
+
+def _overlay_live(data):
+    """把内存中的进度合并到任务字典中"""
+    with _changed:
+        live = _live.get(data['id'])
+        if live:
+            data['progress'] = {'done': live['done'], 'total': live['total']}
+            if live['message']:
+                data['message'] = live['message']
+        if data['id'] in _cancel_requested:
+            data['cancel_requested'] = True
+    return data
+
+
+def get_job(job_id):
+    """读取任务状态（包含运行中的实时进度），不存在时返回None"""
+    job = db.session.get(Job, job_id, populate_existing=True)
+    return _overlay_live(job.to_dict()) if job else None
+
+
+def list_jobs(limit=20):
+    """最近的任务，新的在前"""
+    jobs = Job.query.order_by(Job.id.desc()).limit(limit).all()
+    return [_overlay_live(job.to_dict()) for job in jobs]
+
+
+def cancel_job(job_id):
+    """
+    取消任务：排队中的任务直接标记为cancelled，运行中的任务在下一次报告进度时停止。
+    返回任务字典，不存在时返回None
+    """
+    result = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == JOB_QUEUED)
+        .values(status=JOB_CANCELLED, finished_at=datetime.utcnow())
+    )
+    if not result.rowcount:
+        result = db.session.execute(
+            update(Job).where(Job.id == job_id, Job.status == JOB_RUNNING).values(cancel_requested=True)
+        )
+        if result.rowcount:
+            with _changed:
+                _cancel_requested.add(job_id)
+    db.session.commit()
+    with _changed:
+        _notify(job_id)
+    return get_job(job_id)
+
+
+def job_version(job_id):
+    """任务的变更序号，每次进度或状态变化时递增"""
+    with _changed:
+        return _versions.get(job_id, 0)
+
+
+def wait_for_job_change(job_id, version, timeout):
+    """等待任务的变更序号不再等于version，返回新的序号（超时时不变）"""
+    with _changed:
+        _changed.wait_for(lambda: _versions.get(job_id, 0) != version, timeout)
+        return _versions.get(job_id, 0)
+
+
+def _finish(job_id, kind, params, status, result=None, error=None):
+    """把任务的最终状态和进度写回数据库"""
+    with _changed:
+        live = _live.get(job_id) or {}
+
+    job = db.session.get(Job, job_id)
+    if job is None:
+        # 恢复备份会整体替换数据库，旧数据库中可能没有这个任务
+        job = Job(id=job_id, kind=kind, params=params)
+        db.session.add(job)
+    elif job.kind != kind or job.params != params:
+        # 恢复的数据库中同一ID是另一个任务，保留它原来的记录
+        logger.warning(f"Job {job_id} ({kind}) was replaced by a restored job, result not recorded")
+        job = None
+
+    if job is not None:
+        job.status = status
+        job.finished_at = datetime.utcnow()
+        job.result = json.dumps(result, ensure_ascii=False, default=str) if result is not None else None
+        job.error = error
+        job.progress_done = live.get('done', job.progress_done or 0)
+        job.progress_total = live.get('total', job.progress_total)
+        job.message = live.get('message') or job.message
+        db.session.commit()
+
+    with _changed:
+        _live.pop(job_id, None)
+        _cancel_requested.discard(job_id)
+        _notify(job_id)
+
+
+def _run_job(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return
+    kind, params = job.kind, job.params
+
+    # 与取消操作竞争时以数据库中的状态为准
+    started = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == JOB_QUEUED)
+        .values(status=JOB_RUNNING, started_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    if not started:
+        return
+
+    with _changed:
+        _live[job_id] = {'done': 0, 'total': None, 'message': None}
+        _notify(job_id)
+
+    handler, exclusive = _handlers.get(kind, (None, False))
+    if handler is None:
+        _finish(job_id, kind, params, JOB_FAILED, error=f'未知的任务类型: {kind}')
+        return
+
+    try:
+        with _exclusive_lock if exclusive else nullcontext():
+            result = handler(JobContext(job_id), **json.loads(params or '{}'))
+    except JobCancelled:
+        db.session.rollback()
+        _finish(job_id, kind, params, JOB_CANCELLED)
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Job {job_id} ({kind}) failed")
+        _finish(job_id, kind, params, JOB_FAILED, error=str(e))
+    else:
+        _finish(job_id, kind, params, JOB_SUCCEEDED, result=result)
+
+
+def _run_worker():
+    while True:
+        job_id = _queue.get()
+        try:
+            with _app.app_context():
+                _run_job(job_id)
+        except Exception:
+            logger.exception(f"Job worker failed on job {job_id}")
+        finally:
+            _queue.task_done()
+
+
+def recover_jobs():
+    """
+    处理数据库中未完成的任务（启动时或恢复备份后调用）
+
+    不在当前进程中运行的running任务标记为interrupted，排队中的任务重新入队（重复入队的任务只会执行一次）
+    """
+    with _changed:
+        active = list(_live)
+    db.session.execute(
+        update(Job).where(Job.status == JOB_RUNNING, Job.id.notin_(active))
+        .values(status=JOB_INTERRUPTED, finished_at=datetime.utcnow(), message='任务未在当前进程中运行，已中断')
+    )
+    db.session.commit()
+    for (job_id,) in db.session.query(Job.id).filter(Job.status == JOB_QUEUED).order_by(Job.id):
+        _queue.put(job_id)
+
+
+def start_job_workers(app, workers=2):
+    """
+    启动任务工作线程
+
+    workers为线程数，小于等于0时不启动（命令行工具等场景）
+    """
+    global _app
+    if not workers or workers <= 0:
+        return
+    _app = app
+
+    with app.app_context():
+        recover_jobs()
+
+    with _workers_lock:
+        while len(_workers) < workers:
+            thread = threading.Thread(target=_run_worker, name=f'job-worker-{len(_workers) + 1}', daemon=True)
+            thread.start()
+            _workers.append(thread)
+
+
+@metrics.register_collector
+def _collect_job_stats(data):
+    with _changed:
+        running = len(_live)
+    return [
+        ('love_story_jobs_queued', (), _queue.qsize()),
+        ('love_story_jobs_running', (), running),
+    ]
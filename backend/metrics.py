@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+
+"""
+恋爱故事记录应用 - 运行指标
+
+以Prometheus文本格式输出请求数量、各路由的延迟分布、每个请求的数据库查询次数和耗时、
+缩略图生成耗时、上传吞吐、SQLite文件大小以及缓存命中率。
+
+每个线程写自己的计数器，记录指标时不加锁；抓取时再把各线程的数据合并。
+已结束线程的数据会被合并到一个汇总存储中，避免每个请求一个线程时存储无限增长。
+"""
+
+import os
+import time
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import request, g
+from sqlalchemy import event
+
+# 延迟类指标的默认分桶（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 每个请求的查询次数分桶
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# 指标说明: 名称 -> (类型, 说明)
+METRICS = {
+    'love_story_http_requests_total': ('counter', 'HTTP请求数量'),
+    'love_story_http_request_duration_seconds': ('histogram', 'HTTP请求处理耗时'),
+    'love_story_db_queries_per_request': ('histogram', '每个请求执行的SQL语句数量'),
+    'love_story_db_time_per_request_seconds': ('histogram', '每个请求的SQL执行耗时'),
+    'love_story_db_queries_total': ('counter', 'SQL语句执行总数'),
+    'love_story_db_query_seconds_total': ('counter', 'SQL语句执行总耗时'),
+    'love_story_thumbnail_generation_seconds': ('histogram', '缩略图生成耗时'),
+    'love_story_thumbnail_generation_waits_total': ('counter', '等待其他请求生成同一缩略图后直接使用结果的次数'),
+    'love_story_images_rejected_total': ('counter', '超出解码限制被拒绝的图片数量'),
+    'love_story_decode_budget_waits_total': ('counter', '因解码内存预算不足而排队的次数'),
+    'love_story_image_max_pixels': ('gauge', '单张图片允许的最大像素数'),
+    'love_story_image_max_frames': ('gauge', '动图允许的最大帧数'),
+    'love_story_decode_memory_budget_bytes': ('gauge', '每个进程同时解码可使用的内存'),
+    'love_story_decode_memory_in_use_bytes': ('gauge', '当前解码占用的内存预算'),
+    'love_story_upload_bytes_total': ('counter', '上传并保存的字节数'),
+    'love_story_upload_seconds_total': ('counter', '保存上传文件的总耗时'),
+    'love_story_upload_bytes_per_second': ('gauge', '上传保存的平均吞吐（字节/秒）'),
+    'love_story_sqlite_file_bytes': ('gauge', 'SQLite数据库文件大小（包括WAL文件）'),
+    'love_story_cache_hits_total': ('counter', '进程内缓存命中次数'),
+    'love_story_cache_misses_total': ('counter', '进程内缓存未命中次数'),
+    'love_story_cache_hit_ratio': ('gauge', '进程内缓存命中率'),
+}
+
+# 超过该数量的线程存储时，合并已结束线程的数据
+_FOLD_THRESHOLD = 64
+
+_local = threading.local()
+_stores = []  # (线程, 存储)
+_stores_lock = threading.Lock()
+_retired = None
+
+# 可以在抓取时计算的附加指标，函数接收合并后的数据，返回[(名称, 标签, 值)]
+_collectors = []
+
+# 需要报告文件大小的SQLite数据库
+_database_paths = set()
+
+
+def _new_store():
+    return {'counters': defaultdict(float), 'histograms': {}}
+
+
+def _store():
+    """获取当前线程的指标存储，首次使用时注册"""
+    store = getattr(_local, 'store', None)
+    if store is None:
+        store = _new_store()
+        _local.store = store
+        with _stores_lock:
+            _stores.append((threading.current_thread(), store))
+            if len(_stores) > _FOLD_THRESHOLD:
+                _fold_dead_stores()
+    return store
+
+
+def _merge(target, source):
+    for key, value in dict(source['counters']).items():
+        target['counters'][key] += value
+    for key, hist in dict(source['histograms']).items():
+        existing = target['histograms'].get(key)
+        if existing is None:
+            target['histograms'][key] = [hist[0], list(hist[1]), hist[2], hist[3]]
+        else:
+            existing[1] = [a + b for a, b in zip(existing[1], hist[1])]
+            existing[2] += hist[2]
+            existing[3] += hist[3]
+
+
+def _fold_dead_stores():
+    """把已结束线程的数据合并到汇总存储中（调用方需持有_stores_lock）"""
+    global _retired
+    if _retired is None:
+        _retired = _new_store()
+    alive = []
+    for thread, store in _stores:
+        if thread.is_alive():
+            alive.append((thread, store))
+        else:
+            _merge(_retired, store)
+    _stores[:] = alive
+
+
+def inc(name, value=1, labels=()):
+    """计数器加值"""
+    _store()['counters'][(name, labels)] += value
+
+
+def observe(name, value, labels=(), buckets=LATENCY_BUCKETS):
+    """记录一次直方图观测值"""
+    histograms = _store()['histograms']
+    key = (name, labels)
+    hist = histograms.get(key)
+    if hist is None:
+        # [分桶上限, 各分桶计数（最后一个为+Inf）, 总和, 总次数]
+        hist = histograms[key] = [buckets, [0] * (len(buckets) + 1), 0.0, 0]
+    hist[1][bisect_left(hist[0], value)] += 1
+    hist[2] += value
+    hist[3] += 1
+
+
+def register_collector(func):
+    """注册抓取时调用的附加指标采集函数"""
+    _collectors.append(func)
+    return func
+
+
+def snapshot():
+    """合并所有线程的数据"""
+    merged = _new_store()
+    with _stores_lock:
+        _fold_dead_stores()
+        _merge(merged, _retired)
+        for _, store in _stores:
+            _merge(merged, store)
+    return merged
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+def render_metrics():
+    """生成Prometheus文本格式的指标"""
+    data = snapshot()
+    gauges = defaultdict(list)
+    for collector in _collectors:
+        try:
+            for name, labels, value in collector(data):
+                gauges[name].append((labels, value))
+        except Exception as e:
+            print(f"采集指标失败: {e}")
+
+    series = defaultdict(list)
+    for (name, labels), value in data['counters'].items():
+        series[name].append(('counter', labels, value))
+    for (name, labels), hist in data['histograms'].items():
+        series[name].append(('histogram', labels, hist))
+    for name, values in gauges.items():
+        for labels, value in values:
+            series[name].append(('gauge', labels, value))
+
+    lines = []
+    for name in sorted(series):
+        metric_type, help_text = METRICS.get(name, (series[name][0][0], name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for kind, labels, value in sorted(series[name], key=lambda item: item[1]):
+            if kind != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {value:g}')
+                continue
+            buckets, counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", f"{bound:g}")])} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {total:g}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+# ===== 请求和数据库耗时采集 =====
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    inc('love_story_db_queries_total')
+    inc('love_story_db_query_seconds_total', elapsed)
+
+    # 累加到当前请求
+    current = getattr(_local, 'request', None)
+    if current is not None:
+        current[0] += 1
+        current[1] += elapsed
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    # [查询次数, 查询耗时]
+    _local.request = [0, 0.0]
+
+
+def _after_request(response):
+    started = g.pop('metrics_started', None)
+    current = getattr(_local, 'request', None)
+    _local.request = None
+    if started is None:
+        return response
+
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    inc('love_story_http_requests_total', labels=(
+        ('route', route), ('method', request.method), ('status', str(response.status_code))
+    ))
+    observe('love_story_http_request_duration_seconds', elapsed, labels=(('route', route),))
+    if current is not None:
+        observe('love_story_db_queries_per_request', current[0], labels=(('route', route),),
+                buckets=QUERY_COUNT_BUCKETS)
+        observe('love_story_db_time_per_request_seconds', current[1], labels=(('route', route),))
+    return response
+
+
+def init_metrics(app, db):
+    """注册请求钩子和数据库事件"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    with app.app_context():
+        engine = db.engine
+    if engine.url.database:
+        _database_paths.add(engine.url.database)
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+@register_collector
+def _collect_sqlite_size(data):
+    results = []
+    for database_path in sorted(_database_paths):
+        size = 0
+        for path in (database_path, database_path + '-wal'):
+            try:
+                size += os.stat(path).st_size
+            except OSError:
+                pass
+        results.append(('love_story_sqlite_file_bytes', (('path', database_path),), size))
+    return results
+
+
+@register_collector
+def _collect_upload_throughput(data):
+    uploaded = data['counters'].get(('love_story_upload_bytes_total', ()), 0)
+    seconds = data['counters'].get(('love_story_upload_seconds_total', ()), 0)
+    return [('love_story_upload_bytes_per_second', (), uploaded / seconds if seconds else 0)]
+
+
+@register_collector
+def _collect_cache_stats(data):
+    from backend.cache import get_cache_stats
+
+    stats = get_cache_stats()
+    return [
+        ('love_story_cache_hits_total', (), stats['hits']),
+        ('love_story_cache_misses_total', (), stats['misses']),
+        ('love_story_cache_hit_ratio', (), stats['hit_rate']),
+    ]
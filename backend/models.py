@@ -5,11 +5,13 @@
 恋爱故事记录应用 - 数据库模型
 """
 
+import json
 import logging
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import ForeignKey
 from sqlalchemy.orm import relationship
+from backend.cache import invalidate, register_delete_cascade
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -71,9 +73,26 @@ class Photo(db.Model):
     original_name = db.Column(db.String(255), nullable=False)
     path = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text, nullable=True)
-    date_taken = db.Column(db.Date, nullable=True)
+    date_taken = db.Column(db.Date, nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # 从EXIF中提取的元数据（width为空表示尚未提取）
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    orientation = db.Column(db.Integer, nullable=True)
+    camera_make = db.Column(db.String(100), nullable=True)
+    camera_model = db.Column(db.String(100), nullable=True, index=True)
+    latitude = db.Column(db.Float, nullable=True, index=True)
+    longitude = db.Column(db.Float, nullable=True, index=True)
+    # 动图的帧数（静态图片为1）
+    frame_count = db.Column(db.Integer, nullable=True)
+    # 列表中内联返回的占位图（data URI），为空表示尚未生成
+    placeholder = db.Column(db.String(512), nullable=True)
+    
+    # 存储用量（字节），由上传、删除和缩略图生成维护
+    file_size = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    thumbnail_size = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # 外键关联
     event_id = db.Column(db.Integer, ForeignKey('event.id'), nullable=True)
     album_id = db.Column(db.Integer, ForeignKey('album.id'), nullable=True)
@@ -81,6 +100,9 @@ class Photo(db.Model):
     # 多对多关系 - 照片和标签
     tags = relationship('Tag', secondary='photo_tags', back_populates='photos')
     
+    # 照片列表按(created_at, id)倒序游标分页
+    __table_args__ = (db.Index('ix_photo_created_id', 'created_at', 'id'),)
+    
     def to_dict(self):
         """转换为字典格式"""
         return {
@@ -91,6 +113,15 @@ class Photo(db.Model):
             'description': self.description,
             'date_taken': self.date_taken.strftime('%Y-%m-%d') if self.date_taken else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
+            'width': self.width,
+            'height': self.height,
+            'orientation': self.orientation,
+            'camera_make': self.camera_make,
+            'camera_model': self.camera_model,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'frame_count': self.frame_count,
+            'placeholder': self.placeholder or None,
             'event_id': self.event_id,
             'album_id': self.album_id,
             'tags': [tag.name for tag in self.tags]
@@ -101,6 +132,8 @@ class Tag(db.Model):
     """标签模型"""
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=True)
+    # 使用该标签的照片数量，由photo_tags上的触发器维护
+    usage_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
     
     # 多对多关系 - 标签和照片
     photos = relationship('Photo', secondary='photo_tags', back_populates='tags')
@@ -109,10 +142,41 @@ class Tag(db.Model):
         """转换为字典格式"""
         return {
             'id': self.id,
-            'name': self.name
+            'name': self.name,
+            'usage_count': self.usage_count
         }
 
 
+def parse_config_value(key, value):
+    """
+    解析配置值，JSON格式的配置项返回解析后的对象，其余保持原始字符串
+
+    路由层会缓存解析结果，正常情况下每个配置项在修改后只解析一次
+    """
+    # 尝试将value解析为JSON对象，特别是对于需要结构化数据的配置项
+    # 主要针对carousel_items和其他可能是JSON字符串的配置项
+    json_keys = ['carousel_items', 'values', 'rules']
+    
+    # 首先确保value是字符串类型
+    if not isinstance(value, str):
+        return value
+    
+    clean_value = value.strip()
+    is_json_like = clean_value.startswith('{') or clean_value.startswith('[')
+    
+    # 对于已知的JSON配置项，强制尝试解析
+    if key in json_keys or is_json_like:
+        try:
+            return json.loads(clean_value)
+        except (json.JSONDecodeError, TypeError):
+            # rules和values也允许使用按行分隔的纯文本，只有看起来像JSON却解析失败时才记录警告
+            if is_json_like:
+                logger.warning(f"Failed to parse JSON for config key '{key}': {value}")
+    
+    # 如果不是有效的JSON，保持原始值
+    return value
+
+
 class Config(db.Model):
     """配置信息模型"""
     id = db.Column(db.Integer, primary_key=True)
@@ -124,46 +188,248 @@ class Config(db.Model):
     
     def to_dict(self):
         """转换为字典格式，自动解析JSON格式的value字段"""
-        value = self.value
-        
-        # 尝试将value解析为JSON对象，特别是对于需要结构化数据的配置项
-        # 主要针对carousel_items和其他可能是JSON字符串的配置项
-        # 增强对JSON字符串的检测和解析能力
-        json_keys = ['carousel_items', 'values', 'rules']
-        
-        # 首先确保value是字符串类型
-        if isinstance(value, str):
-            # 对于已知的JSON配置项，强制尝试解析
-            if self.key in json_keys or value.strip().startswith('{') or value.strip().startswith('['):
-                try:
-                    import json
-                    # 处理可能存在的Unicode转义字符和多余空格
-                    clean_value = value.strip()
-                    value = json.loads(clean_value)
-                except (json.JSONDecodeError, TypeError):
-                    # 如果不是有效的JSON，保持原始值
-                    logger.warning(f"Failed to parse JSON for config key '{self.key}': {value}")
-                    pass
-        
         return {
             'id': self.id,
             'key': self.key,
-            'value': value,
+            'value': parse_config_value(self.key, self.value),
             'description': self.description,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
 
+class StorageCounter(db.Model):
+    """存储用量计数器模型
+
+    scope为total/album/event，scope_id为对应的相册或事件ID（total时为0）。
+    """
+    __tablename__ = 'storage_counter'
+    scope = db.Column(db.String(20), primary_key=True)
+    scope_id = db.Column(db.Integer, primary_key=True, default=0)
+    bytes = db.Column(db.Integer, nullable=False, default=0)
+    files = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        """转换为字典格式"""
+        return {
+            'scope': self.scope,
+            'scope_id': self.scope_id,
+            'bytes': self.bytes,
+            'files': self.files,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class Job(db.Model):
+    """后台任务模型
+
+    status为queued/running/succeeded/failed/cancelled/interrupted，
+    params和result以JSON文本保存。运行中的进度保存在内存中，任务结束时写回。
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    params = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    progress_done = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer, nullable=True)
+    message = db.Column(db.String(255), nullable=True)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        """转换为字典格式"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'params': json.loads(self.params) if self.params else None,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'progress': {'done': self.progress_done, 'total': self.progress_total},
+            'message': self.message,
+            'cancel_requested': bool(self.cancel_requested),
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
 # 多对多关系表 - 照片和标签
 photo_tags = db.Table('photo_tags',
     db.Column('photo_id', db.Integer, ForeignKey('photo.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, ForeignKey('tag.id'), primary_key=True)
+    db.Column('tag_id', db.Integer, ForeignKey('tag.id'), primary_key=True),
+    # 主键(photo_id, tag_id)用于按照片查标签，该索引用于按标签查照片（标签查询表达式）
+    db.Index('ix_photo_tags_tag_photo', 'tag_id', 'photo_id')
 )
 
 
+def upgrade_schema():
+    """
+    为已存在的数据库补齐新增的列和索引
+
+    db.create_all()只会创建缺失的表，不会修改已有的表，
+    因此新增的可空列或带默认值的列需要在这里通过ALTER TABLE补齐。
+    """
+    from sqlalchemy import inspect, text
+    
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                if column.server_default is not None:
+                    ddl += f" NOT NULL DEFAULT {column.server_default.arg}"
+                conn.execute(text(ddl))
+                logger.info(f"Added column {table.name}.{column.name}")
+            
+            # 新增的索引同样不会被create_all补建
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+# 照片GPS坐标的R*Tree空间索引（SQLite虚拟表，由触发器与photo表保持同步）
+SPATIAL_INDEX_TABLE = 'photo_geo'
+
+SPATIAL_INDEX_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SPATIAL_INDEX_TABLE}
+        USING rtree(id, min_lat, max_lat, min_lon, max_lon)""",
+    f"""CREATE TRIGGER IF NOT EXISTS photo_geo_insert AFTER INSERT ON photo
+        WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+        BEGIN
+            INSERT OR REPLACE INTO {SPATIAL_INDEX_TABLE}
+            VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS photo_geo_update AFTER UPDATE OF latitude, longitude ON photo
+        BEGIN
+            DELETE FROM {SPATIAL_INDEX_TABLE} WHERE id = OLD.id;
+            INSERT INTO {SPATIAL_INDEX_TABLE}
+            SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS photo_geo_delete AFTER DELETE ON photo
+        BEGIN
+            DELETE FROM {SPATIAL_INDEX_TABLE} WHERE id = OLD.id;
+        END""",
+]
+
+
+def has_spatial_index():
+    """检查数据库中是否存在空间索引（部分SQLite编译版本不包含R*Tree模块）"""
+    from sqlalchemy import text
+    
+    return db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': SPATIAL_INDEX_TABLE}
+    ).first() is not None
+
+
+def init_spatial_index():
+    """创建照片坐标的R*Tree空间索引及同步触发器，首次创建时导入已有坐标"""
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    
+    existed = has_spatial_index()
+    try:
+        for ddl in SPATIAL_INDEX_DDL:
+            db.session.execute(text(ddl))
+        if not existed:
+            db.session.execute(text(
+                f"""INSERT OR REPLACE INTO {SPATIAL_INDEX_TABLE}
+                   SELECT id, latitude, latitude, longitude, longitude FROM photo
+                   WHERE latitude IS NOT NULL AND longitude IS NOT NULL"""
+            ))
+        db.session.commit()
+    except OperationalError as e:
+        # SQLite未启用R*Tree时退回到普通的经纬度索引
+        db.session.rollback()
+        logger.warning(f"R*Tree spatial index unavailable: {e}")
+
+
+# 标签使用次数的维护触发器。INSERT OR IGNORE跳过的重复关联不会触发；
+# 删除照片时一并删除其标签关联（批量删除照片时ORM不会处理关联表）
+TAG_USAGE_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS tag_usage_insert AFTER INSERT ON photo_tags
+        BEGIN
+            UPDATE tag SET usage_count = usage_count + 1 WHERE id = NEW.tag_id;
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS tag_usage_delete AFTER DELETE ON photo_tags
+        BEGIN
+            UPDATE tag SET usage_count = usage_count - 1 WHERE id = OLD.tag_id;
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS photo_tags_cleanup AFTER DELETE ON photo
+        BEGIN
+            DELETE FROM photo_tags WHERE photo_id = OLD.id;
+        END""",
+]
+
+# 删除照片时触发器会删除标签关联并修改标签的使用次数
+register_delete_cascade('photo', 'photo_tags', 'tag')
+
+
+def init_tag_usage_counts():
+    """创建标签使用次数触发器，清理孤立的关联行并重新统计所有标签的使用次数"""
+    from sqlalchemy import text
+    
+    for ddl in TAG_USAGE_DDL:
+        db.session.execute(text(ddl))
+    db.session.execute(text(
+        "DELETE FROM photo_tags WHERE photo_id NOT IN (SELECT id FROM photo) "
+        "OR tag_id NOT IN (SELECT id FROM tag)"
+    ))
+    db.session.execute(text(
+        "UPDATE tag SET usage_count = (SELECT COUNT(*) FROM photo_tags WHERE photo_tags.tag_id = tag.id)"
+    ))
+    db.session.commit()
+
+
+# 数据库结构版本，保存在SQLite的PRAGMA user_version中。
+# 修改模型（新增表、列、索引或触发器）或默认配置时必须递增，否则已有数据库不会执行升级。
+SCHEMA_VERSION = 7
+
+
+def get_schema_version():
+    """读取数据库中记录的结构版本（新数据库为0）"""
+    from sqlalchemy import text
+    
+    return db.session.execute(text('PRAGMA user_version')).scalar() or 0
+
+
+def set_schema_version(version):
+    """记录数据库结构版本"""
+    from sqlalchemy import text
+    
+    db.session.execute(text(f'PRAGMA user_version = {int(version)}'))
+    db.session.commit()
+
+
 def init_db():
-    """初始化数据库"""
+    """
+    初始化数据库
+
+    结构版本与SCHEMA_VERSION一致时跳过建表、升级和默认配置检查，只需一次PRAGMA查询
+    """
+    # 数据库可能被替换（例如恢复备份后重新初始化），丢弃所有缓存的配置
+    invalidate('config')
+    
+    if get_schema_version() == SCHEMA_VERSION:
+        return
+    
     db.create_all()
+    upgrade_schema()
+    init_spatial_index()
+    init_tag_usage_counts()
     
     # 添加默认配置
     default_configs = [
@@ -183,4 +449,6 @@ def init_db():
             config = Config(**config_data)
             db.session.add(config)
     
-    db.session.commit()
\ No newline at end of file
+    db.session.commit()
+    set_schema_version(SCHEMA_VERSION)
+    logger.info(f"Database schema initialized at version {SCHEMA_VERSION}")
\ No newline at end of file
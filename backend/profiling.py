@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""
+恋爱故事记录应用 - SQL性能分析（可选）
+
+通过SQLAlchemy引擎事件记录每个请求执行的SQL数量、总耗时、最慢的几条语句以及
+重复执行的语句（N+1查询的典型特征），并在响应中添加Server-Timing头。
+超过阈值的慢查询连同EXPLAIN QUERY PLAN的结果以JSON行的形式写入慢查询日志。
+
+默认关闭，设置环境变量LOVE_STORY_SQL_PROFILE=1启用。
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import request, g
+from sqlalchemy import event
+
+# 每个请求保留的最慢语句数量
+SLOWEST_PER_REQUEST = 5
+
+# 同一语句在一个请求中执行超过该次数时视为疑似N+1查询
+REPEATED_STATEMENT_THRESHOLD = 10
+
+# 慢查询日志
+slow_query_logger = logging.getLogger('love_story.slow_queries')
+
+_local = threading.local()
+
+# 慢查询阈值（秒）
+_settings = {'slow_query_seconds': 0.1}
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _normalize(statement):
+    """压缩语句中的空白，便于统计和记录"""
+    return _WHITESPACE.sub(' ', statement).strip()
+
+
+def explain_query_plan(conn, statement, parameters):
+    """
+    对SELECT语句执行EXPLAIN QUERY PLAN，返回计划的文字描述列表
+
+    直接使用底层DBAPI游标，不会再次触发引擎事件
+    """
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return []
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ())
+        return [row[-1] for row in cursor.fetchall()]
+    except Exception as e:
+        return [f'EXPLAIN失败: {e}']
+    finally:
+        cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('profile_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+
+    profile = getattr(_local, 'profile', None)
+    if profile is not None:
+        profile['count'] += 1
+        profile['total'] += elapsed
+        normalized = _normalize(statement)
+        profile['statements'][normalized] += 1
+        slowest = profile['slowest']
+        if len(slowest) < SLOWEST_PER_REQUEST or elapsed > slowest[-1][0]:
+            slowest.append((elapsed, normalized))
+            slowest.sort(key=lambda item: item[0], reverse=True)
+            del slowest[SLOWEST_PER_REQUEST:]
+
+    if elapsed >= _settings['slow_query_seconds']:
+        record = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'duration_ms': round(elapsed * 1000, 3),
+            'statement': _normalize(statement),
+            'parameters': None if executemany else [str(p) for p in (parameters or ())],
+            'route': profile['route'] if profile is not None else None,
+            'query_plan': [] if executemany else explain_query_plan(conn, statement, parameters),
+        }
+        slow_query_logger.warning(json.dumps(record, ensure_ascii=False))
+
+
+def _before_request():
+    g.profile_started = time.perf_counter()
+    _local.profile = {
+        'route': f'{request.method} {request.path}',
+        'count': 0,
+        'total': 0.0,
+        'slowest': [],
+        'statements': Counter(),
+    }
+
+
+def _after_request(response):
+    profile = getattr(_local, 'profile', None)
+    _local.profile = None
+    started = g.pop('profile_started', None)
+    if profile is None or started is None:
+        return response
+
+    elapsed = time.perf_counter() - started
+    g.sql_profile = profile
+    timings = [
+        f'db;dur={profile["total"] * 1000:.2f};desc="{profile["count"]} queries"',
+        f'app;dur={elapsed * 1000:.2f}',
+    ]
+    for index, (duration, _) in enumerate(profile['slowest'][:3]):
+        timings.append(f'sql{index + 1};dur={duration * 1000:.2f}')
+    response.headers.add('Server-Timing', ', '.join(timings))
+    response.headers['X-SQL-Query-Count'] = str(profile['count'])
+
+    repeated = [(statement, times) for statement, times in profile['statements'].items()
+                if times >= REPEATED_STATEMENT_THRESHOLD]
+    if repeated:
+        record = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'route': profile['route'],
+            'query_count': profile['count'],
+            'sql_ms': round(profile['total'] * 1000, 3),
+            'repeated_statements': [{'statement': s, 'count': n} for s, n in repeated],
+        }
+        slow_query_logger.warning(json.dumps(record, ensure_ascii=False))
+    return response
+
+
+def init_profiling(app, db, slow_query_ms=100, log_path=None):
+    """
+    注册请求钩子和引擎事件
+
+    参数:
+    - slow_query_ms: 慢查询阈值（毫秒）
+    - log_path: 慢查询日志文件，不指定时写入标准错误
+    """
+    _settings['slow_query_seconds'] = slow_query_ms / 1000.0
+
+    if log_path and not any(getattr(h, 'baseFilename', None) == log_path
+                            for h in slow_query_logger.handlers):
+        handler = logging.FileHandler(log_path, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        slow_query_logger.addHandler(handler)
+        slow_query_logger.propagate = False
+    slow_query_logger.setLevel(logging.WARNING)
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
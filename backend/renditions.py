@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+"""
+恋爱故事记录应用 - 缩略图批量重建与按需生成
+
+批量重建按照片ID顺序分批扫描，找出缺失或比原图旧的缩略图，在进程池中用所有CPU核心并行生成。
+每批完成后把最后处理的照片ID写入检查点文件，中断后再次执行时从检查点继续。
+
+请求时按需生成缩略图和动图预览是单飞的：同一文件同时只有一个线程在生成，其他请求等待后直接使用结果。
+跨进程（批量重建的工作进程、多个服务进程）用文件锁互斥，锁文件按文件名哈希分成固定数量的条带，
+不会随照片数量增长；缩略图本身先写临时文件再原子替换。
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+from backend import metrics
+from backend.models import db, Photo
+from backend.storage import record_rendition_created
+from backend.utils import (
+    create_thumbnail, create_animation_preview, resolve_photo_path, resolve_thumbnail_path,
+    get_animation_path, get_file_size
+)
+
+# 每批扫描的照片数量，也是写检查点的间隔
+REGENERATE_BATCH_SIZE = 200
+
+# 检查点文件名（位于数据目录）
+THUMBNAIL_CHECKPOINT_FILE = 'thumbnail_regeneration.json'
+
+# 单个文件的处理结果
+RENDITION_GENERATED = 'generated'
+RENDITION_CURRENT = 'current'
+RENDITION_MISSING = 'missing'
+RENDITION_FAILED = 'failed'
+
+# 文件锁条带数量，锁文件位于缩略图目录下的.locks目录
+RENDITION_LOCK_STRIPES = 256
+
+# 正在按需生成的缩略图 {文件名: [锁, 等待者数量]}
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _lock_file(f):
+        f.seek(0)
+        while True:
+            try:
+                # LK_LOCK重试约10秒后仍失败会抛出OSError，继续等待
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def rendition_file_lock(upload_folder, filename):
+    """跨进程的缩略图生成锁，同一条带上的文件互斥"""
+    stripe = int(hashlib.md5(filename.encode('utf-8')).hexdigest()[:8], 16) % RENDITION_LOCK_STRIPES
+    lock_dir = os.path.join(upload_folder, 'thumbnails', '.locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    with open(os.path.join(lock_dir, f'{stripe:03d}.lock'), 'a+b') as f:
+        _lock_file(f)
+        try:
+            yield
+        finally:
+            _unlock_file(f)
+
+
+def thumbnail_is_current(upload_folder, filename, original_path):
+    """缩略图存在且不比原图旧"""
+    thumb_path = resolve_thumbnail_path(upload_folder, filename)
+    if not thumb_path:
+        return False
+    try:
+        return os.path.getmtime(thumb_path) >= os.path.getmtime(original_path)
+    except OSError:
+        return False
+
+
+def _render_thumbnail(upload_folder, filename, force):
+    """
+    检查并重新生成单张照片的缩略图（在工作进程中执行）
+
+    返回(文件名, 处理结果, 缩略图大小, 生成耗时)
+    """
+    original_path = resolve_photo_path(upload_folder, filename)
+    if not original_path:
+        return filename, RENDITION_MISSING, 0, 0.0
+    if not force and thumbnail_is_current(upload_folder, filename, original_path):
+        return filename, RENDITION_CURRENT, 0, 0.0
+
+    with rendition_file_lock(upload_folder, f'thumb_{filename}'):
+        # 等锁期间可能已由按需生成的请求写好
+        if not force and thumbnail_is_current(upload_folder, filename, original_path):
+            return filename, RENDITION_CURRENT, 0, 0.0
+        started = time.perf_counter()
+        thumb_path = create_thumbnail(original_path, upload_folder)
+        elapsed = time.perf_counter() - started
+    if not thumb_path:
+        return filename, RENDITION_FAILED, 0, elapsed
+    return filename, RENDITION_GENERATED, get_file_size(thumb_path), elapsed
+
+
+def _load_checkpoint(checkpoint_path, force):
+    """读取检查点，不存在、损坏或参数不同时返回None"""
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return None
+    try:
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get('force') != force:
+        return None
+    return checkpoint
+
+
+def _save_checkpoint(checkpoint_path, checkpoint):
+    """先写临时文件再替换，中断时不会留下半个检查点"""
+    if not checkpoint_path:
+        return
+    temp_path = f"{checkpoint_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_path, checkpoint_path)
+
+
+def regenerate_thumbnails(upload_folder, workers=None, force=False, checkpoint_path=None,
+                          batch_size=REGENERATE_BATCH_SIZE, progress=None):
+    """
+    重新生成缺失或过期的缩略图，需要在应用上下文中调用
+
+    参数:
+    - workers: 进程数，默认使用所有CPU核心；小于等于1时在当前进程中生成
+    - force: 重新生成所有缩略图，而不仅是缺失或比原图旧的
+    - checkpoint_path: 检查点文件，存在时从上次处理到的照片继续，全部完成后删除
+    - progress: 进度回调，参数为(已处理数量, 总数量, 统计信息)
+
+    返回统计信息: 各处理结果的数量、耗时和每秒处理的照片数
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    checkpoint = _load_checkpoint(checkpoint_path, force) or {
+        'force': force, 'last_id': 0, 'processed': 0, 'elapsed': 0.0,
+        'counts': {RENDITION_GENERATED: 0, RENDITION_CURRENT: 0, RENDITION_MISSING: 0, RENDITION_FAILED: 0},
+    }
+    total = db.session.query(Photo.id).count()
+    started = time.perf_counter() - checkpoint['elapsed']
+
+    def stats():
+        elapsed = time.perf_counter() - started
+        return dict(checkpoint['counts'], processed=checkpoint['processed'], total=total,
+                    elapsed=round(elapsed, 3), per_second=round(checkpoint['processed'] / max(elapsed, 1e-6), 1))
+
+    # 在任务线程中fork带锁的进程不安全，工作进程统一用spawn启动
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) \
+        if workers > 1 else None
+    try:
+        while True:
+            batch = db.session.query(Photo.id, Photo.filename) \
+                .filter(Photo.id > checkpoint['last_id']).order_by(Photo.id).limit(batch_size).all()
+            if not batch:
+                break
+
+            filenames = [filename for _, filename in batch]
+            if pool:
+                chunksize = max(1, len(filenames) // (workers * 4))
+                results = list(pool.map(_render_thumbnail, [upload_folder] * len(filenames), filenames,
+                                        [force] * len(filenames), chunksize=chunksize))
+            else:
+                results = [_render_thumbnail(upload_folder, filename, force) for filename in filenames]
+
+            generated = {}
+            for filename, status, size, elapsed in results:
+                checkpoint['counts'][status] += 1
+                if status == RENDITION_GENERATED:
+                    generated[filename] = size
+                    if pool:
+                        # 工作进程中记录的指标不会回到主进程
+                        metrics.observe('love_story_thumbnail_generation_seconds', elapsed)
+
+            if generated:
+                for photo in Photo.query.filter(Photo.filename.in_(list(generated))):
+                    record_rendition_created(photo, generated[photo.filename])
+            db.session.commit()
+
+            checkpoint['last_id'] = batch[-1][0]
+            checkpoint['processed'] += len(batch)
+            checkpoint['elapsed'] = time.perf_counter() - started
+            _save_checkpoint(checkpoint_path, checkpoint)
+            if progress:
+                progress(checkpoint['processed'], total, stats())
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return stats()
+
+
+def _ensure_rendition(key, upload_folder, filename, resolve, create):
+    """
+    单飞地生成一种派生文件：resolve(upload_folder, filename)查找已有文件，create(原图路径, upload_folder)生成
+
+    返回(文件路径, 是否本次新生成)；原图不存在或生成失败时路径为None
+    """
+    path = resolve(upload_folder, filename)
+    if path:
+        return path, False
+
+    with _inflight_lock:
+        entry = _inflight.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0], rendition_file_lock(upload_folder, key):
+            # 等待期间可能已由其他请求或进程生成
+            path = resolve(upload_folder, filename)
+            if path:
+                metrics.inc('love_story_thumbnail_generation_waits_total')
+                return path, False
+            original_path = resolve_photo_path(upload_folder, filename)
+            if not original_path:
+                return None, False
+            path = create(original_path, upload_folder)
+            return path, bool(path)
+    finally:
+        with _inflight_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _inflight[key]
+
+
+def _resolve_animation_path(upload_folder, filename):
+    path = get_animation_path(upload_folder, filename)
+    return path if os.path.isfile(path) else None
+
+
+def ensure_thumbnail(upload_folder, filename):
+    """
+    返回缩略图路径，缺失时生成（同一文件同时只生成一次）
+
+    返回(缩略图路径, 是否本次新生成)；原图不存在或生成失败时路径为None
+    """
+    return _ensure_rendition(f'thumb_{filename}', upload_folder, filename,
+                             resolve_thumbnail_path, create_thumbnail)
+
+
+def ensure_animation_preview(upload_folder, filename):
+    """
+    返回动图预览路径，缺失时生成（同一文件同时只生成一次）
+
+    返回(预览路径, 是否本次新生成)；不是动图、原图不存在或生成失败时路径为None
+    """
+    return _ensure_rendition(f'anim_{filename}', upload_folder, filename,
+                             _resolve_animation_path, create_animation_preview)
@@ -6,20 +6,47 @@
 """
 
 import os
+import time
 import uuid
 import shutil
+import hashlib
 from datetime import datetime, date
 
 # 定义基础目录
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-from flask import request, jsonify, send_from_directory
+from flask import request, jsonify, send_from_directory, Response, stream_with_context
 from werkzeug.utils import secure_filename
-from backend.models import db, Event, Album, Photo, Tag, Config
+from backend.models import db, Event, Album, Photo, Tag, Config, has_spatial_index, SPATIAL_INDEX_TABLE, init_db
 from backend.utils import (
     process_uploaded_photo, allowed_file, generate_unique_filename,
-    delete_photo_files, create_thumbnail, search_photos,
-    ensure_upload_directory_exists, cleanup_old_backups, backup_database
+    delete_photo_files, search_photos,
+    ensure_upload_directory_exists, cleanup_old_backups, backup_database,
+    resolve_photo_path, get_file_size, apply_photo_metadata,
+    save_uploaded_file, process_saved_photo, cleanup_orphaned_photos, copy_sqlite_database
 )
+from sqlalchemy import func, text
+from backend.cache import get_or_build, invalidate_all
+from backend.serializers import (
+    project_photos, photo_row_to_dict, project_events, event_rows_to_dicts, stream_json,
+    encode_photo_cursor, decode_photo_cursor, photo_page, iter_photo_pages, MAX_PAGE_SIZE
+)
+from backend.tags import (
+    get_or_create_tags, normalize_tag_names, existing_photo_ids,
+    add_tags_to_photos, remove_tags_from_photos, suggest_tags, tag_cloud,
+    parse_tag_query, tag_query_filter, IN_CHUNK_SIZE
+)
+from backend.storage import (
+    record_photo_added, record_photo_removed, record_photos_removed, record_photo_moved,
+    remove_storage_scope, get_storage_stats, enqueue_file_deletions, enqueue_rendition_size,
+    SCOPE_ALBUM, SCOPE_EVENT
+)
+from backend.bulk import BULK_OPERATIONS, move_photos, set_photos_date, delete_photos
+from backend.jobs import (
+    job_handler, submit_job, get_job, list_jobs, cancel_job, job_version, wait_for_job_change,
+    recover_jobs, JobCancelled, FINISHED_STATES
+)
+from backend.imaging import ImageRejected
+from backend.renditions import ensure_thumbnail, ensure_animation_preview, regenerate_thumbnails, THUMBNAIL_CHECKPOINT_FILE
 
 
 def setup_routes(app):
@@ -31,18 +58,20 @@ def setup_routes(app):
                filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
     
     # 辅助函数：生成照片URL
-    def build_photo_url(photo_filename, is_thumbnail=False):
+    def build_photo_url(photo_filename, is_thumbnail=False, is_animation=False):
         if is_thumbnail:
             return f"/api/uploads/thumbnails/thumb_{photo_filename}"
+        if is_animation:
+            return f"/api/uploads/thumbnails/anim_{photo_filename}"
         return f"/api/uploads/{photo_filename}"
     
-    # 辅助函数：获取或创建标签
-    def get_or_create_tag(tag_name):
-        tag = Tag.query.filter_by(name=tag_name).first()
-        if not tag:
-            tag = Tag(name=tag_name)
-            db.session.add(tag)
-        return tag
+    def add_photo_urls(photo_dict):
+        """为照片字典添加原图、缩略图和动图预览的URL"""
+        photo_dict['url'] = build_photo_url(photo_dict['filename'])
+        photo_dict['thumbnail_url'] = build_photo_url(photo_dict['filename'], is_thumbnail=True)
+        if (photo_dict.get('frame_count') or 1) > 1:
+            photo_dict['animation_url'] = build_photo_url(photo_dict['filename'], is_animation=True)
+        return photo_dict
     
     # ===== 事件相关API =====
     
@@ -79,11 +108,11 @@ def setup_routes(app):
         
         # 限制返回数量
         if limit:
-            events = query.limit(limit).all()
-        else:
-            events = query.all()
-            
-        return jsonify([event.to_dict() for event in events])
+            query = query.limit(limit)
+        
+        # 列元组投影，不构造ORM对象
+        rows = project_events(query).all()
+        return jsonify(event_rows_to_dicts(rows, build_photo_url))
     
     @app.route('/api/events/<int:event_id>', methods=['GET'])
     def get_event(event_id):
@@ -130,24 +159,36 @@ def setup_routes(app):
         """删除事件"""
         event = Event.query.get_or_404(event_id)
         try:
-            # 删除关联的照片文件
-            for photo in event.photos:
-                photo_path = os.path.join(app.config['UPLOAD_FOLDER'], photo.filename)
-                if os.path.exists(photo_path):
-                    os.remove(photo_path)
+            photo_ids = [photo.id for photo in event.photos]
+            filenames = [photo.filename for photo in event.photos]
+            for start in range(0, len(photo_ids), IN_CHUNK_SIZE):
+                record_photos_removed(photo_ids[start:start + IN_CHUNK_SIZE])
             
             db.session.delete(event)
+            remove_storage_scope(SCOPE_EVENT, event_id)
             db.session.commit()
+            
+            # 提交后由后台线程删除关联的照片文件（包括缩略图）
+            enqueue_file_deletions(app.config['UPLOAD_FOLDER'], filenames)
             return jsonify({'message': '事件已删除'}), 200
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 400
     
     # ===== 照片相关API =====
+    
+    # 流式输出时每次从数据库读取的行数
+    STREAM_BATCH_SIZE = 500
 
     @app.route('/api/photos', methods=['GET'])
     def get_photos():
-        """获取所有照片列表"""
+        """
+        获取照片列表
+        
+        带limit参数时按游标分页：响应头X-Next-Cursor是下一页的游标（没有更多照片时不返回），
+        把它作为cursor参数请求下一页；第一页的X-Total-Count是符合条件的照片总数。
+        流式模式同样支持limit和cursor
+        """
         # 获取查询参数
         album_id = request.args.get('album_id', type=int)
         event_id = request.args.get('event_id', type=int)
@@ -156,6 +197,12 @@ def setup_routes(app):
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
+        # 标签查询表达式，例如 tag_query=海边 AND 日落 NOT 2019
+        try:
+            tag_tree = parse_tag_query(request.args.get('tag_query'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         query = Photo.query
         
         # 按相册筛选
@@ -170,6 +217,9 @@ def setup_routes(app):
         if tag:
             query = query.join(Photo.tags).filter(Tag.name == tag)
         
+        if tag_tree:
+            query = query.filter(tag_query_filter(tag_tree))
+        
         # 按日期范围筛选
         if start_date:
             try:
@@ -195,33 +245,56 @@ def setup_routes(app):
                 (Tag.name.like(search_pattern))
             ).distinct()
         
-        # 按日期降序排序
-        photos = query.order_by(Photo.created_at.desc()).all()
+        # 游标分页
+        limit = request.args.get('limit', type=int)
+        position = None
+        if request.args.get('cursor'):
+            try:
+                position = decode_photo_cursor(request.args['cursor'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        # 流式模式：逐批读取并边序列化边输出，内存占用与照片总数无关
+        ndjson = request.accept_mimetypes.best_match(
+            ['application/json', 'application/x-ndjson']
+        ) == 'application/x-ndjson'
+        stream = ndjson or request.args.get('stream', type=int) == 1
         
-        # 转换为包含URL的字典列表
-        result = []
-        for photo in photos:
-            photo_dict = photo.to_dict()
-            photo_dict['url'] = build_photo_url(photo.filename)
-            photo_dict['thumbnail_url'] = build_photo_url(photo.filename, is_thumbnail=True)
-            
-            # 添加相关的相册和事件信息
-            if photo.album:
-                photo_dict['album_info'] = {'id': photo.album.id, 'name': photo.album.name}
-            if photo.event:
-                photo_dict['event_info'] = {'id': photo.event.id, 'title': photo.event.title, 'date': photo.event.date.isoformat() if photo.event.date else None}
-                
-            result.append(photo_dict)
+        def to_dict(row):
+            return photo_row_to_dict(row, build_photo_url)
         
-        return jsonify(result)
+        # 按日期降序排序（id保证顺序稳定），使用列元组投影一次取回照片、标签、相册和事件信息
+        if not limit:
+            if stream:
+                return Response(
+                    stream_with_context(stream_json(iter_photo_pages(query, position, STREAM_BATCH_SIZE),
+                                                    to_dict, ndjson)),
+                    mimetype='application/x-ndjson' if ndjson else 'application/json'
+                )
+            
+            # 转换为包含URL的字典列表
+            return jsonify([to_dict(row) for row in photo_page(query, position)])
+        
+        # 多取一行判断是否还有下一页
+        limit = min(max(limit, 1), MAX_PAGE_SIZE)
+        rows = photo_page(query, position, limit + 1)
+        if stream:
+            response = Response(stream_json(rows[:limit], to_dict, ndjson),
+                                mimetype='application/x-ndjson' if ndjson else 'application/json')
+        else:
+            response = jsonify([to_dict(row) for row in rows[:limit]])
+        if len(rows) > limit:
+            response.headers['X-Next-Cursor'] = encode_photo_cursor(rows[limit - 1])
+        if not position:
+            response.headers['X-Total-Count'] = str(query.order_by(None).count())
+        return response
     
     @app.route('/api/photos/<int:photo_id>', methods=['GET'])
     def get_photo(photo_id):
         """获取单个照片详情"""
         photo = Photo.query.get_or_404(photo_id)
         photo_dict = photo.to_dict()
-        photo_dict['url'] = build_photo_url(photo.filename)
-        photo_dict['thumbnail_url'] = build_photo_url(photo.filename, is_thumbnail=True)
+        add_photo_urls(photo_dict)
         
         # 添加相关的相册和事件信息
         if photo.album:
@@ -261,34 +334,37 @@ def setup_routes(app):
                 path=result['filename'],  # 存储相对路径
                 description=request.form.get('description', ''),
                 event_id=request.form.get('event_id', type=int),
-                album_id=request.form.get('album_id', type=int)
+                album_id=request.form.get('album_id', type=int),
+                file_size=result['file_size'],
+                thumbnail_size=result['thumbnail_size'],
+                placeholder=result['placeholder']
             )
             
-            # 处理日期
+            # 处理日期（用户填写的日期优先于EXIF中的拍摄日期）
             if request.form.get('date_taken'):
                 try:
                     photo.date_taken = datetime.strptime(request.form['date_taken'], '%Y-%m-%d').date()
                 except ValueError:
                     pass
+            apply_photo_metadata(photo, result['metadata'])
             
             # 处理标签
             tags_str = request.form.get('tags', '')
             if tags_str:
-                tags = [tag.strip() for tag in tags_str.split(',') if tag.strip()]
-                for tag_name in tags:
-                    tag = get_or_create_tag(tag_name)
-                    photo.tags.append(tag)
+                photo.tags = get_or_create_tags(tags_str.split(','))
             
             db.session.add(photo)
+            record_photo_added(photo)
             db.session.commit()
             
             # 返回包含URL的照片信息
             photo_dict = photo.to_dict()
-            photo_dict['url'] = build_photo_url(photo.filename)
-            photo_dict['thumbnail_url'] = build_photo_url(photo.filename, is_thumbnail=True)
+            add_photo_urls(photo_dict)
             
             return jsonify(photo_dict), 201
             
+        except ImageRejected as e:
+            return jsonify({'error': str(e), 'reason': e.reason}), 400
         except Exception as e:
             db.session.rollback()
             # 如果有文件名，尝试删除已上传的文件
@@ -296,9 +372,71 @@ def setup_routes(app):
                 delete_photo_files(result['filename'], upload_folder)
             return jsonify({'error': str(e)}), 500
     
+    def add_uploaded_photo(filename, original_filename, event_id=None, album_id=None):
+        """为已保存的原图提取元数据、生成缩略图并创建照片记录（不提交），返回照片信息"""
+        upload_folder = app.config['UPLOAD_FOLDER']
+        try:
+            result = process_saved_photo(filename, original_filename, upload_folder)
+        except Exception:
+            delete_photo_files(filename, upload_folder)
+            raise
+        
+        # 创建照片记录
+        photo = Photo(
+            filename=result['filename'],
+            original_name=result['original_name'],
+            path=result['filename'],  # 存储相对路径
+            description='',  # 批量上传时不设置描述
+            event_id=event_id,
+            album_id=album_id,
+            file_size=result['file_size'],
+            thumbnail_size=result['thumbnail_size'],
+            placeholder=result['placeholder']
+        )
+        apply_photo_metadata(photo, result['metadata'])
+        
+        db.session.add(photo)
+        record_photo_added(photo)
+        
+        photo_dict = photo.to_dict()
+        add_photo_urls(photo_dict)
+        return photo_dict
+    
+    def batch_upload_response(uploaded_photos, errors):
+        response = {
+            'message': '批量上传完成',
+            'success_count': len(uploaded_photos),
+            'error_count': len(errors),
+            'photos': uploaded_photos
+        }
+        if errors:
+            response['errors'] = errors
+        return response
+    
+    @job_handler('batch_upload')
+    def batch_upload_job(job, files, event_id=None, album_id=None, errors=None):
+        """处理请求中已保存的原图；取消时删除本次上传的所有文件"""
+        errors = list(errors or [])
+        uploaded_photos = []
+        try:
+            for index, item in enumerate(files):
+                job.progress(index, len(files), item['original_name'])
+                try:
+                    uploaded_photos.append(add_uploaded_photo(item['filename'], item['original_name'], event_id, album_id))
+                except Exception as e:
+                    errors.append({'filename': item['original_name'], 'error': str(e)})
+            job.progress(len(files), len(files))
+            db.session.commit()
+        except JobCancelled:
+            db.session.rollback()
+            for item in files:
+                delete_photo_files(item['filename'], app.config['UPLOAD_FOLDER'])
+            raise
+        return batch_upload_response(uploaded_photos, errors)
+    
     @app.route('/api/photos/batch', methods=['POST'])
     def batch_upload_photos():
-        """批量上传照片"""
+        """批量上传照片（async=1时只在请求中保存原图，缩略图和元数据由后台任务处理）"""
         if 'files' not in request.files:
             return jsonify({'error': '没有文件上传'}), 400
         
@@ -306,6 +444,10 @@ def setup_routes(app):
         if not files or all(file.filename == '' for file in files):
             return jsonify({'error': '没有选择文件'}), 400
         
+        event_id = request.form.get('event_id', type=int)
+        album_id = request.form.get('album_id', type=int)
+        run_async = wants_async()
+        saved = []
         uploaded_photos = []
         errors = []
         
@@ -324,44 +466,26 @@ def setup_routes(app):
                     continue
                 
                 try:
-                    # 处理上传的照片
+                    # 保存原图
                     original_filename = secure_filename(file.filename)
-                    result = process_uploaded_photo(file, original_filename, upload_folder)
-                    
-                    # 创建照片记录
-                    photo = Photo(
-                        filename=result['filename'],
-                        original_name=result['original_name'],
-                        path=result['filename'],  # 存储相对路径
-                        description='',  # 批量上传时不设置描述
-                        event_id=request.form.get('event_id', type=int),
-                        album_id=request.form.get('album_id', type=int)
-                    )
-                    
-                    db.session.add(photo)
-                    
-                    # 添加到上传成功列表
-                    photo_dict = photo.to_dict()
-                    photo_dict['url'] = build_photo_url(photo.filename)
-                    photo_dict['thumbnail_url'] = build_photo_url(photo.filename, is_thumbnail=True)
-                    uploaded_photos.append(photo_dict)
-                    
+                    filename = save_uploaded_file(file, original_filename, upload_folder)
+                    saved.append({'filename': filename, 'original_name': original_filename})
+                    if not run_async:
+                        uploaded_photos.append(add_uploaded_photo(filename, original_filename, event_id, album_id))
                 except Exception as e:
                     errors.append({'filename': file.filename, 'error': str(e)})
             
+            if run_async:
+                return job_accepted(submit_job('batch_upload', {
+                    'files': saved, 'event_id': event_id, 'album_id': album_id, 'errors': errors
+                }))
+            
             # 提交数据库事务
             if uploaded_photos:
                 db.session.commit()
             
-            response = {
-                'message': '批量上传完成',
-                'success_count': len(uploaded_photos),
-                'error_count': len(errors),
-                'photos': uploaded_photos
-            }
-            
+            response = batch_upload_response(uploaded_photos, errors)
             if errors:
-                response['errors'] = errors
                 return jsonify(response), 207  # 207 Multi-Status
             
             return jsonify(response), 201
@@ -370,8 +494,8 @@ def setup_routes(app):
             db.session.rollback()
             # 清理已上传的文件
             upload_folder = app.config['UPLOAD_FOLDER']
-            for photo in uploaded_photos:
-                delete_photo_files(photo['filename'], upload_folder)
+            for item in saved:
+                delete_photo_files(item['filename'], upload_folder)
             return jsonify({'error': str(e)}), 500
     
     @app.route('/api/photos/search', methods=['GET'])
@@ -384,6 +508,11 @@ def setup_routes(app):
         album_id = request.args.get('album_id', type=int)
         event_id = request.args.get('event_id', type=int)
         
+        try:
+            tag_tree = parse_tag_query(request.args.get('tag_query'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # 处理日期范围
         parsed_date_from = None
         parsed_date_to = None
@@ -403,40 +532,108 @@ def setup_routes(app):
         # 执行搜索
         try:
             # 注意：这里需要将db对象传递给search_photos函数
-            photos = search_photos(
+            photo_query = search_photos(
                 db=db,
                 query=query,
                 date_from=parsed_date_from,
                 date_to=parsed_date_to,
                 tags=tags,
                 album_id=album_id,
-                event_id=event_id
+                event_id=event_id,
+                tag_query=tag_tree,
+                as_query=True
             )
             
             # 转换为包含URL的字典列表
-            result = []
-            for photo in photos:
-                photo_dict = photo.to_dict()
-                photo_dict['url'] = build_photo_url(photo.filename)
-                photo_dict['thumbnail_url'] = build_photo_url(photo.filename, is_thumbnail=True)
-                
-                # 添加相关信息
-                if photo.album:
-                    photo_dict['album_info'] = {'id': photo.album.id, 'name': photo.album.name}
-                if photo.event:
-                    photo_dict['event_info'] = {'id': photo.event.id, 'title': photo.event.title, 'date': photo.event.date.isoformat() if photo.event.date else None}
-                
-                result.append(photo_dict)
-            
-            return jsonify(result)
+            rows = project_photos(photo_query).all()
+            return jsonify([photo_row_to_dict(row, build_photo_url) for row in rows])
         except Exception as e:
             return jsonify({'error': '搜索失败: ' + str(e)}), 500
     
+    # 地图聚合：缩放级别为z时，每个256像素瓦片划分为GEO_CELLS_PER_TILE x GEO_CELLS_PER_TILE个网格
+    GEO_CELLS_PER_TILE = 4
+    GEO_MAX_ZOOM = 20
+    
+    def query_geo_clusters(south, west, north, east, cell):
+        """在一个不跨越180度经线的范围内按网格聚合照片坐标"""
+        if has_spatial_index():
+            # R*Tree虚拟表，范围查询只访问与边界框相交的节点。R*Tree按float32向外取整保存边界，
+            # 使用相交条件而不是包含条件，恰好在边界上的照片与没有空间索引时的BETWEEN结果一致
+            source = SPATIAL_INDEX_TABLE
+            lat, lon = 'min_lat', 'min_lon'
+            bbox_filter = 'max_lat >= :south AND min_lat <= :north AND max_lon >= :west AND min_lon <= :east'
+        else:
+            source = 'photo'
+            lat, lon = 'latitude', 'longitude'
+            bbox_filter = 'latitude BETWEEN :south AND :north AND longitude BETWEEN :west AND :east'
+        
+        # 网格以(-90, -180)为原点，平移地图时同一位置的聚合结果保持稳定
+        sql = text(f"""
+            SELECT CAST(({lat} + 90.0) / :cell AS INTEGER) AS gy,
+                   CAST(({lon} + 180.0) / :cell AS INTEGER) AS gx,
+                   COUNT(*), AVG({lat}), AVG({lon}), MAX(id)
+            FROM {source}
+            WHERE {bbox_filter}
+            GROUP BY gy, gx
+        """)
+        return db.session.execute(sql, {
+            'south': south, 'north': north, 'west': west, 'east': east, 'cell': cell
+        }).fetchall()
+    
+    @app.route('/api/photos/geo', methods=['GET'])
+    def get_photo_clusters():
+        """获取地图范围内聚合后的照片位置"""
+        bbox = request.args.get('bbox', '-180,-90,180,90')
+        zoom = request.args.get('zoom', 2, type=int)
+        
+        try:
+            west, south, east, north = (float(value) for value in bbox.split(','))
+        except ValueError:
+            return jsonify({'error': 'bbox参数格式应为 west,south,east,north'}), 400
+        if not (-90 <= south <= north <= 90) or not (-180 <= west <= 180 and -180 <= east <= 180):
+            return jsonify({'error': '无效的边界范围'}), 400
+        zoom = max(0, min(zoom, GEO_MAX_ZOOM))
+        cell = 360.0 / (2 ** zoom * GEO_CELLS_PER_TILE)
+        
+        try:
+            # 跨越180度经线的范围拆成两段查询
+            if west <= east:
+                rows = query_geo_clusters(south, west, north, east, cell)
+            else:
+                rows = query_geo_clusters(south, west, north, 180.0, cell) + \
+                    query_geo_clusters(south, -180.0, north, east, cell)
+            
+            cover_ids = [row[5] for row in rows]
+            filenames = dict(
+                db.session.query(Photo.id, Photo.filename).filter(Photo.id.in_(cover_ids))
+            ) if cover_ids else {}
+            
+            clusters = []
+            for _, _, count, lat, lon, cover_id in rows:
+                clusters.append({
+                    'lat': round(lat, 6),
+                    'lon': round(lon, 6),
+                    'count': count,
+                    'photo_id': cover_id,
+                    'thumbnail_url': build_photo_url(filenames[cover_id], is_thumbnail=True)
+                    if cover_id in filenames else None
+                })
+            
+            return jsonify({
+                'zoom': zoom,
+                'cell_size': cell,
+                'total': sum(cluster['count'] for cluster in clusters),
+                'clusters': clusters
+            })
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
     @app.route('/api/photos/<int:photo_id>', methods=['PUT'])
     def update_photo(photo_id):
         """更新照片信息"""
         photo = Photo.query.get_or_404(photo_id)
         data = request.json
+        old_album_id, old_event_id = photo.album_id, photo.event_id
         try:
             # 更新描述
             if data.get('description') is not None:
@@ -457,19 +654,16 @@ def setup_routes(app):
             
             # 更新标签
             if 'tags' in data:
-                photo.tags = []
-                if data['tags']:
-                    for tag_name in data['tags']:
-                        if tag_name and isinstance(tag_name, str):
-                            tag = get_or_create_tag(tag_name.strip())
-                            photo.tags.append(tag)
+                photo.tags = get_or_create_tags(data['tags'])
+            
+            # 照片移动到其他相册或事件时同步存储用量
+            record_photo_moved(photo, old_album_id, old_event_id)
             
             db.session.commit()
             
             # 返回包含URL的照片信息
             photo_dict = photo.to_dict()
-            photo_dict['url'] = build_photo_url(photo.filename)
-            photo_dict['thumbnail_url'] = build_photo_url(photo.filename, is_thumbnail=True)
+            add_photo_urls(photo_dict)
             
             return jsonify(photo_dict)
         except Exception as e:
@@ -484,6 +678,7 @@ def setup_routes(app):
         
         try:
             # 从数据库中删除
+            record_photo_removed(photo)
             db.session.delete(photo)
             db.session.commit()
             
@@ -495,6 +690,74 @@ def setup_routes(app):
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
     
+    # 一次批量操作请求中照片ID的数量上限
+    MAX_BULK_PHOTOS = 10000
+    
+    @app.route('/api/photos/bulk', methods=['POST'])
+    def bulk_photos():
+        """
+        批量移动、修改日期或删除照片
+        
+        请求体: {"photo_ids": [1, 2, ...], "operation": "set_album", "album_id": 3}
+        operation为set_album（album_id，null表示移出相册）、set_event（event_id）、
+        set_date（date_taken，YYYY-MM-DD）或delete。所有修改在同一个事务中完成，
+        删除的照片文件在提交后由后台线程清理
+        """
+        data = request.json or {}
+        photo_ids = data.get('photo_ids')
+        operation = data.get('operation')
+        if not isinstance(photo_ids, list) or not photo_ids:
+            return jsonify({'error': 'photo_ids必须是非空的照片ID列表'}), 400
+        if len(photo_ids) > MAX_BULK_PHOTOS:
+            return jsonify({'error': f'每次最多处理{MAX_BULK_PHOTOS}张照片'}), 400
+        if operation not in BULK_OPERATIONS:
+            return jsonify({'error': f"operation必须是{'、'.join(BULK_OPERATIONS)}之一"}), 400
+        
+        # 先校验目标，避免执行到一半才失败
+        target_id = None
+        date_taken = None
+        if operation == 'set_album':
+            target_id = data.get('album_id')
+            if target_id is not None and not db.session.get(Album, target_id):
+                return jsonify({'error': '相册不存在'}), 404
+        elif operation == 'set_event':
+            target_id = data.get('event_id')
+            if target_id is not None and not db.session.get(Event, target_id):
+                return jsonify({'error': '事件不存在'}), 404
+        elif operation == 'set_date':
+            try:
+                date_taken = datetime.strptime(str(data.get('date_taken')), '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({'error': '无效的日期格式，请使用YYYY-MM-DD格式'}), 400
+        
+        filenames = []
+        try:
+            ids = existing_photo_ids(photo_ids)
+            found = set(ids)
+            if operation == 'set_album':
+                affected = move_photos(ids, SCOPE_ALBUM, target_id)
+            elif operation == 'set_event':
+                affected = move_photos(ids, SCOPE_EVENT, target_id)
+            elif operation == 'set_date':
+                affected = set_photos_date(ids, date_taken)
+            else:
+                filenames = delete_photos(ids)
+                affected = len(filenames)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+        
+        # 数据库提交成功后再删除文件
+        if filenames:
+            enqueue_file_deletions(app.config['UPLOAD_FOLDER'], filenames)
+        
+        return jsonify({
+            'operation': operation,
+            'photo_count': affected,
+            'missing_photo_ids': [photo_id for photo_id in photo_ids if photo_id not in found]
+        })
+    
     @app.route('/api/uploads/<filename>')
     def serve_photo(filename):
         """提供照片文件访问"""
@@ -502,12 +765,12 @@ def setup_routes(app):
         if '..' in filename or filename.startswith('/'):
             return jsonify({'error': '无效的文件路径'}), 400
         
-        # 检查文件是否存在
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        if not os.path.exists(filepath):
+        # 查找文件实际位置（分片布局或旧版平铺布局）
+        filepath = resolve_photo_path(app.config['UPLOAD_FOLDER'], filename)
+        if not filepath:
             return jsonify({'error': '文件不存在'}), 404
         
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        return send_from_directory(os.path.dirname(filepath), filename)
     
     @app.route('/api/uploads/thumbnails/<filename>')
     def serve_thumbnail(filename):
@@ -516,21 +779,35 @@ def setup_routes(app):
         if '..' in filename or filename.startswith('/'):
             return jsonify({'error': '无效的文件路径'}), 400
         
-        # 检查缩略图是否存在
-        thumb_path = os.path.join(app.config['THUMBNAILS_FOLDER'], filename)
-        if not os.path.exists(thumb_path):
-            # 如果缩略图不存在，尝试创建
-            original_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            if os.path.exists(original_path):
-                try:
-                    create_thumbnail(original_path, thumb_path)
-                except Exception:
-                    # 如果创建失败，返回原始图片
-                    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-            else:
+        upload_folder = app.config['UPLOAD_FOLDER']
+        
+        # 动图预览文件名为anim_加原图文件名，不是动图或生成失败时返回原图
+        if filename.startswith('anim_'):
+            original_filename = filename[5:]
+            preview_path, _ = ensure_animation_preview(upload_folder, original_filename)
+            if not preview_path:
+                preview_path = resolve_photo_path(upload_folder, original_filename)
+                if not preview_path:
+                    return jsonify({'error': '文件不存在'}), 404
+            return send_from_directory(os.path.dirname(preview_path), os.path.basename(preview_path))
+        
+        # 缩略图文件名为thumb_加原图文件名
+        original_filename = filename[6:] if filename.startswith('thumb_') else filename
+        
+        # 缩略图不存在时生成（同一文件同时只生成一次）
+        thumb_path, created = ensure_thumbnail(upload_folder, original_filename)
+        if not thumb_path:
+            original_path = resolve_photo_path(upload_folder, original_filename)
+            if not original_path:
                 return jsonify({'error': '文件不存在'}), 404
+            # 如果创建失败，返回原始图片
+            return send_from_directory(os.path.dirname(original_path), original_filename)
+        
+        if created:
+            # 新生成的缩略图占用的空间由后台线程批量记录
+            enqueue_rendition_size(app, original_filename, get_file_size(thumb_path))
         
-        return send_from_directory(app.config['THUMBNAILS_FOLDER'], filename)
+        return send_from_directory(os.path.dirname(thumb_path), os.path.basename(thumb_path))
     
     # ===== 相册相关API =====
     
@@ -573,14 +850,17 @@ def setup_routes(app):
         """删除相册"""
         album = Album.query.get_or_404(album_id)
         try:
-            # 删除关联的照片文件
-            for photo in album.photos:
-                photo_path = os.path.join(app.config['UPLOAD_FOLDER'], photo.filename)
-                if os.path.exists(photo_path):
-                    os.remove(photo_path)
+            photo_ids = [photo.id for photo in album.photos]
+            filenames = [photo.filename for photo in album.photos]
+            for start in range(0, len(photo_ids), IN_CHUNK_SIZE):
+                record_photos_removed(photo_ids[start:start + IN_CHUNK_SIZE])
             
             db.session.delete(album)
+            remove_storage_scope(SCOPE_ALBUM, album_id)
             db.session.commit()
+            
+            # 提交后由后台线程删除关联的照片文件（包括缩略图）
+            enqueue_file_deletions(app.config['UPLOAD_FOLDER'], filenames)
             return jsonify({'message': '相册已删除'}), 200
         except Exception as e:
             db.session.rollback()
@@ -590,40 +870,203 @@ def setup_routes(app):
     
     @app.route('/api/tags', methods=['GET'])
     def get_tags():
-        """获取所有标签列表"""
-        tags = Tag.query.all()
-        return jsonify([tag.to_dict() for tag in tags])
+        """获取所有标签列表（sort=usage时按使用次数从高到低排序）"""
+        query = Tag.query
+        if request.args.get('sort') == 'usage':
+            query = query.order_by(Tag.usage_count.desc(), Tag.name)
+        return jsonify([tag.to_dict() for tag in query.all()])
+    
+    @app.route('/api/tags/suggest', methods=['GET'])
+    def suggest_tags_route():
+        """按前缀联想标签，返回使用次数最多的若干个"""
+        prefix = request.args.get('prefix', '').strip()
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+        return jsonify(suggest_tags(prefix, limit))
+    
+    @app.route('/api/tags/cloud', methods=['GET'])
+    def tag_cloud_route():
+        """标签云：使用次数最多的标签及其权重等级（1-5）"""
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        return jsonify(tag_cloud(limit))
+    
+    # 一次批量打标签请求中标签名的数量上限
+    MAX_BULK_TAGS = 100
+    
+    @app.route('/api/photos/tags', methods=['POST'])
+    def bulk_tag_photos():
+        """
+        批量给照片添加或移除标签
+
+        请求体: {"photo_ids": [1, 2, ...], "add": ["旅行"], "remove": ["草稿"]}
+        所有修改在同一个事务中完成
+        """
+        data = request.json or {}
+        photo_ids = data.get('photo_ids')
+        if not isinstance(photo_ids, list) or not photo_ids:
+            return jsonify({'error': 'photo_ids必须是非空的照片ID列表'}), 400
+        
+        add_names = normalize_tag_names(data.get('add'))
+        remove_names = normalize_tag_names(data.get('remove'))
+        if not add_names and not remove_names:
+            return jsonify({'error': '请提供要添加（add）或移除（remove）的标签'}), 400
+        if len(add_names) > MAX_BULK_TAGS or len(remove_names) > MAX_BULK_TAGS:
+            return jsonify({'error': f'每次最多处理{MAX_BULK_TAGS}个标签'}), 400
+        
+        try:
+            ids = existing_photo_ids(photo_ids)
+            found = set(ids)
+            removed = remove_tags_from_photos(ids, remove_names)
+            added = add_tags_to_photos(ids, add_names)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+        
+        return jsonify({
+            'photo_count': len(ids),
+            'missing_photo_ids': [photo_id for photo_id in photo_ids if photo_id not in found],
+            'added': added,
+            'removed': removed
+        })
+    
+    # ===== 时间轴API =====
+    
+    # 各缩放级别对应的SQLite日期格式
+    TIMELINE_FORMATS = {'year': '%Y', 'month': '%Y-%m', 'day': '%Y-%m-%d'}
+    
+    def build_timeline(zoom, kind, year, month):
+        """按年/月/日聚合事件和照片数量，并为每个时间段挑选一张封面缩略图"""
+        fmt = TIMELINE_FORMATS[zoom]
+        buckets = {}
+        
+        def bucket(period):
+            return buckets.setdefault(period, {
+                'period': period, 'event_count': 0, 'photo_count': 0,
+                'cover_photo_id': None, 'cover_thumbnail_url': None
+            })
+        
+        # 下钻时只统计指定年份或月份
+        prefix = None
+        if year:
+            prefix = f"{year:04d}-{month:02d}" if month else f"{year:04d}"
+        
+        if kind in ('all', 'events'):
+            period = func.strftime(fmt, Event.date)
+            query = db.session.query(period, func.count(Event.id)).filter(Event.date.isnot(None))
+            if prefix:
+                query = query.filter(func.strftime(TIMELINE_FORMATS['month' if month else 'year'], Event.date) == prefix)
+            for key, count in query.group_by(period):
+                bucket(key)['event_count'] = count
+        
+        undated_photos = 0
+        if kind in ('all', 'photos'):
+            period = func.strftime(fmt, Photo.date_taken)
+            # 每个时间段中最新上传的照片作为封面
+            query = db.session.query(period, func.count(Photo.id), func.max(Photo.id)) \
+                .filter(Photo.date_taken.isnot(None))
+            if prefix:
+                query = query.filter(func.strftime(TIMELINE_FORMATS['month' if month else 'year'], Photo.date_taken) == prefix)
+            covers = {}
+            for key, count, cover_id in query.group_by(period):
+                item = bucket(key)
+                item['photo_count'] = count
+                item['cover_photo_id'] = cover_id
+                covers[cover_id] = item
+            
+            if covers:
+                for photo_id, filename in db.session.query(Photo.id, Photo.filename).filter(Photo.id.in_(list(covers))):
+                    covers[photo_id]['cover_thumbnail_url'] = build_photo_url(filename, is_thumbnail=True)
+            
+            if not prefix:
+                undated_photos = db.session.query(func.count(Photo.id)).filter(Photo.date_taken.is_(None)).scalar()
+        
+        return {
+            'zoom': zoom,
+            'type': kind,
+            'buckets': [buckets[key] for key in sorted(buckets, reverse=True)],
+            'undated_photos': undated_photos
+        }
+    
+    @app.route('/api/timeline', methods=['GET'])
+    def get_timeline():
+        """获取按年/月/日聚合的时间轴数据"""
+        zoom = request.args.get('zoom', 'month')
+        kind = request.args.get('type', 'all')
+        year = request.args.get('year', type=int)
+        month = request.args.get('month', type=int)
+        
+        if zoom not in TIMELINE_FORMATS:
+            return jsonify({'error': 'zoom参数应为year、month或day'}), 400
+        if kind not in ('all', 'events', 'photos'):
+            return jsonify({'error': 'type参数应为all、events或photos'}), 400
+        if month and (not year or not 1 <= month <= 12):
+            return jsonify({'error': '无效的年份或月份'}), 400
+        
+        try:
+            result = get_or_build(
+                ('timeline', zoom, kind, year, month),
+                ('event', 'photo'),
+                lambda: build_timeline(zoom, kind, year, month)
+            )
+            return jsonify(result)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
+    # ===== 统计相关API =====
+    
+    @app.route('/api/stats/storage', methods=['GET'])
+    def get_storage_usage():
+        """获取存储用量统计（读取数据库计数器，不遍历磁盘）"""
+        try:
+            return jsonify(get_storage_stats())
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
     
     # ===== 配置相关API =====
     
+    def build_config_cache():
+        """查询并解析所有配置项，预先生成JSON响应体和ETag"""
+        def encode(payload):
+            body = app.json.dumps(payload).encode('utf-8')
+            return body, hashlib.md5(body).hexdigest()
+        
+        config_dicts = [config.to_dict() for config in Config.query.all()]
+        return {
+            'all': encode(config_dicts),
+            'items': {item['key']: encode(item) for item in config_dicts},
+            'values': {item['key']: item['value'] for item in config_dicts}
+        }
+    
+    def get_config_cache():
+        """读取配置缓存，config表有写入（或数据被恢复）后才会重新查询数据库"""
+        return get_or_build(('configs',), ('config',), build_config_cache)
+    
+    def cached_json_response(body, etag):
+        """返回预先生成的JSON，客户端带有匹配的If-None-Match时返回304"""
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response.make_conditional(request)
+    
     @app.route('/api/configs', methods=['GET'])
     def get_configs():
         """获取所有配置信息"""
-        configs = Config.query.all()
-        return jsonify([config.to_dict() for config in configs])
+        body, etag = get_config_cache()['all']
+        return cached_json_response(body, etag)
     
     @app.route('/api/configs/<string:key>', methods=['GET'])
     def get_config(key):
         """获取单个配置信息"""
-        # 首先记录请求日志
-        app.logger.info(f"Request for config key: {key}")
-        
         try:
-            # 查询配置项
-            config = Config.query.filter_by(key=key).first()
+            # 从缓存中查找配置项
+            cached = get_config_cache()['items'].get(key)
             
             # 检查配置项是否存在
-            if config is None:
+            if cached is None:
                 app.logger.warning(f"Config key not found: {key}")
                 return jsonify({'error': 'Configuration not found'}), 404
             
-            # 尝试转换为字典并返回
-            try:
-                config_dict = config.to_dict()
-                return jsonify(config_dict), 200
-            except Exception as to_dict_error:
-                app.logger.error(f"Error converting config {key} to dict: {str(to_dict_error)}")
-                return jsonify({'error': 'Failed to process configuration data'}), 500
+            body, etag = cached
+            return cached_json_response(body, etag)
         except Exception as e:
             # 捕获所有其他异常
             app.logger.error(f"Unexpected error getting config {key}: {str(e)}")
@@ -678,86 +1121,279 @@ def setup_routes(app):
             db.session.rollback()
             return jsonify({'error': 'Internal Server Error'}), 500
     
+    # ===== 首页API =====
+    
+    # 首页数据缓存时间（秒），倒计时天数按天变化，短时间缓存即可
+    HOME_CACHE_TTL = 30
+    HOME_RECENT_EVENTS = 3
+    HOME_FEATURED_PHOTOS = 6
+    
+    def build_home():
+        """一次生成首页所需的全部数据：配置、倒计时、最近事件和精选照片"""
+        configs = get_config_cache()['values']
+        
+        # 倒计时（天数按服务器日期计算，前端也可以根据日期自行计算）
+        today = date.today()
+        countdowns = {}
+        for name, key in (('relationship', 'relationship_date'), ('meeting', 'first_meeting_date')):
+            try:
+                start = datetime.strptime(configs.get(key) or '', '%Y-%m-%d').date()
+                countdowns[name] = {'date': start.isoformat(), 'days': abs((today - start).days)}
+            except ValueError:
+                countdowns[name] = None
+        
+        # 最近事件：只查询卡片需要的列，不加载事件下的照片
+        recent_events = [
+            {
+                'id': event_id,
+                'title': title,
+                'date': event_date.strftime('%Y-%m-%d') if event_date else None,
+                'description': description
+            }
+            for event_id, title, event_date, description in db.session.query(
+                Event.id, Event.title, Event.date, Event.description
+            ).order_by(Event.date.desc()).limit(HOME_RECENT_EVENTS)
+        ]
+        
+        # 精选照片：最近上传的照片，只返回缩略图所需的字段
+        featured_photos = [
+            {
+                'id': photo_id,
+                'filename': filename,
+                'original_name': original_name,
+                'path': path,
+                'description': description,
+                'date_taken': date_taken.strftime('%Y-%m-%d') if date_taken else None,
+                'url': build_photo_url(filename),
+                'thumbnail_url': build_photo_url(filename, is_thumbnail=True)
+            }
+            for photo_id, filename, original_name, path, description, date_taken in db.session.query(
+                Photo.id, Photo.filename, Photo.original_name, Photo.path, Photo.description, Photo.date_taken
+            ).order_by(Photo.created_at.desc()).limit(HOME_FEATURED_PHOTOS)
+        ]
+        
+        body = app.json.dumps({
+            'configs': configs,
+            'countdowns': countdowns,
+            'recent_events': recent_events,
+            'featured_photos': featured_photos
+        }).encode('utf-8')
+        return body, hashlib.md5(body).hexdigest()
+    
+    @app.route('/api/home', methods=['GET'])
+    def get_home():
+        """获取首页数据（聚合接口，替代首页的多次请求）"""
+        try:
+            body, etag = get_or_build(('home',), ('config', 'event', 'photo'), build_home, ttl=HOME_CACHE_TTL)
+            response = cached_json_response(body, etag)
+            # 浏览器每次都用ETag重新验证，避免用户修改后仍看到旧的首页
+            response.cache_control.no_cache = True
+            return response
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
+    # ===== 后台任务API =====
+    
+    # SSE连接在任务没有变化时发送保活注释的间隔（秒），以及两次推送之间的最小间隔
+    JOB_EVENTS_KEEPALIVE = 15
+    JOB_EVENTS_MIN_INTERVAL = 0.2
+    
+    def wants_async():
+        """请求是否要求以后台任务执行（查询参数async=1或请求头Prefer: respond-async）"""
+        return request.args.get('async', type=int) == 1 or \
+            'respond-async' in request.headers.get('Prefer', '')
+    
+    def job_accepted(job):
+        """任务已提交的响应（202），包含轮询和SSE订阅地址"""
+        return jsonify({
+            'job_id': job['id'],
+            'status': job['status'],
+            'status_url': f"/api/jobs/{job['id']}",
+            'events_url': f"/api/jobs/{job['id']}/events"
+        }), 202
+    
+    @app.route('/api/jobs', methods=['GET'])
+    def get_jobs():
+        """最近的后台任务"""
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        return jsonify(list_jobs(limit))
+    
+    @app.route('/api/jobs/<int:job_id>', methods=['GET'])
+    def get_job_status(job_id):
+        """查询后台任务的状态和进度"""
+        job = get_job(job_id)
+        if job is None:
+            return jsonify({'error': '任务不存在'}), 404
+        return jsonify(job)
+    
+    @app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+    def cancel_job_route(job_id):
+        """取消后台任务"""
+        job = cancel_job(job_id)
+        if job is None:
+            return jsonify({'error': '任务不存在'}), 404
+        return jsonify(job)
+    
+    @app.route('/api/jobs/<int:job_id>/events', methods=['GET'])
+    def job_events(job_id):
+        """以Server-Sent Events推送任务进度，任务结束后关闭连接"""
+        if get_job(job_id) is None:
+            return jsonify({'error': '任务不存在'}), 404
+        # 等待期间不占用数据库连接
+        db.session.close()
+        
+        def generate():
+            version = None
+            while True:
+                current = job_version(job_id)
+                if current == version:
+                    yield ': keep-alive\n\n'
+                else:
+                    version = current
+                    job = get_job(job_id)
+                    db.session.close()
+                    if job is None:
+                        return
+                    yield f"data: {app.json.dumps(job)}\n\n"
+                    if job['status'] in FINISHED_STATES:
+                        return
+                    time.sleep(JOB_EVENTS_MIN_INTERVAL)
+                wait_for_job_change(job_id, version, JOB_EVENTS_KEEPALIVE)
+        
+        return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
+    @job_handler('cleanup_orphans')
+    def cleanup_orphans_job(job):
+        removed = cleanup_orphaned_photos(db, app.config['UPLOAD_FOLDER'], progress=job.progress)
+        return {'removed_files': removed}
+    
+    @app.route('/api/storage/cleanup', methods=['POST'])
+    def cleanup_storage():
+        """在后台删除不属于任何照片的孤立文件，返回任务ID"""
+        return job_accepted(submit_job('cleanup_orphans'))
+    
+    @job_handler('regenerate_thumbnails', exclusive=True)
+    def regenerate_thumbnails_job(job, force=False, workers=None):
+        def report(done, total, stats):
+            job.progress(done, total, f"已处理 {done}/{total} 张照片（{stats['per_second']} 张/秒）")
+        
+        return regenerate_thumbnails(
+            app.config['UPLOAD_FOLDER'], workers=workers, force=force,
+            checkpoint_path=os.path.join(app.config['DATA_DIR'], THUMBNAIL_CHECKPOINT_FILE),
+            progress=report
+        )
+    
+    @app.route('/api/thumbnails/regenerate', methods=['POST'])
+    def regenerate_thumbnails_api():
+        """
+        在后台重新生成缺失或比原图旧的缩略图，返回任务ID
+        
+        force=true时重新生成所有缩略图；任务中断或取消后再次提交会从上次的检查点继续
+        """
+        data = request.get_json(silent=True) or {}
+        params = {'force': bool(data.get('force'))}
+        if data.get('workers') is not None:
+            try:
+                params['workers'] = int(data['workers'])
+            except (TypeError, ValueError):
+                return jsonify({'error': 'workers必须是整数'}), 400
+        return job_accepted(submit_job('regenerate_thumbnails', params))
+    
     # ===== 数据备份与恢复API =====
     
+    def get_backup_dir():
+        """备份目录的绝对路径"""
+        return os.path.abspath(os.path.join(os.environ.get('LOVE_STORY_APP_DATA_DIR', os.path.join(os.path.expanduser('~'), '.love_story_app')), 'data', 'backups'))
+    
+    def create_backup():
+        """备份数据库文件，返回备份文件信息"""
+        # 生成备份文件名（使用时间戳）
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        
+        # 获取正确的数据目录路径
+        # 确保使用绝对路径
+        upload_folder = os.path.abspath(app.config['UPLOAD_FOLDER'])
+        backup_dir = os.path.abspath(os.path.join(upload_folder, '..', 'data', 'backups'))
+        
+        # 确保备份目录存在
+        print(f"创建备份目录: {backup_dir}")
+        os.makedirs(backup_dir, exist_ok=True)
+        
+        # 可能的数据库位置列表
+        # 优先使用用户主目录下的.love_story_app文件夹，这是应用实际使用的数据存储位置
+        possible_db_paths = [
+            # 1. 从环境变量获取数据目录（应用实际使用的路径）
+            os.path.abspath(os.path.join(os.environ.get('LOVE_STORY_APP_DATA_DIR', os.path.join(os.path.expanduser('~'), '.love_story_app')), 'love_story.db')),
+            # 2. 从用户主目录直接计算的路径
+            os.path.abspath(os.path.join(os.path.expanduser('~'), '.love_story_app', 'love_story.db')),
+            # 3. 从上传目录计算的路径
+            os.path.abspath(os.path.join(upload_folder, '..', 'data', 'love_story.db')),
+            # 4. 从BASE_DIR计算的路径
+            os.path.abspath(os.path.join(BASE_DIR, 'data', 'love_story.db')),
+            # 5. 当前工作目录下的data目录
+            os.path.abspath(os.path.join(os.getcwd(), 'data', 'love_story.db')),
+            # 6. 项目根目录下的data目录
+            os.path.abspath(os.path.join(BASE_DIR, '..', 'data', 'love_story.db')),
+            # 7. 直接在UPLOAD_FOLDER中查找
+            os.path.abspath(os.path.join(upload_folder, 'love_story.db'))
+        ]
+        
+        # 查找实际的数据库文件
+        db_path = None
+        for possible_path in possible_db_paths:
+            if os.path.exists(possible_path):
+                db_path = possible_path
+                print(f"找到数据库文件: {db_path}")
+                break
+        
+        # 如果找不到数据库文件，创建一个空的数据库文件
+        if not db_path:
+            print("未找到数据库文件，将创建一个新的空数据库文件")
+            # 使用第一个可能的路径作为默认位置
+            default_db_path = possible_db_paths[0]
+            # 确保目录存在
+            os.makedirs(os.path.dirname(default_db_path), exist_ok=True)
+            # 创建空文件
+            with open(default_db_path, 'w') as f:
+                pass
+            db_path = default_db_path
+            print(f"创建了空数据库文件: {db_path}")
+        
+        # 使用utils中的backup_database函数来备份数据库
+        print(f"使用backup_database函数备份数据库: {db_path} -> {backup_dir}")
+        backup_db_path = backup_database(db_path, backup_dir)
+        
+        # 如果备份失败，使用fallback方式
+        if not backup_db_path:
+            backup_db_path = os.path.join(backup_dir, f'love_story_{timestamp}.db')
+            print(f"使用fallback方式备份数据库: {db_path} -> {backup_db_path}")
+            shutil.copy2(db_path, backup_db_path)
+        
+        # 获取备份文件信息
+        backup_info = {
+            'filename': os.path.basename(backup_db_path),
+            'size': os.path.getsize(backup_db_path),
+            'created_at': datetime.now().isoformat()
+        }
+        
+        # 清理旧备份，保留最新的30个
+        print(f"清理旧备份，保留最新的30个")
+        cleanup_old_backups(backup_dir, max_backups=30)
+        
+        return backup_info
+    
+    @job_handler('backup', exclusive=True)
+    def backup_job(job):
+        return {'message': '数据备份成功', 'backup_file': create_backup()}
+    
     @app.route('/api/backup', methods=['POST'])
     def backup_data():
-        """备份数据库和照片"""
+        """备份数据库和照片（async=1时作为后台任务执行，立即返回任务ID）"""
         try:
-            # 生成备份文件名（使用时间戳）
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            
-            # 获取正确的数据目录路径
-            # 确保使用绝对路径
-            upload_folder = os.path.abspath(app.config['UPLOAD_FOLDER'])
-            backup_dir = os.path.abspath(os.path.join(upload_folder, '..', 'data', 'backups'))
-            
-            # 确保备份目录存在
-            print(f"创建备份目录: {backup_dir}")
-            os.makedirs(backup_dir, exist_ok=True)
-            
-            # 可能的数据库位置列表
-            # 优先使用用户主目录下的.love_story_app文件夹，这是应用实际使用的数据存储位置
-            possible_db_paths = [
-                # 1. 从环境变量获取数据目录（应用实际使用的路径）
-                os.path.abspath(os.path.join(os.environ.get('LOVE_STORY_APP_DATA_DIR', os.path.join(os.path.expanduser('~'), '.love_story_app')), 'love_story.db')),
-                # 2. 从用户主目录直接计算的路径
-                os.path.abspath(os.path.join(os.path.expanduser('~'), '.love_story_app', 'love_story.db')),
-                # 3. 从上传目录计算的路径
-                os.path.abspath(os.path.join(upload_folder, '..', 'data', 'love_story.db')),
-                # 4. 从BASE_DIR计算的路径
-                os.path.abspath(os.path.join(BASE_DIR, 'data', 'love_story.db')),
-                # 5. 当前工作目录下的data目录
-                os.path.abspath(os.path.join(os.getcwd(), 'data', 'love_story.db')),
-                # 6. 项目根目录下的data目录
-                os.path.abspath(os.path.join(BASE_DIR, '..', 'data', 'love_story.db')),
-                # 7. 直接在UPLOAD_FOLDER中查找
-                os.path.abspath(os.path.join(upload_folder, 'love_story.db'))
-            ]
-            
-            # 查找实际的数据库文件
-            db_path = None
-            for possible_path in possible_db_paths:
-                if os.path.exists(possible_path):
-                    db_path = possible_path
-                    print(f"找到数据库文件: {db_path}")
-                    break
-            
-            # 如果找不到数据库文件，创建一个空的数据库文件
-            if not db_path:
-                print("未找到数据库文件，将创建一个新的空数据库文件")
-                # 使用第一个可能的路径作为默认位置
-                default_db_path = possible_db_paths[0]
-                # 确保目录存在
-                os.makedirs(os.path.dirname(default_db_path), exist_ok=True)
-                # 创建空文件
-                with open(default_db_path, 'w') as f:
-                    pass
-                db_path = default_db_path
-                print(f"创建了空数据库文件: {db_path}")
-            
-            # 使用utils中的backup_database函数来备份数据库
-            print(f"使用backup_database函数备份数据库: {db_path} -> {backup_dir}")
-            backup_db_path = backup_database(db_path, backup_dir)
-            
-            # 如果备份失败，使用fallback方式
-            if not backup_db_path:
-                backup_db_path = os.path.join(backup_dir, f'love_story_{timestamp}.db')
-                print(f"使用fallback方式备份数据库: {db_path} -> {backup_db_path}")
-                shutil.copy2(db_path, backup_db_path)
-            
-            # 获取备份文件信息
-            backup_info = {
-                'filename': os.path.basename(backup_db_path),
-                'size': os.path.getsize(backup_db_path),
-                'created_at': datetime.now().isoformat()
-            }
-            
-            # 清理旧备份，保留最新的30个
-            print(f"清理旧备份，保留最新的30个")
-            cleanup_old_backups(backup_dir, max_backups=30)
-            
-            return jsonify({'message': '数据备份成功', 'backup_file': backup_info}), 200
+            if wants_async():
+                return job_accepted(submit_job('backup'))
+            return jsonify({'message': '数据备份成功', 'backup_file': create_backup()}), 200
         except Exception as e:
             print(f"备份失败: {str(e)}")
             import traceback
@@ -772,7 +1408,7 @@ def setup_routes(app):
             # 优先使用用户主目录下的.love_story_app文件夹，这是应用实际使用的数据存储位置
             upload_folder = os.path.abspath(app.config['UPLOAD_FOLDER'])
             # 优先使用用户主目录下的备份目录
-            backup_dir = os.path.abspath(os.path.join(os.environ.get('LOVE_STORY_APP_DATA_DIR', os.path.join(os.path.expanduser('~'), '.love_story_app')), 'data', 'backups'))
+            backup_dir = get_backup_dir()
             
             # 检查备份目录是否存在
             if not os.path.exists(backup_dir):
@@ -804,7 +1440,7 @@ def setup_routes(app):
         """删除指定的备份文件"""
         try:
             # 获取正确的备份目录路径，与get_backups函数保持一致
-            backup_dir = os.path.abspath(os.path.join(os.environ.get('LOVE_STORY_APP_DATA_DIR', os.path.join(os.path.expanduser('~'), '.love_story_app')), 'data', 'backups'))
+            backup_dir = get_backup_dir()
             backup_path = os.path.join(backup_dir, filename)
             
             if not os.path.exists(backup_path):
@@ -823,13 +1459,35 @@ def setup_routes(app):
     
     # 清理旧备份API已移除，系统自动最多保存100个备份
     
+    def restore_backup(backup_path):
+        """用备份文件替换当前数据库"""
+        # 获取正确的数据库路径，与backup_data函数保持一致
+        db_path = os.path.abspath(os.path.join(os.environ.get('LOVE_STORY_APP_DATA_DIR', os.path.join(os.path.expanduser('~'), '.love_story_app')), 'love_story.db'))
+        
+        # 关闭数据库连接后恢复（其他线程同时访问时等待复制完成）
+        db.session.remove()
+        db.engine.dispose()
+        copy_sqlite_database(backup_path, db_path)
+        
+        # 旧版本的备份需要升级表结构（结构版本一致时只有一次PRAGMA查询）
+        init_db()
+        
+        # 数据库文件已被整体替换，所有缓存都已过期
+        invalidate_all()
+        
+        # 备份中记录的未完成任务在当前进程中并不存在
+        recover_jobs()
+    
+    @job_handler('restore', exclusive=True)
+    def restore_job(job, filename):
+        restore_backup(os.path.join(get_backup_dir(), filename))
+        return {'message': '数据恢复成功', 'filename': filename}
+    
     @app.route('/api/restore/<filename>', methods=['POST'])
     def restore_data(filename):
-        """恢复数据库"""
+        """恢复数据库（async=1时作为后台任务执行，立即返回任务ID）"""
         try:
-            # 获取正确的备份目录路径，与get_backups函数保持一致
-            backup_dir = os.path.abspath(os.path.join(os.environ.get('LOVE_STORY_APP_DATA_DIR', os.path.join(os.path.expanduser('~'), '.love_story_app')), 'data', 'backups'))
-            backup_path = os.path.join(backup_dir, filename)
+            backup_path = os.path.join(get_backup_dir(), filename)
             
             if not os.path.exists(backup_path):
                 return jsonify({'error': '备份文件不存在'}), 404
@@ -838,12 +1496,10 @@ def setup_routes(app):
             if not ((filename.startswith('database_backup_') or filename.startswith('love_story_')) and filename.endswith('.db')):
                 return jsonify({'error': '无效的备份文件名'}), 400
             
-            # 获取正确的数据库路径，与backup_data函数保持一致
-            db_path = os.path.abspath(os.path.join(os.environ.get('LOVE_STORY_APP_DATA_DIR', os.path.join(os.path.expanduser('~'), '.love_story_app')), 'love_story.db'))
-            
-            # 关闭数据库连接后恢复
-            shutil.copy2(backup_path, db_path)
+            if wants_async():
+                return job_accepted(submit_job('restore', {'filename': filename}))
             
+            restore_backup(backup_path)
             return jsonify({'message': '数据恢复成功'}), 200
         except Exception as e:
             return jsonify({'error': str(e)}), 500
\ No newline at end of file
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""
+恋爱故事记录应用 - JSON序列化
+
+提供可替换的JSON后端：安装了orjson时使用orjson，否则退回到标准库json；
+两者都直接编码date/datetime（ISO 8601格式）。
+列表接口使用列元组投影查询，不构造ORM对象，直接生成可序列化的字典。
+"""
+
+import os
+import json
+import base64
+from datetime import date, datetime
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import func, select, and_, or_
+
+from backend.models import db, Photo, Album, Event, Tag, photo_tags
+
+# 通过环境变量LOVE_STORY_JSON_BACKEND=json可以强制使用标准库
+try:
+    if os.environ.get('LOVE_STORY_JSON_BACKEND', 'orjson') != 'orjson':
+        raise ImportError
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = 'orjson' if orjson else 'json'
+
+# 标签在投影查询中用group_concat拼接，使用不会出现在标签名中的分隔符
+TAG_SEPARATOR = '\x1f'
+
+
+def _default(obj):
+    """标准库json不支持的类型"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson:
+    _ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        """序列化为UTF-8编码的JSON字节串"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+else:
+    _encoder = json.JSONEncoder(
+        default=_default, ensure_ascii=False, sort_keys=True, separators=(',', ':')
+    )
+
+    def dumps(obj):
+        """序列化为UTF-8编码的JSON字节串"""
+        return _encoder.encode(obj).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """让jsonify和app.json.dumps使用上面选定的JSON后端"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+
+# ===== 流式输出 =====
+
+# 流式输出时每次写出的行数
+STREAM_CHUNK_ROWS = 200
+
+
+def stream_json(rows, to_dict, ndjson=False):
+    """
+    逐行序列化查询结果并分块输出
+
+    ndjson为True时每行一个JSON对象（application/x-ndjson），
+    否则输出一个完整的JSON数组。内存中最多只保留一个分块。
+    """
+    chunk = []
+    first = True
+    if not ndjson:
+        yield b'['
+    for row in rows:
+        encoded = dumps(to_dict(row))
+        if ndjson:
+            chunk.append(encoded + b'\n')
+        else:
+            chunk.append(encoded if first else b',' + encoded)
+            first = False
+        if len(chunk) >= STREAM_CHUNK_ROWS:
+            yield b''.join(chunk)
+            chunk = []
+    if chunk:
+        yield b''.join(chunk)
+    if not ndjson:
+        yield b']'
+
+
+# ===== 列元组投影 =====
+
+# 照片列表返回的基础字段（与Photo.to_dict保持一致）
+PHOTO_FIELDS = (
+    'id', 'filename', 'original_name', 'path', 'description', 'date_taken', 'created_at',
+    'width', 'height', 'orientation', 'camera_make', 'camera_model', 'latitude', 'longitude',
+    'frame_count', 'placeholder', 'event_id', 'album_id'
+)
+
+
+def photo_tags_column():
+    """照片标签的关联子查询，用group_concat把标签拼接成一个字符串"""
+    return select(func.group_concat(Tag.name, TAG_SEPARATOR)) \
+        .select_from(photo_tags.join(Tag, Tag.id == photo_tags.c.tag_id)) \
+        .where(photo_tags.c.photo_id == Photo.id) \
+        .correlate(Photo) \
+        .scalar_subquery()
+
+
+def project_photos(query):
+    """
+    把照片查询改写为列元组查询
+
+    一次查询带回照片字段、标签以及所属相册和事件的名称，不构造ORM对象
+    """
+    columns = [getattr(Photo, field) for field in PHOTO_FIELDS]
+    columns += [photo_tags_column(), Album.name, Event.title, Event.date]
+    return query.with_entities(*columns) \
+        .outerjoin(Album, Album.id == Photo.album_id) \
+        .outerjoin(Event, Event.id == Photo.event_id)
+
+
+def photo_row_to_dict(row, build_photo_url):
+    """把project_photos返回的一行转换为照片字典（日期字段保持date/datetime，由序列化器编码）"""
+    item = dict(zip(PHOTO_FIELDS, row))
+    tags, album_name, event_title, event_date = row[len(PHOTO_FIELDS):]
+    item['tags'] = tags.split(TAG_SEPARATOR) if tags else []
+    item['placeholder'] = item['placeholder'] or None
+    item['url'] = build_photo_url(item['filename'])
+    item['thumbnail_url'] = build_photo_url(item['filename'], is_thumbnail=True)
+    if (item['frame_count'] or 1) > 1:
+        item['animation_url'] = build_photo_url(item['filename'], is_animation=True)
+    if item['album_id'] is not None and album_name is not None:
+        item['album_info'] = {'id': item['album_id'], 'name': album_name}
+    if item['event_id'] is not None and event_title is not None:
+        item['event_info'] = {'id': item['event_id'], 'title': event_title, 'date': event_date}
+    return item
+
+
+# ===== 游标分页 =====
+
+# 每页照片数量的上限
+MAX_PAGE_SIZE = 500
+
+
+def photo_row_position(row):
+    """project_photos返回的一行在分页顺序中的位置(created_at, id)"""
+    return row[PHOTO_FIELDS.index('created_at')], row[PHOTO_FIELDS.index('id')]
+
+
+def encode_photo_cursor(row):
+    """用project_photos返回的一行（本页最后一张照片）生成下一页的游标"""
+    created_at, photo_id = photo_row_position(row)
+    payload = [created_at.isoformat() if created_at else None, photo_id]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_photo_cursor(cursor):
+    """解析游标，返回(created_at, id)，游标无效时抛出ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, photo_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return (datetime.fromisoformat(created_at) if created_at else None), int(photo_id)
+    except Exception:
+        raise ValueError('无效的分页游标')
+
+
+def photo_cursor_filter(created_at, photo_id):
+    """
+    游标之后（按created_at、id倒序）的照片的过滤条件
+
+    created_at上的范围条件让SQLite直接在(created_at, id)索引上定位到游标位置，
+    不需要扫描前面的所有页。倒序排列时没有created_at的照片排在最后，这个条件不包含它们，
+    由调用方在有created_at的照片取完之后接着按id分页
+    """
+    if created_at is None:
+        return and_(Photo.created_at.is_(None), Photo.id < photo_id)
+    return and_(Photo.created_at <= created_at, or_(Photo.created_at < created_at, Photo.id < photo_id))
+
+
+def photo_page(query, position=None, size=None):
+    """
+    按(created_at, id)倒序读取位置之后的照片（列元组），最多size张，size为None时不限数量
+
+    query是只带筛选条件的照片查询，position为decode_photo_cursor的结果，None表示从头开始
+    """
+    paged = query.filter(photo_cursor_filter(*position)) if position else query
+    rows = project_photos(paged.order_by(Photo.created_at.desc(), Photo.id.desc())).limit(size).all()
+    if position and position[0] is not None and (size is None or len(rows) < size):
+        # 有created_at的照片已经取完，接着取没有created_at的照片
+        rows += project_photos(
+            query.filter(Photo.created_at.is_(None)).order_by(Photo.id.desc())
+        ).limit(None if size is None else size - len(rows)).all()
+    return rows
+
+
+def iter_photo_pages(query, position=None, batch_size=500):
+    """
+    按游标逐页读取位置之后的全部照片（列元组）
+
+    每页在单独的短读事务中读完，流式输出给慢速客户端期间不持有SQLite的读锁，不会阻塞其他请求写入
+    """
+    while True:
+        rows = photo_page(query, position, batch_size)
+        db.session.rollback()
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        position = photo_row_position(rows[-1])
+
+
+# 事件列表返回的基础字段（与Event.to_dict保持一致）
+EVENT_FIELDS = ('id', 'title', 'date', 'description', 'created_at', 'updated_at')
+
+
+def project_events(query):
+    """把事件查询改写为列元组查询"""
+    return query.with_entities(*[getattr(Event, field) for field in EVENT_FIELDS])
+
+
+def event_rows_to_dicts(rows, build_photo_url):
+    """
+    把project_events返回的行转换为事件字典
+
+    事件下的照片用一次投影查询批量取回，避免逐个事件加载照片
+    """
+    events = [dict(zip(EVENT_FIELDS, row)) for row in rows]
+    by_id = {}
+    for event in events:
+        event['photos'] = []
+        by_id[event['id']] = event
+
+    if by_id:
+        ids = list(by_id)
+        # 分批查询，避免超过SQLite的参数数量限制
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            photo_query = project_photos(db.session.query(Photo).filter(Photo.event_id.in_(chunk)))
+            for row in photo_query.order_by(Photo.id):
+                photo = photo_row_to_dict(row, build_photo_url)
+                # Event.to_dict中的照片不带URL和关联信息
+                for key in ('url', 'thumbnail_url', 'animation_url', 'album_info', 'event_info'):
+                    photo.pop(key, None)
+                by_id[photo['event_id']]['photos'].append(photo)
+
+    return events
@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+
+"""
+恋爱故事记录应用 - 存储用量统计
+
+上传、删除和缩略图生成时增量维护数据库中的字节计数器，
+状态接口直接读取计数器，不再遍历上传目录。
+后台线程定期用os.scandir扫描磁盘并与数据库对账。
+批量删除照片后的文件清理放入队列，由后台线程逐个删除。
+请求中按需生成的缩略图大小也放入队列，由后台线程合并后在一个事务中写入。
+"""
+
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import func, case, update
+from sqlalchemy.dialects.sqlite import insert
+
+from backend import metrics
+from backend.models import db, Photo, Album, Event, StorageCounter
+from backend.utils import scan_upload_folder, format_file_size, delete_photo_files
+
+# 计数器范围
+SCOPE_TOTAL = 'total'
+SCOPE_ALBUM = 'album'
+SCOPE_EVENT = 'event'
+SCOPE_DISK = 'disk'  # 磁盘实际占用（包含孤立文件），仅由对账扫描更新
+
+# 对账时每批更新的照片数量
+RECONCILE_BATCH_SIZE = 500
+
+# 按需生成的缩略图合并写入前等待的时间（秒），一次滚动浏览生成的缩略图在同一个事务中记录
+RENDITION_FLUSH_DELAY = 2.0
+
+# 最近一次对账的结果
+_last_reconcile = {'finished_at': None, 'duration': None, 'updated_photos': 0}
+_reconcile_lock = threading.Lock()
+
+
+def _photo_files(photo):
+    """照片当前占用的文件数量（原图和缩略图）"""
+    return int(bool(photo.file_size)) + int(bool(photo.thumbnail_size))
+
+
+def adjust_storage_usage(delta_bytes, delta_files, album_id=None, event_id=None):
+    """
+    按增量更新计数器，只写入当前会话，由调用方负责提交
+
+    使用INSERT ... ON CONFLICT DO UPDATE，在SQLite中是单条原子语句
+    """
+    if not delta_bytes and not delta_files:
+        return
+
+    scopes = [(SCOPE_TOTAL, 0)]
+    if album_id:
+        scopes.append((SCOPE_ALBUM, album_id))
+    if event_id:
+        scopes.append((SCOPE_EVENT, event_id))
+
+    for scope, scope_id in scopes:
+        _adjust_scope(scope, scope_id, delta_bytes, delta_files)
+
+
+def record_photo_added(photo):
+    """新照片入库时累加计数器"""
+    adjust_storage_usage(
+        (photo.file_size or 0) + (photo.thumbnail_size or 0),
+        _photo_files(photo),
+        photo.album_id, photo.event_id
+    )
+
+
+def record_photo_removed(photo):
+    """照片删除时扣减计数器"""
+    adjust_storage_usage(
+        -((photo.file_size or 0) + (photo.thumbnail_size or 0)),
+        -_photo_files(photo),
+        photo.album_id, photo.event_id
+    )
+
+
+def record_photo_moved(photo, old_album_id, old_event_id):
+    """照片更换相册或事件时，把用量从旧范围转移到新范围"""
+    size = (photo.file_size or 0) + (photo.thumbnail_size or 0)
+    files = _photo_files(photo)
+
+    if old_album_id != photo.album_id:
+        if old_album_id:
+            _adjust_scope(SCOPE_ALBUM, old_album_id, -size, -files)
+        if photo.album_id:
+            _adjust_scope(SCOPE_ALBUM, photo.album_id, size, files)
+
+    if old_event_id != photo.event_id:
+        if old_event_id:
+            _adjust_scope(SCOPE_EVENT, old_event_id, -size, -files)
+        if photo.event_id:
+            _adjust_scope(SCOPE_EVENT, photo.event_id, size, files)
+
+
+def record_rendition_created(photo, thumbnail_size):
+    """缩略图生成后更新照片记录和计数器"""
+    delta_bytes = (thumbnail_size or 0) - (photo.thumbnail_size or 0)
+    delta_files = int(bool(thumbnail_size)) - int(bool(photo.thumbnail_size))
+    photo.thumbnail_size = thumbnail_size or 0
+    adjust_storage_usage(delta_bytes, delta_files, photo.album_id, photo.event_id)
+
+
+def _usage_columns():
+    """照片占用字节数和文件数的聚合表达式"""
+    size_expr = func.coalesce(func.sum(Photo.file_size + Photo.thumbnail_size), 0)
+    files_expr = func.coalesce(func.sum(
+        case((Photo.file_size > 0, 1), else_=0) + case((Photo.thumbnail_size > 0, 1), else_=0)
+    ), 0)
+    return size_expr, files_expr
+
+
+def record_photos_moved(photo_ids, scope, new_scope_id):
+    """
+    一组照片批量更换相册或事件前调用，按原范围聚合后把用量转移到新范围
+
+    photo_ids的数量应在SQLite的参数上限以内，由调用方分批
+    """
+    column = Photo.album_id if scope == SCOPE_ALBUM else Photo.event_id
+    moved_bytes = moved_files = 0
+    rows = db.session.query(column, *_usage_columns()) \
+        .filter(Photo.id.in_(photo_ids)).group_by(column).all()
+    for old_scope_id, size, files in rows:
+        if old_scope_id == new_scope_id:
+            continue
+        if old_scope_id:
+            _adjust_scope(scope, old_scope_id, -int(size), -int(files))
+        moved_bytes += int(size)
+        moved_files += int(files)
+    if new_scope_id:
+        _adjust_scope(scope, new_scope_id, moved_bytes, moved_files)
+
+
+def record_photos_removed(photo_ids):
+    """一组照片批量删除前调用，按相册和事件聚合后扣减计数器（分批要求同上）"""
+    size_expr, files_expr = _usage_columns()
+    total = db.session.query(size_expr, files_expr).filter(Photo.id.in_(photo_ids)).one()
+    _adjust_scope(SCOPE_TOTAL, 0, -int(total[0]), -int(total[1]))
+    for scope, column in ((SCOPE_ALBUM, Photo.album_id), (SCOPE_EVENT, Photo.event_id)):
+        rows = db.session.query(column, size_expr, files_expr) \
+            .filter(Photo.id.in_(photo_ids), column.isnot(None)).group_by(column).all()
+        for scope_id, size, files in rows:
+            _adjust_scope(scope, scope_id, -int(size), -int(files))
+
+
+def remove_storage_scope(scope, scope_id):
+    """相册或事件删除后移除它的计数器（其中的照片应已通过record_photos_removed扣减）"""
+    db.session.query(StorageCounter).filter_by(scope=scope, scope_id=scope_id).delete()
+
+
+def _adjust_scope(scope, scope_id, delta_bytes, delta_files):
+    """只更新单个范围的计数器"""
+    now = datetime.utcnow()
+    stmt = insert(StorageCounter).values(
+        scope=scope, scope_id=scope_id,
+        bytes=delta_bytes, files=delta_files, updated_at=now
+    ).on_conflict_do_update(
+        index_elements=['scope', 'scope_id'],
+        set_={
+            'bytes': StorageCounter.bytes + delta_bytes,
+            'files': StorageCounter.files + delta_files,
+            'updated_at': now
+        }
+    )
+    db.session.execute(stmt)
+
+
+def rebuild_storage_counters():
+    """
+    根据照片表中记录的文件大小重新计算所有计数器
+
+    只执行GROUP BY聚合，不访问磁盘，适合批量删除等无法逐条累加的场景。
+    只写入当前会话，由调用方负责提交。
+    """
+    size_expr, files_expr = _usage_columns()
+    now = datetime.utcnow()
+
+    rows = [{'scope': SCOPE_TOTAL, 'scope_id': 0, 'bytes': 0, 'files': 0, 'updated_at': now}]
+    total = db.session.query(size_expr, files_expr).one()
+    rows[0]['bytes'], rows[0]['files'] = int(total[0]), int(total[1])
+
+    for scope, column in ((SCOPE_ALBUM, Photo.album_id), (SCOPE_EVENT, Photo.event_id)):
+        grouped = db.session.query(column, size_expr, files_expr) \
+            .filter(column.isnot(None)).group_by(column).all()
+        for scope_id, size, files in grouped:
+            rows.append({'scope': scope, 'scope_id': scope_id, 'bytes': int(size),
+                         'files': int(files), 'updated_at': now})
+
+    db.session.query(StorageCounter).filter(StorageCounter.scope != SCOPE_DISK).delete()
+    db.session.execute(insert(StorageCounter), rows)
+
+
+def reconcile_storage(upload_folder):
+    """
+    扫描磁盘并与数据库对账
+
+    用os.scandir遍历上传目录，修正照片表中记录的文件大小，
+    然后重建计数器，同时记录磁盘实际占用（包括不属于任何照片的文件）。
+    返回被修正的照片数量。
+    """
+    with _reconcile_lock:
+        started = time.time()
+
+        originals = {}
+        thumbnails = {}
+        disk_bytes = 0
+        disk_files = 0
+        for rel_dir, name, size in scan_upload_folder(upload_folder):
+            disk_bytes += size
+            disk_files += 1
+            if rel_dir.split(os.sep)[0] == 'thumbnails':
+                if name.startswith('thumb_'):
+                    thumbnails[name[6:]] = size
+            else:
+                originals[name] = size
+
+        updates = []
+        query = db.session.query(Photo.id, Photo.filename, Photo.file_size, Photo.thumbnail_size) \
+            .order_by(Photo.id).execution_options(yield_per=RECONCILE_BATCH_SIZE)
+        for photo_id, filename, file_size, thumbnail_size in query:
+            actual_size = originals.get(filename, 0)
+            actual_thumb = thumbnails.get(filename, 0)
+            if actual_size != file_size or actual_thumb != thumbnail_size:
+                updates.append({'id': photo_id, 'file_size': actual_size, 'thumbnail_size': actual_thumb})
+
+        for start in range(0, len(updates), RECONCILE_BATCH_SIZE):
+            db.session.bulk_update_mappings(Photo, updates[start:start + RECONCILE_BATCH_SIZE])
+
+        rebuild_storage_counters()
+
+        db.session.query(StorageCounter).filter(StorageCounter.scope == SCOPE_DISK).delete()
+        db.session.add(StorageCounter(scope=SCOPE_DISK, scope_id=0, bytes=disk_bytes, files=disk_files))
+        db.session.commit()
+
+        _last_reconcile['finished_at'] = datetime.utcnow()
+        _last_reconcile['duration'] = round(time.time() - started, 3)
+        _last_reconcile['updated_photos'] = len(updates)
+        return len(updates)
+
+
+def get_storage_stats():
+    """读取计数器，返回存储用量统计"""
+    counters = {(c.scope, c.scope_id): c for c in StorageCounter.query.all()}
+
+    def describe(counter):
+        size = counter.bytes if counter else 0
+        return {
+            'bytes': size,
+            'files': counter.files if counter else 0,
+            'size': format_file_size(size)
+        }
+
+    albums = []
+    for album_id, name in db.session.query(Album.id, Album.name).order_by(Album.id):
+        item = describe(counters.get((SCOPE_ALBUM, album_id)))
+        item.update({'id': album_id, 'name': name})
+        albums.append(item)
+
+    events = []
+    for event_id, title in db.session.query(Event.id, Event.title).order_by(Event.date.desc()):
+        item = describe(counters.get((SCOPE_EVENT, event_id)))
+        item.update({'id': event_id, 'title': title})
+        events.append(item)
+
+    disk = counters.get((SCOPE_DISK, 0))
+    finished_at = _last_reconcile['finished_at']
+    return {
+        'total': describe(counters.get((SCOPE_TOTAL, 0))),
+        'disk': describe(disk) if disk else None,
+        'albums': albums,
+        'events': events,
+        'last_reconciled_at': finished_at.isoformat() if finished_at else (
+            disk.updated_at.isoformat() if disk and disk.updated_at else None
+        )
+    }
+
+
+def start_storage_reconciler(app, interval, initial_delay=60):
+    """
+    启动后台对账线程
+
+    interval为对账间隔（秒），小于等于0时不启动
+    """
+    if not interval or interval <= 0:
+        return None
+
+    def run():
+        # 从未对账过的数据库（例如刚升级表结构）立即对账一次，否则延迟启动以免拖慢启动
+        with app.app_context():
+            reconciled = db.session.query(StorageCounter.scope) \
+                .filter(StorageCounter.scope == SCOPE_DISK).first() is not None
+            db.session.remove()
+        if reconciled:
+            time.sleep(initial_delay)
+        while True:
+            try:
+                with app.app_context():
+                    updated = reconcile_storage(app.config['UPLOAD_FOLDER'])
+                    if updated:
+                        print(f"存储用量对账完成，修正了 {updated} 张照片的记录")
+            except Exception as e:
+                print(f"存储用量对账失败: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='storage-reconciler', daemon=True)
+    thread.start()
+    return thread
+
+
+# ===== 后台文件清理 =====
+
+# 待删除的(上传目录, 文件名)。进程退出时尚未删除的文件成为孤立文件，
+# 由存储对账计入磁盘占用，可通过孤立文件清理删除
+_file_deletions = queue.Queue()
+_deletion_thread = None
+_deletion_thread_lock = threading.Lock()
+
+
+def _run_file_deletions():
+    while True:
+        upload_folder, filename = _file_deletions.get()
+        try:
+            delete_photo_files(filename, upload_folder)
+        finally:
+            _file_deletions.task_done()
+
+
+def enqueue_file_deletions(upload_folder, filenames):
+    """把照片文件（原图和缩略图）加入后台删除队列，应在数据库事务提交之后调用"""
+    global _deletion_thread
+
+    with _deletion_thread_lock:
+        if _deletion_thread is None:
+            _deletion_thread = threading.Thread(target=_run_file_deletions, name='file-deletions', daemon=True)
+            _deletion_thread.start()
+    for filename in filenames:
+        _file_deletions.put((upload_folder, filename))
+
+
+def pending_file_deletions():
+    """后台队列中尚未删除的照片数量"""
+    return _file_deletions.unfinished_tasks
+
+
+# ===== 按需生成缩略图的用量记录 =====
+
+# 等待写入的缩略图大小，按应用分开 {应用: {照片文件名: 字节数}}（同一进程中可能有多个应用，
+# 例如基准测试依次创建不同规模的照片库）。进程退出时尚未写入的由存储对账修正
+_rendition_sizes = {}
+_rendition_sizes_changed = threading.Condition()
+_rendition_thread = None
+
+
+def record_rendition_sizes(sizes):
+    """
+    在一个事务中写入一批缩略图大小（{照片文件名: 字节数}）并调整计数器
+
+    缓存不依赖缩略图大小，写入照片表时不使照片相关的缓存失效
+    """
+    filenames = list(sizes)
+    for start in range(0, len(filenames), RECONCILE_BATCH_SIZE):
+        rows = db.session.query(Photo.id, Photo.filename, Photo.thumbnail_size, Photo.album_id, Photo.event_id) \
+            .filter(Photo.filename.in_(filenames[start:start + RECONCILE_BATCH_SIZE])).all()
+        for photo_id, filename, old_size, album_id, event_id in rows:
+            size = sizes[filename] or 0
+            delta_bytes = size - (old_size or 0)
+            delta_files = int(bool(size)) - int(bool(old_size))
+            if not delta_bytes and not delta_files:
+                continue
+            db.session.execute(
+                update(Photo).where(Photo.id == photo_id).values(thumbnail_size=size)
+                .execution_options(invalidates_cache=False)
+            )
+            adjust_storage_usage(delta_bytes, delta_files, album_id, event_id)
+    db.session.commit()
+
+
+def _run_rendition_updates():
+    while True:
+        with _rendition_sizes_changed:
+            _rendition_sizes_changed.wait_for(lambda: _rendition_sizes)
+        # 等待一段时间，把随后生成的缩略图合并到同一个事务中
+        time.sleep(RENDITION_FLUSH_DELAY)
+        with _rendition_sizes_changed:
+            batches = dict(_rendition_sizes)
+            _rendition_sizes.clear()
+        for app, sizes in batches.items():
+            try:
+                with app.app_context():
+                    record_rendition_sizes(sizes)
+            except Exception as e:
+                print(f"记录缩略图大小失败（将由存储对账修正）: {e}")
+
+
+def enqueue_rendition_size(app, filename, size):
+    """记录请求中按需生成的缩略图大小，由后台线程批量写入app的数据库，请求本身不写数据库"""
+    global _rendition_thread
+
+    with _rendition_sizes_changed:
+        _rendition_sizes.setdefault(app, {})[filename] = size
+        if _rendition_thread is None:
+            _rendition_thread = threading.Thread(target=_run_rendition_updates,
+                                                 name='rendition-sizes', daemon=True)
+            _rendition_thread.start()
+        _rendition_sizes_changed.notify()
+
+
+def pending_rendition_updates():
+    """等待写入的缩略图大小数量"""
+    with _rendition_sizes_changed:
+        return sum(len(sizes) for sizes in _rendition_sizes.values())
+
+
+@metrics.register_collector
+def _collect_pending_deletions(data):
+    return [
+        ('love_story_pending_file_deletions', (), pending_file_deletions()),
+        ('love_story_pending_rendition_updates', (), pending_rendition_updates()),
+    ]
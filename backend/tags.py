@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+
+"""
+恋爱故事记录应用 - 标签批量操作
+
+标签名通过一次IN查询解析为ID，缺失的标签用INSERT OR IGNORE批量创建，
+photo_tags关联行用executemany一次写入。所有函数只写入当前会话，由调用方负责提交。
+
+标签联想使用进程内的有序索引（按名称排序的数组，二分查找前缀范围），
+标签或关联变化后随缓存版本失效，下次查询时重建。
+
+标签查询表达式（AND/OR/NOT）解析为语法树后编译为photo_tags上的子查询，
+在数据库中完成集合运算。
+"""
+
+import re
+import heapq
+import math
+from bisect import bisect_left
+
+from sqlalchemy import select, exists, func, and_, or_, not_, true, false
+
+from backend.cache import get_or_build
+from backend.models import db, Photo, Tag, photo_tags
+
+# 每条IN查询携带的参数数量上限（SQLite默认限制为999个变量）
+IN_CHUNK_SIZE = 500
+
+# 标签名的最大长度（与Tag.name列一致）
+MAX_TAG_LENGTH = 100
+
+
+def _chunks(values, size=IN_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def normalize_tag_names(names):
+    """去掉空白、空值和重复的标签名，保持原有顺序"""
+    result = []
+    seen = set()
+    for name in names or []:
+        if not isinstance(name, str):
+            continue
+        name = name.strip()[:MAX_TAG_LENGTH]
+        if name and name not in seen:
+            seen.add(name)
+            result.append(name)
+    return result
+
+
+def _select_tag_ids(names):
+    """按名称查询已有标签，返回{名称: ID}"""
+    found = {}
+    for chunk in _chunks(names):
+        rows = db.session.execute(select(Tag.name, Tag.id).where(Tag.name.in_(chunk)))
+        found.update(rows.all())
+    return found
+
+
+def resolve_tag_ids(names, create=True):
+    """
+    把标签名解析为ID，返回{名称: ID}
+
+    一次IN查询取回已有标签；create为True时用INSERT OR IGNORE批量创建缺失的标签
+    （并发创建同名标签时不会报错），再查询一次新标签的ID
+    """
+    names = normalize_tag_names(names)
+    if not names:
+        return {}
+
+    found = _select_tag_ids(names)
+    missing = [name for name in names if name not in found]
+    if missing and create:
+        db.session.execute(
+            Tag.__table__.insert().prefix_with('OR IGNORE'),
+            [{'name': name} for name in missing]
+        )
+        found.update(_select_tag_ids(missing))
+    return found
+
+
+def get_or_create_tags(names):
+    """批量获取或创建标签，按names的顺序返回Tag对象列表（用于单张照片的ORM写入）"""
+    names = normalize_tag_names(names)
+    ids = resolve_tag_ids(names)
+    if not ids:
+        return []
+    tags = {tag.name: tag for tag in Tag.query.filter(Tag.id.in_(list(ids.values())))}
+    return [tags[name] for name in names if name in tags]
+
+
+def existing_photo_ids(photo_ids):
+    """过滤掉不存在的照片ID，保持原有顺序并去重"""
+    ids = []
+    seen = set()
+    for photo_id in photo_ids or []:
+        if isinstance(photo_id, int) and not isinstance(photo_id, bool) and photo_id not in seen:
+            seen.add(photo_id)
+            ids.append(photo_id)
+
+    existing = set()
+    for chunk in _chunks(ids):
+        existing.update(db.session.execute(select(Photo.id).where(Photo.id.in_(chunk))).scalars())
+    return [photo_id for photo_id in ids if photo_id in existing]
+
+
+def add_tags_to_photos(photo_ids, names):
+    """
+    给一组照片添加标签，返回新增的关联数量
+
+    已有的关联通过INSERT OR IGNORE跳过，所有关联行用一次executemany写入
+    """
+    tag_ids = list(resolve_tag_ids(names).values())
+    if not photo_ids or not tag_ids:
+        return 0
+    result = db.session.execute(
+        photo_tags.insert().prefix_with('OR IGNORE'),
+        [{'photo_id': photo_id, 'tag_id': tag_id} for photo_id in photo_ids for tag_id in tag_ids]
+    )
+    return max(result.rowcount, 0)
+
+
+def remove_tags_from_photos(photo_ids, names):
+    """从一组照片中移除标签（不存在的标签直接忽略），返回删除的关联数量"""
+    tag_ids = list(resolve_tag_ids(names, create=False).values())
+    if not photo_ids or not tag_ids:
+        return 0
+    removed = 0
+    # 照片ID和标签ID共用一条语句的参数额度
+    for chunk in _chunks(photo_ids, max(1, IN_CHUNK_SIZE - len(tag_ids))):
+        result = db.session.execute(
+            photo_tags.delete()
+            .where(photo_tags.c.photo_id.in_(chunk))
+            .where(photo_tags.c.tag_id.in_(tag_ids))
+        )
+        removed += max(result.rowcount, 0)
+    return removed
+
+
+# ===== 标签联想和标签云 =====
+
+# 标签索引依赖的数据表（删除照片通过触发器修改的标签使用次数见models中登记的删除级联）
+TAG_INDEX_TABLES = ('tag', 'photo_tags')
+
+# 前缀范围内的标签数量超过该值时，改为按使用次数从高到低扫描
+PREFIX_SCAN_LIMIT = 2000
+
+# 标签云的权重等级数
+CLOUD_WEIGHT_LEVELS = 5
+
+
+class TagIndex:
+    """标签名的有序索引，按不区分大小写的名称排序，另外保存按使用次数排序的列表"""
+
+    def __init__(self, rows):
+        rows = sorted(((name.casefold(), name, count or 0) for name, count in rows),
+                      key=lambda row: row[0])
+        self.keys = [row[0] for row in rows]
+        self.names = [row[1] for row in rows]
+        self.counts = [row[2] for row in rows]
+        # 使用次数相同的按名称排序，与前缀查询的结果顺序一致
+        self.by_usage = sorted(range(len(rows)), key=lambda i: -self.counts[i])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def suggest(self, prefix, limit):
+        """返回以prefix开头、使用次数最多的limit个标签的下标"""
+        prefix = prefix.casefold()
+        if not prefix:
+            return self.by_usage[:limit]
+
+        low = bisect_left(self.keys, prefix)
+        high = bisect_left(self.keys, prefix + '\U0010ffff', low)
+        if high - low <= PREFIX_SCAN_LIMIT:
+            return heapq.nlargest(limit, range(low, high), key=self.counts.__getitem__)
+
+        # 前缀很短、匹配的标签很多时，热门标签通常很快就能凑满
+        result = []
+        for i in self.by_usage:
+            if self.keys[i].startswith(prefix):
+                result.append(i)
+                if len(result) >= limit:
+                    break
+        return result
+
+    def item(self, i):
+        return {'name': self.names[i], 'usage_count': self.counts[i]}
+
+
+def _build_tag_index():
+    return TagIndex(db.session.execute(select(Tag.name, Tag.usage_count)).all())
+
+
+def get_tag_index():
+    """获取标签索引（写入后自动失效并在下次调用时重建）"""
+    return get_or_build('tag_index', TAG_INDEX_TABLES, _build_tag_index)
+
+
+def suggest_tags(prefix, limit=10):
+    """按前缀联想标签，按使用次数从高到低返回"""
+    index = get_tag_index()
+    return [index.item(i) for i in index.suggest(prefix or '', limit)]
+
+
+def tag_cloud(limit=50):
+    """
+    使用次数最多的标签，按名称排序返回
+
+    weight为1到CLOUD_WEIGHT_LEVELS的权重等级，按使用次数的对数划分
+    """
+    index = get_tag_index()
+    items = [index.item(i) for i in index.by_usage[:limit] if index.counts[i] > 0]
+    if not items:
+        return []
+
+    low = math.log(min(item['usage_count'] for item in items))
+    high = math.log(max(item['usage_count'] for item in items))
+    for item in items:
+        if high > low:
+            ratio = (math.log(item['usage_count']) - low) / (high - low)
+            item['weight'] = 1 + round(ratio * (CLOUD_WEIGHT_LEVELS - 1))
+        else:
+            item['weight'] = (CLOUD_WEIGHT_LEVELS + 1) // 2
+    items.sort(key=lambda item: item['name'].casefold())
+    return items
+
+
+# ===== 标签查询表达式 =====
+
+# 表达式中最多包含的标签数量和括号嵌套层数
+MAX_QUERY_TAGS = 32
+MAX_QUERY_DEPTH = 8
+
+_TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|([^\s()"]+))')
+_KEYWORDS = {'AND', 'OR', 'NOT'}
+
+
+def _tokenize(text):
+    """把表达式拆分为(类型, 值)列表，类型为'(' ')' 'AND' 'OR' 'NOT'或'TAG'"""
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN_PATTERN.match(text, position)
+        if not match:
+            raise ValueError(f'标签表达式第{position + 1}个字符附近有未闭合的引号')
+        position = match.end()
+        open_paren, close_paren, quoted, word = match.groups()
+        if open_paren:
+            tokens.append(('(', None))
+        elif close_paren:
+            tokens.append((')', None))
+        elif quoted is not None:
+            # 加引号的标签名可以包含空格、括号或与关键字同名
+            name = quoted.strip()[:MAX_TAG_LENGTH]
+            if not name:
+                raise ValueError('标签表达式中有空的标签名')
+            tokens.append(('TAG', name))
+        elif word.upper() in _KEYWORDS:
+            tokens.append((word.upper(), None))
+        else:
+            tokens.append(('TAG', word[:MAX_TAG_LENGTH]))
+    return tokens
+
+
+class _TagQueryParser:
+    """
+    递归下降解析器，优先级从高到低为NOT、AND、OR；相邻的两个条件之间省略AND
+
+    语法树节点为('tag', 名称)、('not', 子节点)、('and', [子节点])、('or', [子节点])
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+        self.depth = 0
+        self.tag_count = 0
+
+    def peek(self):
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self):
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise ValueError('标签表达式中有多余的右括号')
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == 'OR':
+            self.take()
+            children.append(self.parse_and())
+        return _combine('or', children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek() in ('AND', 'NOT', 'TAG', '('):
+            if self.peek() == 'AND':
+                self.take()
+            children.append(self.parse_not())
+        return _combine('and', children)
+
+    def parse_not(self):
+        if self.peek() == 'NOT':
+            self.take()
+            return ('not', self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind = self.peek()
+        if kind is None:
+            raise ValueError('标签表达式不完整')
+        kind, value = self.take()
+        if kind == 'TAG':
+            self.tag_count += 1
+            if self.tag_count > MAX_QUERY_TAGS:
+                raise ValueError(f'标签表达式最多包含{MAX_QUERY_TAGS}个标签')
+            return ('tag', value)
+        if kind == '(':
+            self.depth += 1
+            if self.depth > MAX_QUERY_DEPTH:
+                raise ValueError(f'标签表达式的括号最多嵌套{MAX_QUERY_DEPTH}层')
+            node = self.parse_or()
+            if self.peek() != ')':
+                raise ValueError('标签表达式缺少右括号')
+            self.take()
+            self.depth -= 1
+            return node
+        raise ValueError(f'标签表达式中{kind}的位置不正确')
+
+
+def _combine(kind, children):
+    """合并同类的嵌套节点，例如(a AND b) AND c合并为一个包含三个子节点的AND"""
+    if len(children) == 1:
+        return children[0]
+    flat = []
+    for child in children:
+        flat.extend(child[1] if child[0] == kind else [child])
+    return (kind, flat)
+
+
+def parse_tag_query(text):
+    """
+    解析标签查询表达式，例如 海边 AND 日落 NOT 2019、(猫 OR 狗) -> 语法树
+
+    关键字AND、OR、NOT不区分大小写，包含空格或与关键字同名的标签名用双引号括起来。
+    表达式为空时返回None，语法错误时抛出ValueError
+    """
+    tokens = _tokenize(text or '')
+    if not tokens:
+        return None
+    return _TagQueryParser(tokens).parse()
+
+
+def tag_query_names(tree):
+    """表达式中出现的所有标签名"""
+    if tree[0] == 'tag':
+        return {tree[1]}
+    if tree[0] == 'not':
+        return tag_query_names(tree[1])
+    names = set()
+    for child in tree[1]:
+        names |= tag_query_names(child)
+    return names
+
+
+def _negated_tag(node):
+    return node[0] == 'not' and node[1][0] == 'tag'
+
+
+def _photos_with_any(tag_ids):
+    """带有任意一个标签的照片ID子查询，通过(tag_id, photo_id)索引按标签范围扫描"""
+    return select(photo_tags.c.photo_id).where(photo_tags.c.tag_id.in_(tag_ids))
+
+
+def _photos_with_none(tag_ids):
+    """不带有这些标签中任何一个的照片（NOT EXISTS反连接）"""
+    return ~exists().where(photo_tags.c.photo_id == Photo.id, photo_tags.c.tag_id.in_(tag_ids))
+
+
+def _compile(node, ids):
+    kind = node[0]
+    if kind == 'tag':
+        tag_id = ids.get(node[1])
+        return Photo.id.in_(_photos_with_any([tag_id])) if tag_id else false()
+
+    if kind == 'not':
+        if node[1][0] == 'tag':
+            tag_id = ids.get(node[1][1])
+            return _photos_with_none([tag_id]) if tag_id else true()
+        return not_(_compile(node[1], ids))
+
+    children = node[1]
+    plain = [child[1] for child in children if child[0] == 'tag']
+    negated = [child[1][1] for child in children if _negated_tag(child)]
+    others = [_compile(child, ids) for child in children
+              if child[0] != 'tag' and not _negated_tag(child)]
+
+    if kind == 'and':
+        if any(name not in ids for name in plain):
+            return false()
+        conditions = []
+        tag_ids = {ids[name] for name in plain}
+        if len(tag_ids) == 1:
+            conditions.append(Photo.id.in_(_photos_with_any(tag_ids)))
+        elif tag_ids:
+            # 交集: 每张照片在这些标签中命中的关联行数等于标签数
+            conditions.append(Photo.id.in_(
+                _photos_with_any(tag_ids)
+                .group_by(photo_tags.c.photo_id)
+                .having(func.count() == len(tag_ids))
+            ))
+        # NOT a AND NOT b 等价于 NOT (a OR b)，合并为一次反连接
+        excluded = {ids[name] for name in negated if name in ids}
+        if excluded:
+            conditions.append(_photos_with_none(excluded))
+        return and_(true(), *conditions, *others)
+
+    # OR: 普通标签合并为一次IN查询；缺失的标签不会匹配任何照片
+    conditions = []
+    tag_ids = {ids[name] for name in plain if name in ids}
+    if tag_ids:
+        conditions.append(Photo.id.in_(_photos_with_any(tag_ids)))
+    for name in negated:
+        conditions.append(_photos_with_none([ids[name]]) if name in ids else true())
+    return or_(false(), *conditions, *others)
+
+
+def tag_query_filter(tree):
+    """
+    把表达式语法树编译为照片查询的过滤条件
+
+    AND的多个标签编译为GROUP BY photo_id HAVING COUNT(*) = n的子查询，NOT编译为
+    NOT EXISTS反连接，OR的多个标签合并为tag_id IN (...)。不存在的标签视为没有照片带有该标签
+    """
+    return _compile(tree, resolve_tag_ids(tag_query_names(tree), create=False))
@@ -1,9 +1,14 @@
+import io
 import os
+import time
 import uuid
+import base64
+import hashlib
 import datetime
-import shutil
-from PIL import Image
+import sqlite3
 from flask import current_app
+from backend import metrics
+from backend.imaging import inspect_image, open_image_limited, open_animation_limited
 
 # 从环境变量获取数据目录，默认为当前目录
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -29,6 +34,92 @@ def ensure_upload_directory_exists(app=None):
     
     return uploads_dir
 
+# 计算文件的分片目录
+def get_shard_dir(filename):
+    """
+    根据文件名的哈希计算两级分片目录，例如 ab/cd
+
+    每级256个目录，单个目录中的文件数量保持在较小规模，
+    目录列举和备份工具在照片很多时也不会变慢
+    """
+    digest = hashlib.md5(filename.encode('utf-8')).hexdigest()
+    return os.path.join(digest[:2], digest[2:4])
+
+# 获取原图在磁盘上的路径
+def get_photo_path(upload_folder, filename):
+    """
+    获取原图文件的完整路径（分片布局，新文件写入这里）
+    """
+    return os.path.join(upload_folder, get_shard_dir(filename), filename)
+
+# 获取缩略图在磁盘上的路径
+def get_thumbnail_path(upload_folder, filename):
+    """
+    获取原图对应缩略图的完整路径（分片布局，新缩略图写入这里）
+    """
+    return os.path.join(upload_folder, 'thumbnails', get_shard_dir(filename), f"thumb_{filename}")
+
+# 获取动图预览在磁盘上的路径
+def get_animation_path(upload_folder, filename):
+    """
+    获取动图缩小后的预览动画路径（与缩略图放在同一分片目录）
+    """
+    return os.path.join(upload_folder, 'thumbnails', get_shard_dir(filename), f"anim_{filename}")
+
+# 旧版平铺布局下的路径
+def get_legacy_photo_path(upload_folder, filename):
+    """
+    获取旧版平铺布局下原图的路径
+    """
+    return os.path.join(upload_folder, filename)
+
+def get_legacy_thumbnail_path(upload_folder, filename):
+    """
+    获取旧版平铺布局下缩略图的路径
+    """
+    return os.path.join(upload_folder, 'thumbnails', f"thumb_{filename}")
+
+# 依次检查分片路径和旧路径
+def _resolve_layout_path(sharded_path, legacy_path):
+    """
+    返回文件实际所在的路径，优先分片布局，其次旧版平铺布局，都不存在时返回None
+
+    旧路径不存在时再检查一次分片路径：迁移可能恰好在两次检查之间把文件从旧路径移到了分片路径
+    """
+    for path in (sharded_path, legacy_path, sharded_path):
+        if os.path.isfile(path):
+            return path
+    return None
+
+# 查找原图实际所在的路径
+def resolve_photo_path(upload_folder, filename):
+    """
+    查找原图实际所在的路径，优先分片布局，其次旧版平铺布局
+    两处都不存在时返回None
+    """
+    return _resolve_layout_path(get_photo_path(upload_folder, filename),
+                                get_legacy_photo_path(upload_folder, filename))
+
+# 查找缩略图实际所在的路径
+def resolve_thumbnail_path(upload_folder, filename):
+    """
+    查找原图对应缩略图实际所在的路径，两处都不存在时返回None
+    """
+    return _resolve_layout_path(get_thumbnail_path(upload_folder, filename),
+                                get_legacy_thumbnail_path(upload_folder, filename))
+
+# 获取文件大小
+def get_file_size(path):
+    """
+    获取文件大小（字节），文件不存在时返回0
+    """
+    if not path:
+        return 0
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
 # 生成唯一的文件名
 def generate_unique_filename(original_filename):
     """
@@ -63,55 +154,388 @@ def process_uploaded_photo(file, original_filename, upload_folder):
     """
     处理上传的照片，包括重命名、保存和生成缩略图
     """
+    filename = save_uploaded_file(file, original_filename, upload_folder)
+    try:
+        return process_saved_photo(filename, original_filename, upload_folder)
+    except Exception:
+        delete_photo_files(filename, upload_folder)
+        raise
+
+# 保存上传的原图
+def save_uploaded_file(file, original_filename, upload_folder):
+    """
+    以唯一文件名保存上传的原图，返回生成的文件名
+    """
     # 生成唯一文件名
     filename = generate_unique_filename(original_filename)
     
     # 保存原始图片路径
-    file_path = os.path.join(upload_folder, filename)
+    file_path = get_photo_path(upload_folder, filename)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
     
-    # 保存文件
+    # 保存文件（记录上传吞吐）
+    started = time.perf_counter()
     file.save(file_path)
+    metrics.inc('love_story_upload_seconds_total', time.perf_counter() - started)
+    metrics.inc('love_story_upload_bytes_total', get_file_size(file_path))
+    return filename
+
+# 处理已保存的原图
+def process_saved_photo(filename, original_filename, upload_folder):
+    """
+    提取已保存原图的元数据并生成缩略图（可以在后台任务中执行）
+
+    图片超出解码限制时抛出ImageRejected
+    """
+    file_path = get_photo_path(upload_folder, filename)
+    
+    # 解码前先检查尺寸和帧数，拒绝解压炸弹
+    inspect_image(file_path)
     
-    # 生成缩略图
+    # 提取EXIF元数据（只读取文件头）
+    metadata = extract_image_metadata(file_path)
+    
+    # 生成缩略图，再从缩略图生成占位图（解码缩略图比解码原图快得多）
     thumbnail_path = create_thumbnail(file_path, upload_folder)
+    placeholder = create_placeholder(thumbnail_path or file_path)
     
     return {
         'filename': filename,
         'original_name': original_filename,
         'file_path': file_path,
-        'thumbnail_path': thumbnail_path
+        'thumbnail_path': thumbnail_path,
+        'file_size': get_file_size(file_path),
+        'thumbnail_size': get_file_size(thumbnail_path),
+        'placeholder': placeholder,
+        'metadata': metadata
     }
 
+# EXIF标签编号
+EXIF_TAG_MAKE = 0x010F
+EXIF_TAG_MODEL = 0x0110
+EXIF_TAG_ORIENTATION = 0x0112
+EXIF_TAG_DATETIME = 0x0132
+EXIF_IFD_POINTER = 0x8769
+EXIF_TAG_DATETIME_ORIGINAL = 0x9003
+EXIF_TAG_DATETIME_DIGITIZED = 0x9004
+GPS_IFD_POINTER = 0x8825
+
+def _parse_exif_date(value):
+    """
+    解析EXIF日期字符串（格式为 YYYY:MM:DD HH:MM:SS），无效时返回None
+    """
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.datetime.strptime(value.strip()[:10], '%Y:%m:%d').date()
+    except ValueError:
+        return None
+    # 相机未设置时间时常见的0000:00:00或1970年之前的值都视为无效
+    if parsed.year < 1900:
+        return None
+    return parsed
+
+def _parse_gps_coordinate(value, ref):
+    """
+    把EXIF中的度分秒转换为十进制度数
+    """
+    try:
+        degrees, minutes, seconds = (float(part) for part in value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    coordinate = degrees + minutes / 60.0 + seconds / 3600.0
+    if ref in ('S', 'W'):
+        coordinate = -coordinate
+    return round(coordinate, 7)
+
+def _clean_exif_text(value):
+    """
+    清理EXIF中的字符串（去掉结尾的空字符和空格）
+    """
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', errors='ignore')
+    if not isinstance(value, str):
+        return None
+    value = value.replace('\x00', '').strip()
+    return value[:100] or None
+
+# 提取图片元数据
+def extract_image_metadata(image_path):
+    """
+    从图片文件头中提取尺寸、拍摄日期、方向、相机型号和GPS坐标
+
+    Image.open只解析文件头，getexif读取的也是文件头中的EXIF段，
+    整个过程不会解码像素数据。提取失败时返回只包含尺寸（可能为0）的结果。
+    """
+    metadata = {
+        'width': 0,
+        'height': 0,
+        'orientation': None,
+        'date_taken': None,
+        'camera_make': None,
+        'camera_model': None,
+        'latitude': None,
+        'longitude': None,
+        'frame_count': 1
+    }
+    
+    # Pillow导入较慢，只在真正处理图片时加载，缩短应用启动时间
+    from PIL import Image
+    
+    try:
+        with Image.open(image_path) as img:
+            metadata['width'], metadata['height'] = img.size
+            metadata['frame_count'] = getattr(img, 'n_frames', 1)
+            exif = img.getexif()
+            if not exif:
+                return metadata
+            
+            orientation = exif.get(EXIF_TAG_ORIENTATION)
+            if isinstance(orientation, int) and 1 <= orientation <= 8:
+                metadata['orientation'] = orientation
+            metadata['camera_make'] = _clean_exif_text(exif.get(EXIF_TAG_MAKE))
+            metadata['camera_model'] = _clean_exif_text(exif.get(EXIF_TAG_MODEL))
+            
+            # 拍摄时间优先使用DateTimeOriginal，其次是数字化时间和修改时间
+            exif_ifd = exif.get_ifd(EXIF_IFD_POINTER)
+            metadata['date_taken'] = (
+                _parse_exif_date(exif_ifd.get(EXIF_TAG_DATETIME_ORIGINAL)) or
+                _parse_exif_date(exif_ifd.get(EXIF_TAG_DATETIME_DIGITIZED)) or
+                _parse_exif_date(exif.get(EXIF_TAG_DATETIME))
+            )
+            
+            # GPS信息：1/2为纬度参考和纬度，3/4为经度参考和经度
+            gps_ifd = exif.get_ifd(GPS_IFD_POINTER)
+            if gps_ifd:
+                latitude = _parse_gps_coordinate(gps_ifd.get(2), gps_ifd.get(1))
+                longitude = _parse_gps_coordinate(gps_ifd.get(4), gps_ifd.get(3))
+                if latitude is not None and longitude is not None \
+                        and -90 <= latitude <= 90 and -180 <= longitude <= 180:
+                    metadata['latitude'] = latitude
+                    metadata['longitude'] = longitude
+    except Exception as e:
+        print(f"读取图片元数据失败 {image_path}: {e}")
+    
+    return metadata
+
+# 把提取的元数据写入照片记录
+def apply_photo_metadata(photo, metadata):
+    """
+    把extract_image_metadata的结果写入照片记录
+
+    已有的拍摄日期（例如用户手动填写的）不会被EXIF覆盖
+    """
+    if not metadata:
+        return photo
+    
+    for field in ('width', 'height', 'orientation', 'camera_make',
+                  'camera_model', 'latitude', 'longitude', 'frame_count'):
+        setattr(photo, field, metadata.get(field))
+    
+    if photo.date_taken is None and metadata.get('date_taken'):
+        photo.date_taken = metadata['date_taken']
+    
+    return photo
+
+# 为已有照片批量补齐元数据
+def backfill_photo_metadata(db, upload_folder, batch_size=200, only_missing=True, progress=None):
+    """
+    按批提取已有照片的EXIF元数据
+
+    参数:
+    - only_missing: 只处理尚未提取过元数据的照片（width或frame_count为空）
+    - progress: 进度回调，参数为(已处理数量, 总数量)
+
+    返回处理的照片数量
+    """
+    from sqlalchemy import or_
+    from backend.models import Photo  # 避免循环导入
+    
+    base_query = db.session.query(Photo)
+    if only_missing:
+        base_query = base_query.filter(or_(Photo.width.is_(None), Photo.frame_count.is_(None)))
+    total = base_query.count()
+    
+    processed = 0
+    last_id = 0
+    while True:
+        batch = base_query.filter(Photo.id > last_id).order_by(Photo.id).limit(batch_size).all()
+        if not batch:
+            break
+        
+        for photo in batch:
+            last_id = photo.id
+            image_path = resolve_photo_path(upload_folder, photo.filename)
+            if image_path:
+                apply_photo_metadata(photo, extract_image_metadata(image_path))
+            else:
+                # 文件丢失时标记为已处理，避免每次都重试
+                photo.width = photo.width or 0
+                photo.height = photo.height or 0
+                photo.frame_count = photo.frame_count or 1
+        
+        db.session.commit()
+        processed += len(batch)
+        if progress:
+            progress(processed, total)
+    
+    return processed
+
 # 创建缩略图
 def create_thumbnail(image_path, upload_folder):
     """
     为图片创建缩略图
+
+    先写入同目录下的临时文件再原子替换，并发读取或生成时不会看到写了一半的文件
     """
     # 缩略图大小
     thumbnail_size = (300, 200)
     
-    # 缩略图保存路径
-    thumbnails_dir = os.path.join(upload_folder, 'thumbnails')
-    if not os.path.exists(thumbnails_dir):
-        os.makedirs(thumbnails_dir)
-    
     # 文件名
     filename = os.path.basename(image_path)
-    thumbnail_path = os.path.join(thumbnails_dir, f"thumb_{filename}")
     
+    # 缩略图保存路径
+    thumbnail_path = get_thumbnail_path(upload_folder, filename)
+    os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+    
+    from PIL import Image
+    
+    temp_path = None
     try:
-        # 打开图片
-        with Image.open(image_path) as img:
+        started = time.perf_counter()
+        
+        # 临时文件的扩展名不是图片格式，需要按最终文件名指定保存格式
+        image_format = Image.registered_extensions().get(os.path.splitext(thumbnail_path)[1].lower())
+        temp_path = f"{thumbnail_path}.{uuid.uuid4().hex}.tmp"
+        
+        # 在解码限制内打开图片（动图只取第一帧）
+        with open_image_limited(image_path, thumbnail_size) as img:
             # 创建缩略图（保持宽高比）
             img.thumbnail(thumbnail_size)
             
             # 保存缩略图
-            img.save(thumbnail_path)
-            
-            return thumbnail_path
+            img.save(temp_path, format=image_format)
+        os.replace(temp_path, thumbnail_path)
+        
+        metrics.observe('love_story_thumbnail_generation_seconds', time.perf_counter() - started)
+        return thumbnail_path
     except Exception as e:
         # 如果缩略图创建失败，返回None
         print(f"创建缩略图失败: {e}")
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+
+# 占位图的最大边长（像素）
+PLACEHOLDER_SIZE = 16
+
+# 创建占位图
+def create_placeholder(image_path):
+    """
+    生成列表中内联返回的极小占位图（16像素WebP的data URI，约200字节）
+
+    前端在缩略图加载完成前把它拉伸并模糊显示。生成失败时返回None
+    """
+    if not image_path:
+        return None
+    try:
+        with open_image_limited(image_path, (PLACEHOLDER_SIZE, PLACEHOLDER_SIZE)) as img:
+            small = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+        buffer = io.BytesIO()
+        small.save(buffer, format='WEBP', quality=30)
+        return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+    except Exception as e:
+        print(f"创建占位图失败 {image_path}: {e}")
+        return None
+
+# 为已有照片批量生成占位图
+def backfill_photo_placeholders(db, upload_folder, batch_size=200, progress=None):
+    """
+    按批为还没有占位图的照片生成占位图，优先使用缩略图
+
+    参数:
+    - progress: 进度回调，参数为(已处理数量, 总数量)
+
+    返回处理的照片数量
+    """
+    from backend.models import Photo  # 避免循环导入
+    
+    base_query = db.session.query(Photo).filter(Photo.placeholder.is_(None))
+    total = base_query.count()
+    
+    processed = 0
+    last_id = 0
+    while True:
+        batch = base_query.filter(Photo.id > last_id).order_by(Photo.id).limit(batch_size).all()
+        if not batch:
+            break
+        
+        for photo in batch:
+            last_id = photo.id
+            image_path = resolve_thumbnail_path(upload_folder, photo.filename) or \
+                resolve_photo_path(upload_folder, photo.filename)
+            # 文件丢失或无法解码时记为空字符串，避免每次都重试
+            photo.placeholder = create_placeholder(image_path) or ''
+        
+        db.session.commit()
+        processed += len(batch)
+        if progress:
+            progress(processed, total)
+    
+    return processed
+
+# 动图预览的最大尺寸和最多保留的帧数
+ANIMATION_PREVIEW_SIZE = (480, 320)
+ANIMATION_PREVIEW_MAX_FRAMES = int(os.environ.get('LOVE_STORY_ANIMATION_MAX_FRAMES', 60))
+
+# 创建动图预览
+def create_animation_preview(image_path, upload_folder):
+    """
+    为动图（GIF/WebP）生成缩小尺寸、限制帧数的预览动画
+
+    帧数超过上限时均匀抽帧，跳过的帧的时长累加到前一个保留的帧上，播放总时长不变。
+    不是动图或生成失败时返回None
+    """
+    filename = os.path.basename(image_path)
+    preview_path = get_animation_path(upload_folder, filename)
+    os.makedirs(os.path.dirname(preview_path), exist_ok=True)
+    
+    from PIL import Image
+    
+    temp_path = None
+    try:
+        image_format = Image.registered_extensions().get(os.path.splitext(preview_path)[1].lower())
+        
+        with open_animation_limited(image_path, ANIMATION_PREVIEW_SIZE, ANIMATION_PREVIEW_MAX_FRAMES) as img:
+            if img is None:
+                return None
+            
+            step = -(-img.n_frames // ANIMATION_PREVIEW_MAX_FRAMES)
+            frames = []
+            durations = []
+            for index in range(img.n_frames):
+                img.seek(index)
+                # WebP的帧时长在解码后才写入info
+                img.load()
+                duration = img.info.get('duration') or 100
+                if index % step:
+                    durations[-1] += duration
+                    continue
+                frame = img.convert('RGBA')
+                frame.thumbnail(ANIMATION_PREVIEW_SIZE)
+                frames.append(frame)
+                durations.append(duration)
+            
+            temp_path = f"{preview_path}.{uuid.uuid4().hex}.tmp"
+            frames[0].save(temp_path, format=image_format, save_all=True, append_images=frames[1:],
+                           duration=durations, loop=img.info.get('loop', 0), disposal=2)
+        os.replace(temp_path, preview_path)
+        return preview_path
+    except Exception as e:
+        print(f"创建动图预览失败: {e}")
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
         return None
 
 # 删除照片文件
@@ -120,15 +544,14 @@ def delete_photo_files(filename, upload_folder):
     删除照片及其缩略图
     """
     try:
-        # 删除原始图片
-        original_path = os.path.join(upload_folder, filename)
-        if os.path.exists(original_path):
-            os.remove(original_path)
-        
-        # 删除缩略图
-        thumbnail_path = os.path.join(upload_folder, 'thumbnails', f"thumb_{filename}")
-        if os.path.exists(thumbnail_path):
-            os.remove(thumbnail_path)
+        # 删除原始图片和缩略图（分片布局和旧版平铺布局都要检查，迁移期间两处都可能存在）
+        for path in (get_photo_path(upload_folder, filename),
+                     get_legacy_photo_path(upload_folder, filename),
+                     get_thumbnail_path(upload_folder, filename),
+                     get_legacy_thumbnail_path(upload_folder, filename),
+                     get_animation_path(upload_folder, filename)):
+            if os.path.exists(path):
+                os.remove(path)
             
         return True
     except Exception as e:
@@ -136,47 +559,77 @@ def delete_photo_files(filename, upload_folder):
         return False
 
 # 清理照片目录中的孤立文件
-def cleanup_orphaned_photos(db, upload_folder):
+def cleanup_orphaned_photos(db, upload_folder, min_age=600, progress=None):
     """
-    清理数据库中不存在的照片文件
+    清理数据库中不存在的照片文件，返回删除的文件数量
+
+    参数:
+    - min_age: 只删除修改时间早于该秒数的文件，避免删除正在上传、尚未写入数据库的照片
+    - progress: 进度回调，参数为(已检查的文件数, 文件总数)
     """
-    from models import Photo  # 避免循环导入
+    from backend.models import Photo  # 避免循环导入
     
-    try:
-        # 获取数据库中已有的所有文件名
-        photos = db.session.query(Photo).all()
-        db_filenames = {photo.filename for photo in photos}
+    # 获取数据库中已有的所有文件名
+    db_filenames = {filename for (filename,) in db.session.query(Photo.filename)}
+    
+    # 遍历上传目录（包括分片子目录）
+    entries = list(scan_upload_folder(upload_folder))
+    cutoff = time.time() - min_age
+    removed = 0
+    for index, (rel_dir, filename, _) in enumerate(entries):
+        if progress and index % 500 == 0:
+            progress(index, len(entries))
         
-        # 遍历上传目录
-        for filename in os.listdir(upload_folder):
-            file_path = os.path.join(upload_folder, filename)
-            
-            # 跳过目录
-            if os.path.isdir(file_path):
+        if rel_dir.split(os.sep)[0] == 'thumbnails':
+            # 提取原始文件名（去掉thumb_或anim_前缀），不是缩略图或预览动画的文件保留
+            if not filename.startswith(('thumb_', 'anim_')):
                 continue
-                
-            # 如果文件不在数据库中，则删除
-            if filename not in db_filenames:
-                os.remove(file_path)
-                print(f"已删除孤立文件: {filename}")
+            original_filename = filename[5:] if filename.startswith('anim_') else filename[6:]
+        else:
+            original_filename = filename
         
-        # 同样检查缩略图目录
-        thumbnails_dir = os.path.join(upload_folder, 'thumbnails')
-        if os.path.exists(thumbnails_dir):
-            for filename in os.listdir(thumbnails_dir):
-                # 提取原始文件名（去掉thumb_前缀）
-                if filename.startswith('thumb_'):
-                    original_filename = filename[6:]  # 去掉"thumb_"前缀
-                    
-                    # 如果原始文件名不在数据库中，则删除缩略图
-                    if original_filename not in db_filenames:
-                        os.remove(os.path.join(thumbnails_dir, filename))
-                        print(f"已删除孤立缩略图: {filename}")
+        if original_filename in db_filenames:
+            continue
         
-        return True
-    except Exception as e:
-        print(f"清理孤立照片失败: {e}")
-        return False
+        file_path = os.path.join(upload_folder, rel_dir, filename)
+        try:
+            if os.path.getmtime(file_path) > cutoff:
+                continue
+            os.remove(file_path)
+            removed += 1
+            print(f"已删除孤立文件: {os.path.join(rel_dir, filename)}")
+        except FileNotFoundError:
+            pass
+    
+    if progress:
+        progress(len(entries), len(entries))
+    return removed
+
+# 把旧版平铺布局的文件迁移到分片布局
+def migrate_photo_to_sharded_layout(upload_folder, filename):
+    """
+    把单张照片的原图和缩略图从平铺布局移动到分片布局
+
+    使用os.replace在同一文件系统内原子移动，读取方先查分片路径，再查旧路径，
+    旧路径不存在时再查一次分片路径，因此迁移过程中应用可以照常提供访问。
+    返回实际移动的文件数量。
+    """
+    moved = 0
+    pairs = (
+        (get_legacy_photo_path(upload_folder, filename), get_photo_path(upload_folder, filename)),
+        (get_legacy_thumbnail_path(upload_folder, filename), get_thumbnail_path(upload_folder, filename)),
+    )
+    for legacy_path, sharded_path in pairs:
+        if not os.path.isfile(legacy_path):
+            continue
+        os.makedirs(os.path.dirname(sharded_path), exist_ok=True)
+        if os.path.exists(sharded_path):
+            # 分片路径已有文件（例如迁移中断后重跑），保留分片文件
+            os.remove(legacy_path)
+        else:
+            os.replace(legacy_path, sharded_path)
+        moved += 1
+    return moved
 
 # 批量处理照片
 def batch_process_photos(files, upload_folder):
@@ -233,20 +686,39 @@ def validate_photo_access(user_id, photo_path, app=None):
     # 在多用户环境中，这里需要根据用户ID和照片所有权进行验证
     return True
 
+# 遍历上传文件夹中的所有文件
+def scan_upload_folder(upload_folder):
+    """
+    使用os.scandir递归遍历上传文件夹，逐个返回(相对目录, 文件名, 文件大小)
+
+    scandir在遍历时已经带回了文件类型和stat信息，不需要再对每个文件
+    单独调用os.path.exists和os.path.getsize
+    """
+    pending = ['']
+    while pending:
+        rel_dir = pending.pop()
+        try:
+            with os.scandir(os.path.join(upload_folder, rel_dir)) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(os.path.join(rel_dir, entry.name))
+                        elif entry.is_file(follow_symlinks=False):
+                            yield rel_dir, entry.name, entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        # 遍历期间文件被删除，跳过即可
+                        continue
+        except OSError:
+            continue
+
 # 检查上传文件夹大小
 def check_upload_folder_size(upload_folder):
     """
     检查上传文件夹的大小
+
+    这里会完整扫描磁盘，仅用于后台对账；状态展示请使用storage模块中的计数器
     """
-    total_size = 0
-    
-    for dirpath, dirnames, filenames in os.walk(upload_folder):
-        for filename in filenames:
-            filepath = os.path.join(dirpath, filename)
-            if os.path.exists(filepath):
-                total_size += os.path.getsize(filepath)
-    
-    return total_size
+    return sum(size for _, _, size in scan_upload_folder(upload_folder))
 
 # 格式化文件大小显示
 def format_file_size(size_in_bytes):
@@ -260,6 +732,22 @@ def format_file_size(size_in_bytes):
     
     return f"{size_in_bytes:.2f} TB"
 
+# 复制SQLite数据库
+def copy_sqlite_database(src_path, dst_path):
+    """
+    使用SQLite在线备份接口复制数据库，复制期间持有数据库锁，
+    应用其他线程同时读写时不会得到不完整的文件
+    """
+    src = sqlite3.connect(src_path)
+    try:
+        dst = sqlite3.connect(dst_path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
 # 数据库备份函数
 def backup_database(db_path, backup_dir):
     """
@@ -276,7 +764,7 @@ def backup_database(db_path, backup_dir):
     
     try:
         # 复制数据库文件
-        shutil.copy2(db_path, backup_path)
+        copy_sqlite_database(db_path, backup_path)
         return backup_path
     except Exception as e:
         print(f"数据库备份失败: {e}")
@@ -293,7 +781,7 @@ def restore_database(backup_path, db_path):
     
     try:
         # 复制备份文件到数据库位置
-        shutil.copy2(backup_path, db_path)
+        copy_sqlite_database(backup_path, db_path)
         return True, "数据库恢复成功"
     except Exception as e:
         print(f"数据库恢复失败: {e}")
@@ -359,7 +847,8 @@ def parse_tags(tag_string):
     return list(set(cleaned_tags))
 
 # 搜索照片
-def search_photos(db, query='', date_from=None, date_to=None, tags=None, album_id=None, event_id=None):
+def search_photos(db, query='', date_from=None, date_to=None, tags=None, album_id=None, event_id=None,
+                  tag_query=None, as_query=False):
     """
     搜索照片
     
@@ -371,8 +860,10 @@ def search_photos(db, query='', date_from=None, date_to=None, tags=None, album_i
     - tags: 标签列表
     - album_id: 相册ID
     - event_id: 事件ID
+    - tag_query: 标签查询表达式的语法树（见backend.tags.parse_tag_query），与tags同时使用时两者都需满足
+    - as_query: 为True时返回查询对象而不是照片列表，便于调用方做列投影
     """
-    from models import Photo, Tag  # 避免循环导入
+    from backend.models import Photo, Tag  # 避免循环导入
     
     # 构建基础查询
     q = db.session.query(Photo)
@@ -400,6 +891,11 @@ def search_photos(db, query='', date_from=None, date_to=None, tags=None, album_i
             # 使用JOIN和IN条件筛选带有指定标签的照片
             q = q.join(Photo.tags).filter(Tag.name.in_(valid_tags)).distinct()
     
+    # 按标签查询表达式筛选（在数据库中完成AND/OR/NOT运算）
+    if tag_query:
+        from backend.tags import tag_query_filter
+        q = q.filter(tag_query_filter(tag_query))
+    
     # 按关键词搜索（在描述和原始名称中搜索）
     if query:
         # 确保字符串类型并去除首尾空格
@@ -413,4 +909,6 @@ def search_photos(db, query='', date_from=None, date_to=None, tags=None, album_i
     # 按日期降序排序（最新的在前）
     q = q.order_by(Photo.date_taken.desc())
     
+    if as_query:
+        return q
     return q.all()
\ No newline at end of file
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+照片列表序列化基准测试
+
+对比两种生成照片列表JSON的方式（每秒处理的行数）：
+- orm: 构造ORM对象，逐个调用to_dict并访问相册/事件/标签关系，再用标准库json序列化
+- projection: 列元组投影查询 + serializers.dumps
+
+用法:
+    python benchmarks/bench_serialization.py [--photos 10000] [--repeat 3]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_ROOT not in sys.path:
+    sys.path.insert(0, APP_ROOT)
+
+
+def build_photo_url(filename, is_thumbnail=False):
+    if is_thumbnail:
+        return f"/api/uploads/thumbnails/thumb_{filename}"
+    return f"/api/uploads/{filename}"
+
+
+def populate(db, photo_count):
+    """批量插入测试数据"""
+    from backend.models import Photo, Album, Event, Tag, photo_tags
+
+    now = datetime.utcnow()
+    db.session.execute(Album.__table__.insert(), [
+        {'name': f'相册{i}', 'created_at': now} for i in range(20)
+    ])
+    db.session.execute(Event.__table__.insert(), [
+        {'title': f'事件{i}', 'date': (now - timedelta(days=i)).date(), 'created_at': now, 'updated_at': now}
+        for i in range(100)
+    ])
+    db.session.execute(Tag.__table__.insert(), [{'name': f'标签{i}'} for i in range(200)])
+    db.session.execute(Photo.__table__.insert(), [
+        {
+            'filename': f'20240101_000000_{i:08x}.jpg', 'original_name': f'IMG_{i}.jpg',
+            'path': f'20240101_000000_{i:08x}.jpg', 'description': '海边的日落',
+            'date_taken': (now - timedelta(days=i % 3650)).date(), 'created_at': now,
+            'width': 4032, 'height': 3024, 'album_id': i % 20 + 1, 'event_id': i % 100 + 1,
+            'file_size': 0, 'thumbnail_size': 0
+        }
+        for i in range(photo_count)
+    ])
+    db.session.execute(photo_tags.insert(), [
+        {'photo_id': i + 1, 'tag_id': tag_id}
+        for i in range(photo_count)
+        for tag_id in random.sample(range(1, 201), 3)
+    ])
+    db.session.commit()
+
+
+def bench_orm(db):
+    from backend.models import Photo
+
+    photos = Photo.query.order_by(Photo.created_at.desc()).all()
+    result = []
+    for photo in photos:
+        photo_dict = photo.to_dict()
+        photo_dict['url'] = build_photo_url(photo.filename)
+        photo_dict['thumbnail_url'] = build_photo_url(photo.filename, is_thumbnail=True)
+        if photo.album:
+            photo_dict['album_info'] = {'id': photo.album.id, 'name': photo.album.name}
+        if photo.event:
+            photo_dict['event_info'] = {'id': photo.event.id, 'title': photo.event.title,
+                                        'date': photo.event.date.isoformat() if photo.event.date else None}
+        result.append(photo_dict)
+    body = json.dumps(result, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    db.session.remove()
+    return len(result), len(body)
+
+
+def bench_projection(db):
+    from backend.models import Photo
+    from backend.serializers import project_photos, photo_row_to_dict, dumps
+
+    rows = project_photos(Photo.query.order_by(Photo.created_at.desc())).all()
+    body = dumps([photo_row_to_dict(row, build_photo_url) for row in rows])
+    db.session.remove()
+    return len(rows), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='照片列表序列化基准测试')
+    parser.add_argument('--photos', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ['LOVE_STORY_APP_DATA_DIR'] = tempfile.mkdtemp(prefix='love_story_bench_')
+    os.environ['LOVE_STORY_STORAGE_RECONCILE_INTERVAL'] = '0'
+
+    from backend.app import create_app
+    from backend.models import db
+    from backend.serializers import JSON_BACKEND
+
+    app = create_app()
+    with app.app_context():
+        populate(db, args.photos)
+
+        print(f"照片数量: {args.photos}，JSON后端: {JSON_BACKEND}")
+        for name, func in (('orm', bench_orm), ('projection', bench_projection)):
+            best = None
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                rows, size = func(db)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{name:>10}: {best * 1000:8.1f} ms  {rows / best:10.0f} 行/秒  {size / 1024:.0f} KB")
+
+
+if __name__ == '__main__':
+    main()
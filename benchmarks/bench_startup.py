@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+应用冷启动基准测试
+
+启动应用子进程（不打开浏览器），测量从启动进程到端口开始接受连接、
+以及到/api/health第一次返回200的时间。应用通过LOVE_STORY_STARTUP_REPORT
+写出各阶段的时间点，据此拆分为:
+
+- bootstrap: 进程创建到执行main.py（解释器启动；单文件打包时还包括解压到_MEIPASS）
+- listening: 开始监听端口
+- imports: 导入Flask、SQLAlchemy和后端模块
+- app_init: 创建应用实例（数据库初始化等）
+- first_response: 首个请求返回
+
+第一次运行使用空的数据目录（新建数据库），之后的运行复用同一个数据目录。
+目标是已有数据库时首个响应在300毫秒以内；从源码运行时同时报告仅导入Flask和Flask-SQLAlchemy
+所需的时间，作为当前机器上启动耗时的下限参考。
+
+用法:
+    python benchmarks/bench_startup.py [--runs 5] [--target-ms 300] [--report startup.json]
+    python benchmarks/bench_startup.py --command "dist/love_story/love_story.exe"
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PHASES = ('bootstrap', 'listening', 'imports', 'app_init', 'first_response')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def measure_import_floor():
+    """启动解释器并导入Flask和Flask-SQLAlchemy的耗时（毫秒）"""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'import flask, flask_sqlalchemy, flask_cors'], check=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def wait_for_port(port, started, timeout, process):
+    """等待端口开始接受连接，返回耗时（毫秒）"""
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f'应用进程提前退出，返回码 {process.returncode}')
+        try:
+            with socket.create_connection(('localhost', port), timeout=1):
+                return (time.perf_counter() - started) * 1000
+        except OSError:
+            time.sleep(0.002)
+    raise RuntimeError(f'{timeout} 秒内端口没有开始监听')
+
+
+def split_phases(marks, launched_at, first_response_ms):
+    """根据应用写出的时间点计算各阶段耗时（毫秒），缺少的阶段为None"""
+    def elapsed(name):
+        return (marks[name] - launched_at) * 1000 if name in marks else None
+
+    def between(start, end):
+        if start in marks and end in marks:
+            return (marks[end] - marks[start]) * 1000
+        return None
+
+    return {
+        'bootstrap': elapsed('main_started'),
+        'listening': elapsed('listening'),
+        'imports': between('listening', 'app_imported'),
+        'app_init': between('app_imported', 'app_created'),
+        'first_response': first_response_ms,
+    }
+
+
+def measure_startup(command, data_dir, timeout=30.0):
+    """启动一次应用，返回各阶段耗时（毫秒）"""
+    port = free_port()
+    report_path = os.path.join(data_dir, 'startup_report.json')
+    if os.path.exists(report_path):
+        os.remove(report_path)
+    env = dict(os.environ, LOVE_STORY_APP_DATA_DIR=data_dir, LOVE_STORY_PORT=str(port),
+               LOVE_STORY_NO_BROWSER='1', LOVE_STORY_STORAGE_RECONCILE_INTERVAL='0',
+               LOVE_STORY_STARTUP_REPORT=report_path)
+    url = f'http://localhost:{port}/api/health'
+
+    launched_at = time.time()
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=APP_ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, started, timeout, process)
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f'应用进程提前退出，返回码 {process.returncode}')
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    if response.status == 200:
+                        first_response = (time.perf_counter() - started) * 1000
+                        break
+            except OSError:
+                time.sleep(0.005)
+        else:
+            raise RuntimeError(f'{timeout} 秒内没有收到响应')
+
+        marks = {}
+        if os.path.exists(report_path):
+            with open(report_path, encoding='utf-8') as f:
+                marks = json.load(f)
+        result = split_phases(marks, launched_at, first_response)
+        result['frozen'] = marks.get('frozen')
+        return result
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def format_phases(phases):
+    return '  '.join(f"{name} {phases[name]:.0f} ms" if phases[name] is not None else f"{name} -"
+                     for name in PHASES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='应用冷启动基准测试')
+    parser.add_argument('--runs', type=int, default=5, help='已有数据库时的启动次数')
+    parser.add_argument('--target-ms', type=float, default=300.0, help='首个响应的目标耗时（毫秒）')
+    parser.add_argument('--command', help='启动命令，默认使用当前Python运行main.py；可以指定打包后的可执行文件')
+    parser.add_argument('--report', help='把结果写入JSON文件')
+    args = parser.parse_args()
+
+    command = shlex.split(args.command) if args.command else [sys.executable, os.path.join(APP_ROOT, 'main.py')]
+    data_dir = tempfile.mkdtemp(prefix='love_story_startup_')
+    try:
+        floor = None
+        if not args.command:
+            floor = statistics.median(measure_import_floor() for _ in range(3))
+            print(f"导入Flask/Flask-SQLAlchemy的下限: {floor:.0f} ms")
+
+        first = measure_startup(command, data_dir)
+        print(f"首次启动（新建数据库）: {format_phases(first)}")
+
+        runs = [measure_startup(command, data_dir) for _ in range(args.runs)]
+        median = {
+            name: statistics.median(r[name] for r in runs) if all(r[name] is not None for r in runs) else None
+            for name in PHASES
+        }
+        print(f"已有数据库（中位数，{args.runs} 次）: {format_phases(median)}")
+
+        passed = median['first_response'] <= args.target_ms
+        print(f"目标 {args.target_ms:.0f} ms: {'达标' if passed else '未达标'}")
+
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'command': command,
+                    'frozen': first.get('frozen'),
+                    'import_floor_ms': floor,
+                    'target_ms': args.target_ms,
+                    'first_launch': first,
+                    'runs': runs,
+                    'median': median,
+                }, f, ensure_ascii=False, indent=2)
+            print(f"报告已写入 {args.report}")
+        return 0 if passed else 1
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
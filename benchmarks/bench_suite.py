@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+接口基准测试套件
+
+为每个规模生成一个合成照片库（见synthetic_library.py），然后用Flask测试客户端
+依次调用热点接口，统计p50/p95/p99延迟和吞吐，输出JSON和Markdown报告，
+报告中记录当前提交，便于在不同提交之间对比。
+
+用法:
+    python benchmarks/bench_suite.py [--sizes 1000,10000,100000] [--iterations 50]
+                                     [--max-seconds 10] [--only list,search]
+                                     [--output-dir benchmarks/results]
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import sqlite3
+import tempfile
+import subprocess
+from datetime import datetime
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_ROOT not in sys.path:
+    sys.path.insert(0, APP_ROOT)
+
+from benchmarks.synthetic_library import generate_library, make_sample_images  # noqa: E402
+
+# 批量上传测试每次上传的文件数
+BATCH_UPLOAD_FILES = 10
+
+
+def percentile(sorted_values, fraction):
+    """线性插值计算百分位数（输入需已排序）"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def build_scenarios(app, counts, images):
+    """
+    返回测试场景列表: (名称, 请求函数, 最大迭代次数)
+
+    请求函数接收测试客户端和随机数生成器，返回响应对象
+    """
+    from backend.models import db, Photo
+
+    photo_count = counts['photos']
+
+    # 预先删除一部分缩略图，用于测试按需生成
+    missing_thumbnails = []
+    with app.app_context():
+        from backend.utils import get_thumbnail_path
+        for (filename,) in db.session.query(Photo.filename).order_by(Photo.id.desc()).limit(200):
+            path = get_thumbnail_path(app.config['UPLOAD_FOLDER'], filename)
+            if os.path.exists(path):
+                os.remove(path)
+                missing_thumbnails.append(filename)
+        db.session.remove()
+
+    def photo_filename(photo_id):
+        with app.app_context():
+            filename = db.session.query(Photo.filename).filter_by(id=photo_id).scalar()
+            db.session.remove()
+            return filename
+
+    def list_all(client, rng):
+        return client.get('/api/photos')
+
+    def list_album(client, rng):
+        return client.get(f'/api/photos?album_id={rng.randrange(counts["albums"]) + 1}')
+
+    def list_tag(client, rng):
+        return client.get(f'/api/photos?tag={rng.choice(["旅行", "海边", "日落", "生日"])}')
+
+    def list_events(client, rng):
+        return client.get('/api/events')
+
+    def search_text(client, rng):
+        return client.get('/api/photos/search?q=' + rng.choice(['日落', '旅行', 'IMG_0001', '早餐']))
+
+    def search_date_range(client, rng):
+        year = rng.randrange(2017, 2026)
+        return client.get(f'/api/photos/search?date_from={year}-01-01&date_to={year}-03-31')
+
+    def upload(client, rng):
+        data = {'file': (io.BytesIO(rng.choice(images)), 'bench.jpg'), 'tags': '基准测试,旅行'}
+        return client.post('/api/photos', data=data, content_type='multipart/form-data')
+
+    def batch_upload(client, rng):
+        files = [(io.BytesIO(rng.choice(images)), f'bench_{i}.jpg') for i in range(BATCH_UPLOAD_FILES)]
+        return client.post('/api/photos/batch', data={'files': files}, content_type='multipart/form-data')
+
+    def thumbnail_cached(client, rng):
+        filename = photo_filename(rng.randrange(photo_count - len(missing_thumbnails)) + 1)
+        return client.get(f'/api/uploads/thumbnails/thumb_{filename}')
+
+    def thumbnail_generate(client, rng):
+        if not missing_thumbnails:
+            return None
+        return client.get(f'/api/uploads/thumbnails/thumb_{missing_thumbnails.pop()}')
+
+    def backup(client, rng):
+        return client.post('/api/backup')
+
+    return [
+        ('list_all', list_all, None),
+        ('list_album', list_album, None),
+        ('list_tag', list_tag, None),
+        ('list_events', list_events, None),
+        ('search_text', search_text, None),
+        ('search_date_range', search_date_range, None),
+        ('upload', upload, None),
+        ('batch_upload', batch_upload, None),
+        ('thumbnail_cached', thumbnail_cached, None),
+        ('thumbnail_generate', thumbnail_generate, len(missing_thumbnails)),
+        ('backup', backup, 10),
+    ]
+
+
+def run_scenario(client, func, iterations, max_seconds, seed):
+    """重复执行一个场景，返回统计结果"""
+    rng = random.Random(seed)
+    latencies = []
+    errors = 0
+    response_bytes = 0
+
+    # 预热一次，不计入统计
+    func(client, rng)
+
+    started = time.perf_counter()
+    while len(latencies) < iterations:
+        request_started = time.perf_counter()
+        response = func(client, rng)
+        if response is None:
+            break
+        body = response.get_data()
+        latencies.append(time.perf_counter() - request_started)
+        response_bytes += len(body)
+        if response.status_code >= 400:
+            errors += 1
+        response.close()
+        # 至少执行3次，之后超过时间预算就停止
+        if len(latencies) >= 3 and time.perf_counter() - started > max_seconds:
+            break
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    count = len(latencies)
+    return {
+        'iterations': count,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / count * 1000, 3) if count else 0.0,
+        'throughput_rps': round(count / elapsed, 2) if elapsed else 0.0,
+        'avg_response_kb': round(response_bytes / count / 1024, 1) if count else 0.0,
+    }
+
+
+def bench_size(photo_count, args, images):
+    """在一个新的数据目录中生成照片库并运行所有场景"""
+    data_dir = tempfile.mkdtemp(prefix=f'love_story_bench_{photo_count}_')
+    os.environ['LOVE_STORY_APP_DATA_DIR'] = data_dir
+    os.environ['LOVE_STORY_STORAGE_RECONCILE_INTERVAL'] = '0'
+
+    from backend.app import create_app
+    from backend.models import db
+
+    try:
+        app = create_app()
+        started = time.perf_counter()
+        with app.app_context():
+            counts = generate_library(db, app.config['UPLOAD_FOLDER'], photo_count, seed=args.seed)
+            db.session.remove()
+        generation_seconds = round(time.perf_counter() - started, 2)
+        print(f"[{photo_count}] 照片库生成完成，用时 {generation_seconds} 秒: {counts}")
+
+        client = app.test_client()
+        results = []
+        for name, func, limit in build_scenarios(app, counts, images):
+            if args.only and name not in args.only:
+                continue
+            iterations = min(args.iterations, limit) if limit is not None else args.iterations
+            stats = run_scenario(client, func, iterations, args.max_seconds, args.seed)
+            stats.update({'size': photo_count, 'scenario': name})
+            results.append(stats)
+            print(f"[{photo_count}] {name:>20}: p50 {stats['p50_ms']:9.2f} ms  "
+                  f"p95 {stats['p95_ms']:9.2f} ms  p99 {stats['p99_ms']:9.2f} ms  "
+                  f"{stats['throughput_rps']:8.1f} 次/秒  ({stats['iterations']} 次, {stats['errors']} 错误)")
+
+        # 释放数据库连接，避免删除目录时文件仍被占用
+        with app.app_context():
+            db.engine.dispose()
+        return {'size': photo_count, 'generation_seconds': generation_seconds,
+                'counts': counts, 'results': results}
+    finally:
+        if args.keep:
+            print(f"[{photo_count}] 保留数据目录: {data_dir}")
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def git_revision():
+    """当前提交的简短哈希，工作区有修改时加上-dirty"""
+    try:
+        revision = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_ROOT,
+                                           stderr=subprocess.DEVNULL, text=True).strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD'], cwd=APP_ROOT,
+                                stderr=subprocess.DEVNULL)
+        return revision + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def render_markdown(report):
+    """生成Markdown格式的报告"""
+    meta = report['meta']
+    lines = [
+        f"# 基准测试报告 {meta['revision']}",
+        '',
+        f"- 时间: {meta['started_at']}",
+        f"- Python {meta['python']}，SQLite {meta['sqlite']}，JSON后端 {meta['json_backend']}",
+        f"- 平台: {meta['platform']}",
+        '',
+    ]
+    for size_report in report['sizes']:
+        lines += [
+            f"## {size_report['size']} 张照片",
+            '',
+            f"生成用时 {size_report['generation_seconds']} 秒，"
+            f"{size_report['counts']['albums']} 个相册，{size_report['counts']['events']} 个事件，"
+            f"{size_report['counts']['tags']} 个标签",
+            '',
+            '| 场景 | 次数 | p50 (ms) | p95 (ms) | p99 (ms) | 吞吐 (次/秒) | 平均响应 (KB) | 错误 |',
+            '|---|---:|---:|---:|---:|---:|---:|---:|',
+        ]
+        for r in size_report['results']:
+            lines.append(f"| {r['scenario']} | {r['iterations']} | {r['p50_ms']} | {r['p95_ms']} | "
+                         f"{r['p99_ms']} | {r['throughput_rps']} | {r['avg_response_kb']} | {r['errors']} |")
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='接口基准测试套件')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='照片库规模，逗号分隔')
+    parser.add_argument('--iterations', type=int, default=50, help='每个场景的最大执行次数')
+    parser.add_argument('--max-seconds', type=float, default=10.0, help='每个场景的时间预算（秒）')
+    parser.add_argument('--only', help='只运行指定场景，逗号分隔')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output-dir', default=os.path.join(APP_ROOT, 'benchmarks', 'results'))
+    parser.add_argument('--keep', action='store_true', help='保留生成的数据目录')
+    args = parser.parse_args()
+    args.only = set(args.only.split(',')) if args.only else None
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    images = make_sample_images()
+
+    from backend.serializers import JSON_BACKEND
+
+    started_at = datetime.now()
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'started_at': started_at.isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'json_backend': JSON_BACKEND,
+            'platform': platform.platform(),
+            'iterations': args.iterations,
+            'max_seconds': args.max_seconds,
+        },
+        'sizes': [bench_size(size, args, images) for size in sizes],
+    }
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    base = os.path.join(args.output_dir, f"{started_at:%Y%m%d_%H%M%S}_{report['meta']['revision']}")
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    with open(base + '.md', 'w', encoding='utf-8') as f:
+        f.write(render_markdown(report))
+    print(f"报告已写入 {base}.json 和 {base}.md")
+
+
+if __name__ == '__main__':
+    main()
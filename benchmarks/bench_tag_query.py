@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+标签查询表达式基准测试
+
+生成一个合成照片库（只写数据库记录），对多组三标签交集及带OR/NOT的表达式测量:
+
+- sql: 只执行编译后的过滤条件，取回匹配的照片ID
+- api: 通过/api/photos?tag_query=...返回完整的照片列表
+
+先在有(tag_id, photo_id)索引时测量，再删除该索引重新测量，对比索引的效果，
+并输出三标签交集的查询计划。
+
+用法:
+    python benchmarks/bench_tag_query.py [--photos 100000] [--iterations 20]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+from urllib.parse import quote
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_ROOT not in sys.path:
+    sys.path.insert(0, APP_ROOT)
+
+from benchmarks.synthetic_library import generate_library  # noqa: E402
+
+# 每组表达式使用的随机三标签组合数
+COMBINATIONS = 5
+
+
+def build_queries(tag_names, rng):
+    """从热门标签中随机挑选三个标签组成表达式，返回(场景名, 表达式列表)"""
+    popular = tag_names[:12]
+    combos = [rng.sample(popular, 3) for _ in range(COMBINATIONS)]
+    return [
+        ('a AND b AND c', [f'{a} AND {b} AND {c}' for a, b, c in combos]),
+        ('a AND b NOT c', [f'{a} {b} NOT {c}' for a, b, c in combos]),
+        ('(a OR b) AND c', [f'({a} OR {b}) AND {c}' for a, b, c in combos]),
+        ('a OR b OR c', [f'{a} OR {b} OR {c}' for a, b, c in combos]),
+    ]
+
+
+def measure(func, expressions, iterations):
+    """依次执行各个表达式，返回(p50毫秒, 最大毫秒, 平均匹配数)"""
+    latencies = []
+    matches = []
+    for expression in expressions:
+        func(expression)  # 预热
+        for _ in range(iterations):
+            started = time.perf_counter()
+            count = func(expression)
+            latencies.append((time.perf_counter() - started) * 1000)
+        matches.append(count)
+    return statistics.median(latencies), max(latencies), statistics.mean(matches)
+
+
+def run(app, queries, iterations, label):
+    from backend.models import db, Photo
+    from backend.tags import parse_tag_query, tag_query_filter
+
+    client = app.test_client()
+
+    def sql(expression):
+        with app.app_context():
+            condition = tag_query_filter(parse_tag_query(expression))
+            count = len(db.session.query(Photo.id).filter(condition).all())
+            db.session.remove()
+            return count
+
+    def api(expression):
+        response = client.get('/api/photos?tag_query=' + quote(expression))
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return len(response.get_json())
+
+    print(f"\n[{label}]")
+    for name, expressions in queries:
+        for mode, func in (('sql', sql), ('api', api)):
+            p50, worst, matched = measure(func, expressions, iterations)
+            print(f"{name:>16} {mode}: p50 {p50:8.2f} ms  max {worst:8.2f} ms  平均匹配 {matched:8.0f} 张")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='标签查询表达式基准测试')
+    parser.add_argument('--photos', type=int, default=100000, help='照片数量')
+    parser.add_argument('--iterations', type=int, default=20, help='每个表达式的执行次数')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='love_story_tag_query_')
+    os.environ['LOVE_STORY_APP_DATA_DIR'] = data_dir
+    os.environ['LOVE_STORY_STORAGE_RECONCILE_INTERVAL'] = '0'
+
+    from sqlalchemy import text
+    from backend.app import create_app
+    from backend.models import db, Photo, Tag
+    from backend.tags import parse_tag_query, tag_query_filter
+
+    try:
+        app = create_app()
+        with app.app_context():
+            counts = generate_library(db, app.config['UPLOAD_FOLDER'], args.photos,
+                                      seed=args.seed, write_files=False)
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+            tag_names = [name for (name,) in db.session.query(Tag.name).order_by(Tag.usage_count.desc())]
+            db.session.remove()
+        print(f"照片库: {counts}")
+
+        queries = build_queries(tag_names, random.Random(args.seed))
+        with app.app_context():
+            statement = db.session.query(Photo.id).filter(
+                tag_query_filter(parse_tag_query(queries[0][1][0]))
+            ).statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+            plan = db.session.execute(text(f'EXPLAIN QUERY PLAN {statement}'))
+            print(f"查询计划（{queries[0][1][0]}）:")
+            for row in plan:
+                print(f"  {row[-1]}")
+            db.session.remove()
+
+        run(app, queries, args.iterations, '有(tag_id, photo_id)索引')
+
+        with app.app_context():
+            db.session.execute(text('DROP INDEX ix_photo_tags_tag_photo'))
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+            db.session.remove()
+        run(app, queries, args.iterations, '无索引')
+
+        with app.app_context():
+            db.engine.dispose()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
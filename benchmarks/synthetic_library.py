@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+"""
+合成照片库生成器
+
+按指定规模生成相册、事件、标签和照片记录，并写入真实的小尺寸JPEG原图和缩略图
+（使用分片目录布局），数据库记录全部批量插入。
+供基准测试使用，也可以单独运行:
+
+    python benchmarks/synthetic_library.py --photos 10000 --data-dir /tmp/love_story_10k
+"""
+
+import os
+import sys
+import io
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_ROOT not in sys.path:
+    sys.path.insert(0, APP_ROOT)
+
+# 每批插入的行数
+INSERT_BATCH_SIZE = 5000
+
+# 预先编码的图片种类数，写文件时循环使用，避免逐张编码
+IMAGE_VARIANTS = 16
+
+# 标签名取材，与示例数据的风格保持一致
+TAG_WORDS = ['旅行', '海边', '日落', '生日', '纪念日', '美食', '电影', '雪山', '花', '猫',
+             '城市', '夜景', '咖啡', '家人', '朋友', '婚礼', '周年', '森林', '草原', '湖']
+
+CAMERAS = [('Apple', 'iPhone 15 Pro'), ('Apple', 'iPhone 12'), ('SONY', 'ILCE-7M4'),
+           ('Canon', 'EOS R6'), ('FUJIFILM', 'X-T5'), (None, None)]
+
+
+def _encode_images(size, count, seed):
+    """生成count张指定尺寸的JPEG图片，返回字节串列表"""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        img = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(6):
+            x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+            draw.ellipse((x0, y0, x0 + size[0] // 3, y0 + size[1] // 3),
+                         fill=tuple(rng.randrange(256) for _ in range(3)))
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=80)
+        images.append(buffer.getvalue())
+    return images
+
+
+def make_sample_images(count=IMAGE_VARIANTS, seed=0):
+    """生成上传测试用的小图片（原图尺寸），返回字节串列表"""
+    return _encode_images((160, 120), count, seed)
+
+
+def _insert(db, table, rows):
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.session.execute(table.insert(), rows[start:start + INSERT_BATCH_SIZE])
+
+
+def generate_library(db, upload_folder, photo_count, seed=42, write_files=True, progress=None):
+    """
+    生成合成照片库（需要在应用上下文中调用）
+
+    参数:
+    - photo_count: 照片数量
+    - seed: 随机种子，相同参数生成相同的数据
+    - write_files: 是否写入原图和缩略图文件
+    - progress: 可选的进度回调，参数为(已写入文件的照片数, 总数)
+
+    返回各类记录的数量
+    """
+    from backend.models import Photo, Album, Event, Tag, photo_tags
+    from backend.storage import rebuild_storage_counters
+    from backend.utils import get_photo_path, get_thumbnail_path
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    album_count = max(4, min(200, photo_count // 500))
+    event_count = max(5, min(2000, photo_count // 50))
+    tag_count = max(20, min(1000, photo_count // 100))
+
+    _insert(db, Album.__table__, [
+        {'name': f'相册{i + 1}', 'description': f'第{i + 1}个相册', 'created_at': now}
+        for i in range(album_count)
+    ])
+    event_dates = [(now - timedelta(days=rng.randrange(3650))).date() for _ in range(event_count)]
+    _insert(db, Event.__table__, [
+        {'title': f'事件{i + 1}', 'date': event_dates[i], 'description': '一起度过的一天',
+         'created_at': now, 'updated_at': now}
+        for i in range(event_count)
+    ])
+    tag_names = [f'{TAG_WORDS[i % len(TAG_WORDS)]}{i // len(TAG_WORDS) or ""}' for i in range(tag_count)]
+    _insert(db, Tag.__table__, [{'name': name} for name in tag_names])
+
+    originals = _encode_images((160, 120), IMAGE_VARIANTS, seed) if write_files else []
+    thumbnails = _encode_images((80, 60), IMAGE_VARIANTS, seed) if write_files else []
+
+    photos = []
+    links = []
+    for i in range(photo_count):
+        filename = f'{now:%Y%m%d_%H%M%S}_{i:08x}.jpg'
+        variant = i % IMAGE_VARIANTS
+        event_id = rng.randrange(event_count) + 1 if rng.random() < 0.8 else None
+        album_id = rng.randrange(album_count) + 1 if rng.random() < 0.6 else None
+        make, model = rng.choice(CAMERAS)
+        located = rng.random() < 0.4
+        photos.append({
+            'filename': filename,
+            'original_name': f'IMG_{i:06d}.jpg',
+            'path': filename,
+            'description': rng.choice(['', '海边的日落', '第一次一起旅行', '生日快乐', '周末的早餐']),
+            'date_taken': event_dates[event_id - 1] if event_id else (now - timedelta(days=rng.randrange(3650))).date(),
+            'created_at': now - timedelta(seconds=photo_count - i),
+            'width': 160, 'height': 120, 'orientation': 1,
+            'camera_make': make, 'camera_model': model,
+            'latitude': rng.uniform(18.0, 45.0) if located else None,
+            'longitude': rng.uniform(100.0, 125.0) if located else None,
+            'event_id': event_id, 'album_id': album_id,
+            'file_size': len(originals[variant]) if write_files else 0,
+            'thumbnail_size': len(thumbnails[variant]) if write_files else 0,
+        })
+        # 标签数量偏向较少，热门标签出现得更频繁
+        for tag_index in set((int(rng.paretovariate(1.2)) - 1) % tag_count for _ in range(rng.randrange(6))):
+            links.append({'photo_id': i + 1, 'tag_id': tag_index + 1})
+
+    _insert(db, Photo.__table__, photos)
+    _insert(db, photo_tags, links)
+    rebuild_storage_counters()
+    db.session.commit()
+
+    if write_files:
+        for i, photo in enumerate(photos):
+            variant = i % IMAGE_VARIANTS
+            for path, data in ((get_photo_path(upload_folder, photo['filename']), originals[variant]),
+                               (get_thumbnail_path(upload_folder, photo['filename']), thumbnails[variant])):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(data)
+            if progress and (i + 1) % 10000 == 0:
+                progress(i + 1, photo_count)
+
+    return {'photos': photo_count, 'albums': album_count, 'events': event_count,
+            'tags': tag_count, 'photo_tags': len(links)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成照片库')
+    parser.add_argument('--photos', type=int, default=10000, help='照片数量')
+    parser.add_argument('--data-dir', required=True, help='数据目录（应为空目录）')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-files', action='store_true', help='只生成数据库记录，不写图片文件')
+    args = parser.parse_args()
+
+    os.environ['LOVE_STORY_APP_DATA_DIR'] = args.data_dir
+    os.environ['LOVE_STORY_STORAGE_RECONCILE_INTERVAL'] = '0'
+
+    from backend.app import create_app
+    from backend.models import db
+
+    app = create_app()
+    started = time.perf_counter()
+    with app.app_context():
+        counts = generate_library(
+            db, app.config['UPLOAD_FOLDER'], args.photos, seed=args.seed,
+            write_files=not args.no_files,
+            progress=lambda done, total: print(f"已写入 {done}/{total} 张照片的文件")
+        )
+    print(f"生成完成，用时 {time.perf_counter() - started:.1f} 秒: {counts}")
+
+
+if __name__ == '__main__':
+    main()
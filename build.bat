@@ -3,6 +3,10 @@
 REM 切换到脚本所在目录
 cd /d %~dp0
 
+REM 打包配置：默认使用love_story.spec，传入onedir使用启动优化的目录模式配置
+set SPEC_FILE=love_story.spec
+if /i "%1"=="onedir" set SPEC_FILE=love_story_onedir.spec
+
 echo 正在安装依赖项...
 pip install -r requirements.txt
 
@@ -12,8 +16,8 @@ if %errorlevel% neq 0 (
     exit /b 1
 )
 
-echo 正在打包应用程序...
-python -m PyInstaller love_story.spec
+echo 正在打包应用程序（%SPEC_FILE%）...
+python -m PyInstaller --noconfirm %SPEC_FILE%
 
 if %errorlevel% neq 0 (
     echo 打包失败！
@@ -21,5 +25,10 @@ if %errorlevel% neq 0 (
     exit /b 1
 )
 
+if /i "%1"=="onedir" (
+    echo 正在测量打包后的启动耗时...
+    python benchmarks\bench_startup.py --command "dist\love_story\love_story.exe" --report dist\startup_report.json
+)
+
 echo 打包完成！可执行文件位于 dist/ 目录下
-pause
\ No newline at end of file
+pause
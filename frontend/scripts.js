@@ -189,6 +189,9 @@ function initEventListeners() {
     setupBatchUpload();
     setupPhotoSearch();
     
+    // 上传照片时的标签联想
+    setupTagAutocomplete('photo-tags');
+    
     // 轮播图图片上传功能
     const uploadButton = document.getElementById('upload-carousel-image');
     const fileInput = document.getElementById('carousel_image_file');
@@ -241,187 +244,22 @@ let currentSlideIndex = 0;
 let carouselInterval;
 
 function loadHomePageData() {
-    // 加载配置信息
-    fetch('/api/configs')
-        .then(response => response.json())
-        .then(configs => {
-            // 创建配置映射
-            const configMap = {};
-            configs.forEach(config => {
-                configMap[config.key] = config.value;
-            });
-            
-            // 更新爱情宣言等内容
-            document.getElementById('motto').textContent = configMap.motto || '爱是永恒的';
-            document.getElementById('values').textContent = configMap.values || '真诚\n包容\n成长';
-            document.getElementById('rules').textContent = configMap.rules || '相互理解\n相互尊重\n相互信任';
-            
-            // 初始化轮播图数据
-            carouselItems = [];
-            
-            try {
-                // 简化的轮播图数据解析逻辑
-                const carouselData = configMap.carousel_items;
-                if (carouselData) {
-                    // 直接检查类型，避免链式调用导致的错误
-                    if (Array.isArray(carouselData)) {
-                        // 如果已经是数组，直接使用
-                        carouselItems = carouselData;
-                    } else if (typeof carouselData === 'string') {
-                        // 只对字符串类型尝试解析
-                        const trimmedData = carouselData.trim();
-                        if (trimmedData) {
-                            carouselItems = JSON.parse(trimmedData);
-                        }
-                    } else if (typeof carouselData === 'object' && carouselData !== null) {
-                        // 处理对象类型数据
-                        carouselItems = [carouselData]; // 转换为数组
-                    }
-                }
-            } catch (e) {
-                console.error('解析轮播图数据失败:', e);
-                // 如果解析失败，尝试使用旧格式的单个轮播图配置
-                if (configMap.carousel_image_url) {
-                    carouselItems.push({
-                        id: Date.now().toString(),
-                        image_url: configMap.carousel_image_url,
-                        title: configMap.carousel_title || '我们的故事',
-                        subtitle: configMap.carousel_subtitle || '珍藏每一个美好的瞬间'
-                    });
-                }
-            }
-            
-            // 如果没有轮播图数据，创建默认轮播图
-            if (carouselItems.length === 0) {
-                carouselItems.push({
-                    id: Date.now().toString(),
-                    image_url: 'https://picsum.photos/1200/600?random=1',
-                    title: '我们的故事',
-                    subtitle: '珍藏每一个美好的瞬间'
-                });
-            }
-            
-            // 渲染轮播图
-            renderCarousel();
-            
-            // 初始化轮播图控制
-            initCarouselControls();
-            
-            // 计算倒计时
-            if (configMap.relationship_date) {
-                updateCountdown('relationship', configMap.relationship_date);
-            }
-            
-            if (configMap.first_meeting_date) {
-                updateCountdown('meeting', configMap.first_meeting_date);
-            }
-        })
-        .catch(error => showNotification('加载配置失败', 'error'));
-    
-    // 加载最近事件
-    fetch('/api/events?limit=3')
-        .then(response => response.json())
-        .then(events => {
-            const eventsGrid = document.getElementById('recent-events-grid');
-            eventsGrid.innerHTML = '';
-            
-            if (events.length === 0) {
-                eventsGrid.innerHTML = `
-                    <div class="empty-state">
-                        <i class="fas fa-calendar-alt"></i>
-                        <p>还没有记录任何事件</p>
-                    </div>
-                `;
-                return;
-            }
-            
-            events.slice(0, 3).forEach(event => {
-                const eventDate = new Date(event.date);
-                const eventCard = document.createElement('div');
-                eventCard.className = 'event-card';
-                eventCard.innerHTML = `
-                    <div class="event-card-date">
-                        ${eventDate.getMonth() + 1}月${eventDate.getDate()}日
-                    </div>
-                    <div class="event-card-content">
-                        <h4 class="event-card-title">${event.title}</h4>
-                        <p class="event-card-description">${event.description || ''}</p>
-                    </div>
-                `;
-                
-                // 添加点击事件
-                eventCard.addEventListener('click', function() {
-                    navigateTo('events');
-                    // 可以添加滚动到该事件的逻辑
-                });
-                
-                eventsGrid.appendChild(eventCard);
-            });
-        })
-        .catch(error => showNotification('加载事件失败', 'error'));
-    
-    // 加载精选照片 - 优化版
-    fetch('/api/photos?limit=6')
+    // 首页所需的配置、最近事件和精选照片由一个接口一次返回
+    fetch('/api/home')
         .then(response => {
             if (!response.ok) {
                 throw new Error('网络响应异常');
             }
             return response.json();
         })
-        .then(photos => {
-            const photosGrid = document.getElementById('featured-photos-grid');
-            
-            // 清除现有内容
-            photosGrid.innerHTML = '';
-            
-            // 处理无照片情况
-            if (!photos || photos.length === 0) {
-                photosGrid.innerHTML = `
-                    <div class="empty-state">
-                        <i class="fas fa-image"></i>
-                        <p>还没有上传任何照片</p>
-                        <button class="btn btn-primary" onclick="navigateTo('photos')">
-                            去上传照片
-                        </button>
-                    </div>
-                `;
-                return;
-            }
-            
-            // 优化照片显示逻辑
-            const displayPhotos = photos.slice(0, 6);
-            displayPhotos.forEach(photo => {
-                const photoCard = document.createElement('div');
-                photoCard.className = 'photo-card fade-in';
-                
-                // 构建照片卡片内容
-                const imagePath = photo.path || `/api/uploads/${photo.filename}`;
-                const imageAlt = photo.description || photo.original_name || '照片';
-                const photoDate = photo.date ? formatDate(photo.date) : '';
-                
-                photoCard.innerHTML = `
-                    <div class="photo-thumbnail">
-                        <img src="${imagePath}" alt="${imageAlt}" loading="lazy">
-                        <div class="photo-overlay">
-                            <span class="photo-description">${photo.description || ''}</span>
-                            ${photoDate ? `<span class="photo-date">${photoDate}</span>` : ''}
-                        </div>
-                    </div>
-                `;
-                
-                // 添加点击事件查看大图
-                photoCard.addEventListener('click', function() {
-                    openPhotoViewer(displayPhotos, displayPhotos.indexOf(photo));
-                });
-                
-                // 优化添加顺序，支持懒加载
-                setTimeout(() => {
-                    photosGrid.appendChild(photoCard);
-                }, displayPhotos.indexOf(photo) * 100); // 轻微延迟创建动画效果
-            });
+        .then(home => {
+            renderHomeConfigs(home.configs || {});
+            renderRecentEvents(home.recent_events || []);
+            renderFeaturedPhotos(home.featured_photos || []);
         })
         .catch(error => {
-            console.error('加载照片失败:', error);
+            console.error('加载首页数据失败:', error);
+            showNotification('加载首页数据失败', 'error');
             const photosGrid = document.getElementById('featured-photos-grid');
             photosGrid.innerHTML = `
                 <div class="error-state">
@@ -435,6 +273,188 @@ function loadHomePageData() {
         });
 }
 
+// 渲染首页配置：宣言、轮播图和倒计时
+function renderHomeConfigs(configMap) {
+    // 更新爱情宣言等内容
+    document.getElementById('motto').textContent = configMap.motto || '爱是永恒的';
+    document.getElementById('values').textContent = configMap.values || '真诚\n包容\n成长';
+    document.getElementById('rules').textContent = configMap.rules || '相互理解\n相互尊重\n相互信任';
+    
+    // 初始化轮播图数据
+    carouselItems = [];
+    
+    try {
+        // 简化的轮播图数据解析逻辑
+        const carouselData = configMap.carousel_items;
+        if (carouselData) {
+            // 直接检查类型，避免链式调用导致的错误
+            if (Array.isArray(carouselData)) {
+                // 如果已经是数组，直接使用
+                carouselItems = carouselData;
+            } else if (typeof carouselData === 'string') {
+                // 只对字符串类型尝试解析
+                const trimmedData = carouselData.trim();
+                if (trimmedData) {
+                    carouselItems = JSON.parse(trimmedData);
+                }
+            } else if (typeof carouselData === 'object' && carouselData !== null) {
+                // 处理对象类型数据
+                carouselItems = [carouselData]; // 转换为数组
+            }
+        }
+    } catch (e) {
+        console.error('解析轮播图数据失败:', e);
+        // 如果解析失败，尝试使用旧格式的单个轮播图配置
+        if (configMap.carousel_image_url) {
+            carouselItems.push({
+                id: Date.now().toString(),
+                image_url: configMap.carousel_image_url,
+                title: configMap.carousel_title || '我们的故事',
+                subtitle: configMap.carousel_subtitle || '珍藏每一个美好的瞬间'
+            });
+        }
+    }
+    
+    // 如果没有轮播图数据，创建默认轮播图
+    if (carouselItems.length === 0) {
+        carouselItems.push({
+            id: Date.now().toString(),
+            image_url: 'https://picsum.photos/1200/600?random=1',
+            title: '我们的故事',
+            subtitle: '珍藏每一个美好的瞬间'
+        });
+    }
+    
+    // 渲染轮播图
+    renderCarousel();
+    
+    // 初始化轮播图控制
+    initCarouselControls();
+    
+    // 计算倒计时
+    if (configMap.relationship_date) {
+        updateCountdown('relationship', configMap.relationship_date);
+    }
+    
+    if (configMap.first_meeting_date) {
+        updateCountdown('meeting', configMap.first_meeting_date);
+    }
+}
+
+// 渲染首页最近事件
+function renderRecentEvents(events) {
+    const eventsGrid = document.getElementById('recent-events-grid');
+    eventsGrid.innerHTML = '';
+    
+    if (events.length === 0) {
+        eventsGrid.innerHTML = `
+            <div class="empty-state">
+                <i class="fas fa-calendar-alt"></i>
+                <p>还没有记录任何事件</p>
+            </div>
+        `;
+        return;
+    }
+    
+    events.slice(0, 3).forEach(event => {
+        const eventDate = new Date(event.date);
+        const eventCard = document.createElement('div');
+        eventCard.className = 'event-card';
+        eventCard.innerHTML = `
+            <div class="event-card-date">
+                ${eventDate.getMonth() + 1}月${eventDate.getDate()}日
+            </div>
+            <div class="event-card-content">
+                <h4 class="event-card-title">${event.title}</h4>
+                <p class="event-card-description">${event.description || ''}</p>
+            </div>
+        `;
+        
+        // 添加点击事件
+        eventCard.addEventListener('click', function() {
+            navigateTo('events');
+            // 可以添加滚动到该事件的逻辑
+        });
+        
+        eventsGrid.appendChild(eventCard);
+    });
+}
+
+// 渲染首页精选照片
+function renderFeaturedPhotos(photos) {
+    const photosGrid = document.getElementById('featured-photos-grid');
+    
+    // 清除现有内容
+    photosGrid.innerHTML = '';
+    
+    // 处理无照片情况
+    if (!photos || photos.length === 0) {
+        photosGrid.innerHTML = `
+            <div class="empty-state">
+                <i class="fas fa-image"></i>
+                <p>还没有上传任何照片</p>
+                <button class="btn btn-primary" onclick="navigateTo('photos')">
+                    去上传照片
+                </button>
+            </div>
+        `;
+        return;
+    }
+    
+    // 优化照片显示逻辑
+    const displayPhotos = photos.slice(0, 6);
+    displayPhotos.forEach(photo => {
+        const photoCard = document.createElement('div');
+        photoCard.className = 'photo-card fade-in';
+        
+        // 构建照片卡片内容（优先使用缩略图）
+        const imagePath = photo.thumbnail_url || photo.path || `/api/uploads/${photo.filename}`;
+        const imageAlt = photo.description || photo.original_name || '照片';
+        const photoDate = photo.date ? formatDate(photo.date) : '';
+        
+        photoCard.innerHTML = `
+            <div class="photo-thumbnail">
+                <img src="${imagePath}" alt="${imageAlt}" loading="lazy"${photoPlaceholderAttrs(photo)}>
+                <div class="photo-overlay">
+                    <span class="photo-description">${photo.description || ''}</span>
+                    ${photoDate ? `<span class="photo-date">${photoDate}</span>` : ''}
+                </div>
+            </div>
+        `;
+        
+        attachAnimationPreview(photoCard, photo);
+        
+        // 添加点击事件查看大图
+        photoCard.addEventListener('click', function() {
+            openPhotoViewer(displayPhotos, displayPhotos.indexOf(photo));
+        });
+        
+        // 优化添加顺序，支持懒加载
+        setTimeout(() => {
+            photosGrid.appendChild(photoCard);
+        }, displayPhotos.indexOf(photo) * 100); // 轻微延迟创建动画效果
+    });
+}
+
+// 照片<img>的占位属性：内联的占位图作为背景立即显示，宽高让浏览器提前预留布局
+function photoPlaceholderAttrs(photo) {
+    let attrs = '';
+    if (photo.placeholder) attrs += ` style="background-image: url('${photo.placeholder}')"`;
+    if (photo.width && photo.height) attrs += ` width="${photo.width}" height="${photo.height}"`;
+    return attrs;
+}
+
+// 动图卡片默认只加载静态封面，鼠标悬停时才加载缩小的预览动画
+function attachAnimationPreview(photoCard, photo) {
+    if (!photo.animation_url) return;
+    const img = photoCard.querySelector('img');
+    if (!img) return;
+    const posterUrl = img.getAttribute('src');
+    photoCard.classList.add('animated');
+    photoCard.addEventListener('mouseenter', () => { img.src = photo.animation_url; });
+    photoCard.addEventListener('mouseleave', () => { img.src = posterUrl; });
+}
+
 // 更新倒计时
 function updateCountdown(type, dateStr) {
     const targetDate = new Date(dateStr);
@@ -621,7 +641,6 @@ function deleteEvent(eventId) {
 
 // 加载照片
 function loadPhotos(albumId = 'all', searchQuery = '') {
-    let url = '/api/photos';
     const params = new URLSearchParams();
     
     if (albumId !== 'all') {
@@ -632,59 +651,236 @@ function loadPhotos(albumId = 'all', searchQuery = '') {
         params.append('search', searchQuery);
     }
     
-    if (params.toString()) {
-        url += '?' + params.toString();
+    if (photoGrid) {
+        photoGrid.destroy();
     }
+    photoGrid = createPhotoGrid(document.getElementById('photos-container'), params);
+}
+
+// ===== 虚拟化照片网格 =====
+// 只为可见的行（加上下各几行缓冲）创建卡片，滚动时复用卡片节点，DOM节点和解码的图片数量不随照片数量增长；
+// 照片按游标分页加载，渲染范围接近已加载的末尾时加载下一页
+
+const PHOTO_PAGE_SIZE = 100;
+// 与.photos-container的minmax(200px, 1fr)和gap一致
+const PHOTO_GRID_MIN_WIDTH = 200;
+const PHOTO_GRID_GAP = 15;
+const PHOTO_GRID_OVERSCAN_ROWS = 3;
+
+let photoGrid = null;
+
+function createPhotoGrid(container, params) {
+    const photos = [];
+    let total = null;
+    let cursor = null;
+    let finished = false;
+    let loading = null;
+    let destroyed = false;
+    let frame = null;
+    let layout = null;
+    const controller = new AbortController();
+    
+    // 正在显示的卡片 {照片下标: 卡片} 和空闲的卡片
+    const visibleCards = new Map();
+    const freeCards = [];
     
-    showLoader();
-    fetch(url)
-        .then(response => response.json())
-        .then(photos => {
-            hideLoader();
-            currentPhotos = photos;
-            
-            const photosContainer = document.getElementById('photos-container');
-            photosContainer.innerHTML = '';
-            
-            if (photos.length === 0) {
-                photosContainer.innerHTML = `
-                    <div class="empty-state">
-                        <i class="fas fa-image"></i>
-                        <p>没有找到照片</p>
-                        <button class="btn-primary" onclick="document.getElementById('upload-photo-btn').click()">
-                            上传照片
-                        </button>
-                    </div>
-                `;
-                return;
+    currentPhotos = photos;
+    container.innerHTML = '';
+    container.classList.add('virtual');
+    container.style.height = '0px';
+    
+    function createCard() {
+        const card = document.createElement('div');
+        card.className = 'photo-card';
+        card.innerHTML = `
+            <img alt="" loading="lazy" decoding="async">
+            <div class="photo-overlay">
+                <div class="photo-name"></div>
+            </div>
+        `;
+        const img = card.querySelector('img');
+        
+        // 事件只在创建时绑定一次，通过下标找到卡片当前显示的照片
+        card.addEventListener('click', () => {
+            openPhotoViewer(photos, Number(card.dataset.index));
+        });
+        card.addEventListener('mouseenter', () => {
+            const photo = photos[Number(card.dataset.index)];
+            if (photo && photo.animation_url) img.src = photo.animation_url;
+        });
+        card.addEventListener('mouseleave', () => {
+            const photo = photos[Number(card.dataset.index)];
+            if (photo && photo.animation_url) img.src = photoThumbnailUrl(photo);
+        });
+        container.appendChild(card);
+        return card;
+    }
+    
+    function bindCard(card, index) {
+        const photo = photos[index];
+        const img = card.querySelector('img');
+        card.dataset.index = index;
+        card.classList.toggle('animated', Boolean(photo.animation_url));
+        img.style.backgroundImage = photo.placeholder ? `url('${photo.placeholder}')` : '';
+        img.alt = photo.original_name;
+        // 先清除旧图片，新缩略图加载完成前显示占位图而不是复用前的照片
+        const src = photoThumbnailUrl(photo);
+        if (img.getAttribute('src') !== src) {
+            img.removeAttribute('src');
+            img.src = src;
+        }
+        card.querySelector('.photo-name').textContent = photo.original_name;
+    }
+    
+    function placeCard(card, index) {
+        const row = Math.floor(index / layout.columns);
+        const column = index % layout.columns;
+        card.style.width = `${layout.cardWidth}px`;
+        card.style.height = `${layout.cardWidth}px`;
+        card.style.top = `${row * layout.rowHeight}px`;
+        card.style.left = `${column * (layout.cardWidth + PHOTO_GRID_GAP)}px`;
+        card.style.display = '';
+    }
+    
+    function measure() {
+        const width = container.clientWidth;
+        if (!width) return null;
+        const columns = Math.max(1, Math.floor((width + PHOTO_GRID_GAP) / (PHOTO_GRID_MIN_WIDTH + PHOTO_GRID_GAP)));
+        const cardWidth = (width - PHOTO_GRID_GAP * (columns - 1)) / columns;
+        return { width, columns, cardWidth, rowHeight: cardWidth + PHOTO_GRID_GAP };
+    }
+    
+    function render() {
+        frame = null;
+        if (destroyed) return;
+        
+        const measured = measure();
+        if (!measured) return;  // 页面未显示
+        const relayout = !layout || measured.width !== layout.width;
+        layout = measured;
+        
+        // 总数未知时按已加载的数量撑开高度，加载更多后继续增长
+        const count = Math.max(total || 0, photos.length);
+        const rows = Math.ceil(count / layout.columns);
+        container.style.height = `${Math.max(0, rows * layout.rowHeight - PHOTO_GRID_GAP)}px`;
+        
+        const top = -container.getBoundingClientRect().top;
+        const firstRow = Math.max(0, Math.floor(top / layout.rowHeight) - PHOTO_GRID_OVERSCAN_ROWS);
+        const lastRow = Math.ceil((top + window.innerHeight) / layout.rowHeight) + PHOTO_GRID_OVERSCAN_ROWS;
+        const first = firstRow * layout.columns;
+        const last = Math.min(photos.length, (lastRow + 1) * layout.columns);
+        
+        // 回收移出范围的卡片
+        visibleCards.forEach((card, index) => {
+            if (index < first || index >= last) {
+                visibleCards.delete(index);
+                card.style.display = 'none';
+                freeCards.push(card);
+            } else if (relayout) {
+                placeCard(card, index);
             }
-            
-            photos.forEach(photo => {
-                const photoCard = document.createElement('div');
-                photoCard.className = 'photo-card';
-                
-                // 使用缩略图URL
-                const thumbnailUrl = photo.thumbnail_url || `/api/uploads/thumbnails/${photo.filename}`;
-                
-                photoCard.innerHTML = `
-                    <img src="${thumbnailUrl}" alt="${photo.original_name}">
-                    <div class="photo-overlay">
-                        <div class="photo-name">${photo.original_name}</div>
-                    </div>
-                `;
-                
-                // 添加点击事件查看大图
-                photoCard.addEventListener('click', function() {
-                    openPhotoViewer(photos, photos.indexOf(photo));
-                });
+        });
+        
+        for (let index = first; index < last; index++) {
+            if (visibleCards.has(index)) continue;
+            const card = freeCards.pop() || createCard();
+            bindCard(card, index);
+            placeCard(card, index);
+            visibleCards.set(index, card);
+        }
+        
+        if (!finished && last + layout.columns * PHOTO_GRID_OVERSCAN_ROWS >= photos.length) {
+            loadMore();
+        }
+    }
+    
+    function scheduleRender() {
+        if (frame === null && !destroyed) {
+            frame = requestAnimationFrame(render);
+        }
+    }
+    
+    function showEmptyState() {
+        container.classList.remove('virtual');
+        container.style.height = '';
+        container.innerHTML = `
+            <div class="empty-state">
+                <i class="fas fa-image"></i>
+                <p>没有找到照片</p>
+                <button class="btn-primary" onclick="document.getElementById('upload-photo-btn').click()">
+                    上传照片
+                </button>
+            </div>
+        `;
+    }
+    
+    function loadMore() {
+        if (loading || finished) return;
+        
+        const pageParams = new URLSearchParams(params);
+        pageParams.set('limit', PHOTO_PAGE_SIZE);
+        if (cursor) pageParams.set('cursor', cursor);
+        
+        const firstPage = photos.length === 0;
+        if (firstPage) showLoader();
+        loading = fetch(`/api/photos?${pageParams.toString()}`, { signal: controller.signal })
+            .then(response => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                if (response.headers.has('X-Total-Count')) {
+                    total = Number(response.headers.get('X-Total-Count'));
+                }
+                cursor = response.headers.get('X-Next-Cursor');
+                finished = !cursor;
+                return response.json();
+            })
+            .then(page => {
+                if (firstPage) hideLoader();
+                if (destroyed) return;
+                photos.push(...page);
+                if (finished) total = photos.length;
+                loading = null;
                 
-                photosContainer.appendChild(photoCard);
+                if (photos.length === 0) {
+                    showEmptyState();
+                    return;
+                }
+                scheduleRender();
+            })
+            .catch(error => {
+                if (firstPage) hideLoader();
+                loading = null;
+                if (destroyed) return;
+                // 停止自动加载，避免每一帧重复请求失败的页面
+                finished = true;
+                showNotification('加载照片失败', 'error');
             });
-        })
-        .catch(error => {
-            hideLoader();
-            showNotification('加载照片失败', 'error');
-        });
+    }
+    
+    const resizeObserver = new ResizeObserver(scheduleRender);
+    resizeObserver.observe(container);
+    window.addEventListener('scroll', scheduleRender, { passive: true });
+    window.addEventListener('resize', scheduleRender);
+    
+    loadMore();
+    
+    return {
+        destroy() {
+            destroyed = true;
+            controller.abort();
+            if (frame !== null) cancelAnimationFrame(frame);
+            resizeObserver.disconnect();
+            window.removeEventListener('scroll', scheduleRender);
+            window.removeEventListener('resize', scheduleRender);
+            container.classList.remove('virtual');
+            container.style.height = '';
+            container.innerHTML = '';
+        }
+    };
+}
+
+// 照片的缩略图URL
+function photoThumbnailUrl(photo) {
+    return photo.thumbnail_url || `/api/uploads/thumbnails/${photo.filename}`;
 }
 
 // 打开照片查看器
@@ -890,11 +1086,13 @@ function setupBatchUpload() {
             
             showLoader();
             
-            fetch('/api/photos/batch', {
+            fetch('/api/photos/batch?async=1', {
                 method: 'POST',
                 body: formData
             })
-            .then(response => response.json())
+            .then(response => readJobResponse(response, job => {
+                showNotification(`正在处理照片 ${job.progress.done}/${job.progress.total || files.length}`, 'success');
+            }))
             .then(data => {
                 hideLoader();
                 
@@ -951,6 +1149,7 @@ function setupPhotoSearch() {
             const dateTo = document.getElementById('search-photo-date-to').value;
             const albumId = document.getElementById('search-photo-album').value;
             const eventId = document.getElementById('search-photo-event').value;
+            const tagQuery = document.getElementById('search-photo-tag-query').value.trim();
             
             // 构建搜索URL
             let url = '/api/photos/search?';
@@ -961,6 +1160,7 @@ function setupPhotoSearch() {
             if (dateTo) params.append('date_to', dateTo);
             if (albumId) params.append('album_id', albumId);
             if (eventId) params.append('event_id', eventId);
+            if (tagQuery) params.append('tag_query', tagQuery);
             
             // 获取选中的标签
             const selectedTags = Array.from(document.querySelectorAll('#search-photo-tags input:checked'))
@@ -974,6 +1174,10 @@ function setupPhotoSearch() {
                 .then(response => response.json())
                 .then(data => {
                     hideLoader();
+                    if (data.error) {
+                        showNotification(data.error, 'error');
+                        return;
+                    }
                     // 关闭搜索模态框
                     document.getElementById('photo-search-modal').classList.remove('active');
                     
@@ -1000,12 +1204,14 @@ function setupPhotoSearch() {
                         const thumbnailUrl = photo.thumbnail_url || `/api/uploads/thumbnails/${photo.filename}`;
                         
                         photoCard.innerHTML = `
-                            <img src="${thumbnailUrl}" alt="${photo.original_name}">
+                            <img src="${thumbnailUrl}" alt="${photo.original_name}" loading="lazy"${photoPlaceholderAttrs(photo)}>
                             <div class="photo-overlay">
                                 <div class="photo-name">${photo.original_name}</div>
                             </div>
                         `;
                         
+                        attachAnimationPreview(photoCard, photo);
+                        
                         // 添加点击事件查看大图
                         photoCard.addEventListener('click', function() {
                             openPhotoViewer(data, data.indexOf(photo));
@@ -1030,7 +1236,8 @@ function loadTagsForSearch() {
     tagsContainer.innerHTML = '<label>标签 (多选):</label><div class="tags-container"></div>';
     const tagsList = tagsContainer.querySelector('.tags-container');
     
-    fetch('/api/tags')
+    // 按使用次数排序，常用标签排在前面
+    fetch('/api/tags?sort=usage')
         .then(response => response.json())
         .then(tags => {
             tags.forEach(tag => {
@@ -1038,7 +1245,7 @@ function loadTagsForSearch() {
                 tagElement.className = 'tag-item';
                 tagElement.innerHTML = `
                     <input type="checkbox" id="search-tag-${tag.id}" name="tag" value="${tag.id}">
-                    <label for="search-tag-${tag.id}">${tag.name}</label>
+                    <label for="search-tag-${tag.id}">${tag.name} (${tag.usage_count})</label>
                 `;
                 tagsList.appendChild(tagElement);
             });
@@ -1046,6 +1253,43 @@ function loadTagsForSearch() {
         .catch(error => console.error('加载标签失败:', error));
 }
 
+// 标签输入框联想（逗号分隔的多个标签，只联想最后一个）
+function setupTagAutocomplete(inputId) {
+    const input = document.getElementById(inputId);
+    if (!input) return;
+    
+    const datalist = document.createElement('datalist');
+    datalist.id = `${inputId}-suggestions`;
+    input.parentNode.appendChild(datalist);
+    input.setAttribute('list', datalist.id);
+    input.setAttribute('autocomplete', 'off');
+    
+    let lastPrefix = null;
+    input.addEventListener('input', debounce(function() {
+        const parts = input.value.split(',');
+        const prefix = parts.pop().trim();
+        const head = parts.map(part => part.trim()).filter(Boolean);
+        if (prefix === lastPrefix) return;
+        lastPrefix = prefix;
+        
+        fetch(`/api/tags/suggest?prefix=${encodeURIComponent(prefix)}&limit=10`)
+            .then(response => response.json())
+            .then(suggestions => {
+                // datalist按整个输入值匹配，因此选项中带上前面已输入的标签
+                datalist.innerHTML = '';
+                suggestions
+                    .filter(tag => !head.includes(tag.name))
+                    .forEach(tag => {
+                        const option = document.createElement('option');
+                        option.value = head.concat(tag.name).join(',');
+                        option.label = `${tag.name} (${tag.usage_count})`;
+                        datalist.appendChild(option);
+                    });
+            })
+            .catch(error => console.error('获取标签联想失败:', error));
+    }, 150));
+}
+
 // 加载相册
 function loadAlbums() {
     fetch('/api/albums')
@@ -1744,17 +1988,40 @@ function loadBackupList() {
         });
 }
 
-// 备份数据
-function backupData() {
-    fetch('/api/backup', { 
-        method: 'POST'
-    })
-    .then(response => {
+// 读取可能以后台任务执行的接口响应：202时通过SSE等待任务结束，返回任务结果
+function readJobResponse(response, onProgress) {
+    if (response.status !== 202) {
         if (!response.ok) {
-            throw new Error('备份失败');
+            return response.json().then(err => { throw new Error(err.error || '请求失败'); });
         }
         return response.json();
+    }
+    return response.json().then(accepted => new Promise((resolve, reject) => {
+        const source = new EventSource(accepted.events_url);
+        source.onmessage = event => {
+            const job = JSON.parse(event.data);
+            if (onProgress && job.progress) onProgress(job);
+            if (job.status === 'succeeded') {
+                source.close();
+                resolve(job.result);
+            } else if (['failed', 'cancelled', 'interrupted'].includes(job.status)) {
+                source.close();
+                reject(new Error(job.error || job.message || '任务未完成'));
+            }
+        };
+        source.onerror = () => {
+            source.close();
+            reject(new Error('无法获取任务进度'));
+        };
+    }));
+}
+
+// 备份数据
+function backupData() {
+    fetch('/api/backup?async=1', { 
+        method: 'POST'
     })
+    .then(response => readJobResponse(response))
     .then(data => {
         showNotification(`数据备份成功，文件：${data.backup_file.filename}`, 'success');
         // 重新加载备份列表
@@ -1768,15 +2035,10 @@ function backupData() {
 // 从备份列表恢复数据
 function restoreFromBackup(filename) {
     if (confirm(`确定要从备份文件 ${filename} 恢复数据吗？当前数据将被覆盖。`)) {
-        fetch(`/api/restore/${filename}`, {
+        fetch(`/api/restore/${filename}?async=1`, {
             method: 'POST'
         })
-        .then(response => {
-            if (!response.ok) {
-                return response.json().then(err => { throw new Error(err.error || '恢复失败'); });
-            }
-            return response.json();
-        })
+        .then(response => readJobResponse(response))
         .then(() => {
             showNotification('数据恢复成功', 'success');
             
@@ -20,10 +20,11 @@ sys.path.append(APP_ROOT)
 from backend.app import create_app
 from backend.models import db, Event, Album, Config
 
-def generate_sample_data():
-    """生成示例数据"""
+def generate_sample_data(app=None):
+    """生成示例数据（可以传入已创建的应用实例，避免重复初始化）"""
     # 创建Flask应用实例
-    app = create_app()
+    if app is None:
+        app = create_app()
     
     with app.app_context():
         # 检查是否已有数据
@@ -0,0 +1,85 @@
+# -*- mode: python ; coding: utf-8 -*-
+
+# 恋爱故事记录应用 - PyInstaller目录模式打包配置（启动优化）
+#
+# 与单文件模式相比:
+# - 目录模式（onedir）不需要在每次启动时把整个程序解压到临时目录_MEIPASS，
+#   前端资源和依赖库直接从安装目录读取
+# - 纯Python模块以预编译字节码（optimize=1）的形式放在PYZ归档中，启动时不需要编译
+# - 排除应用用不到的标准库和第三方模块，减小体积和扫描开销
+# - 不使用UPX压缩，避免每次加载动态库时解压
+#
+# 用法: build.bat onedir  或  python -m PyInstaller love_story_onedir.spec
+# 输出: dist/love_story/love_story.exe（整个dist/love_story目录一起分发）
+
+import os
+
+ROOT = os.path.abspath(SPECPATH)
+
+# 应用用不到的模块
+EXCLUDES = [
+    # 图形界面和交互环境
+    'tkinter', '_tkinter', 'turtle', 'turtledemo', 'idlelib', 'curses',
+    'IPython', 'jupyter_client', 'notebook',
+    # 测试和开发工具
+    'unittest', 'doctest', 'pydoc', 'pydoc_data', 'test', 'lib2to3', 'pdb',
+    'setuptools', 'pkg_resources', 'distutils', 'pip', 'wheel',
+    # 应用不使用的标准库服务
+    'xmlrpc', 'ftplib', 'imaplib', 'poplib', 'smtplib', 'telnetlib', 'nntplib',
+    'mailbox', 'tarfile', 'lzma', 'bz2',
+    # 科学计算库（如果开发环境中安装了，会被Pillow等的可选导入带进来）
+    'numpy', 'scipy', 'matplotlib', 'pandas',
+    # Pillow中与GUI框架集成的模块
+    'PIL.ImageQt', 'PIL.ImageTk', 'PIL.ImageShow', 'PyQt5', 'PyQt6', 'PySide2', 'PySide6',
+    # SQLAlchemy中SQLite以外的数据库方言
+    'sqlalchemy.dialects.mysql', 'sqlalchemy.dialects.postgresql',
+    'sqlalchemy.dialects.oracle', 'sqlalchemy.dialects.mssql',
+]
+
+a = Analysis(
+    [os.path.join(ROOT, 'main.py')],
+    pathex=[ROOT],
+    binaries=[],
+    datas=[
+        (os.path.join(ROOT, 'frontend'), 'frontend'),
+        (os.path.join(ROOT, 'favicon.ico'), '.'),
+    ],
+    hiddenimports=[
+        'backend.app',
+        'init_sample_data',
+        'sqlalchemy.dialects.sqlite',
+        # 可选的JSON后端，未安装时会被忽略
+        'orjson',
+    ],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=EXCLUDES,
+    noarchive=False,
+    optimize=1,
+)
+
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='love_story',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=False,
+    icon=os.path.join(ROOT, 'favicon.ico'),
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    name='love_story',
+)
@@ -1,12 +1,22 @@
 import os
 import sys
+import socket
 import threading
+import multiprocessing
 import time
-import webbrowser
-from subprocess import Popen
+import json
 import shutil
 from datetime import datetime
 
+# 进程启动时间，用于报告启动耗时
+STARTED_AT = time.perf_counter()
+
+# 启动各阶段的时间点（Unix时间戳），设置LOVE_STORY_STARTUP_REPORT=<文件路径>时写入该文件
+STARTUP_MARKS = {'main_started': time.time()}
+
+# 服务器端口，可以通过环境变量LOVE_STORY_PORT修改
+PORT = int(os.environ.get('LOVE_STORY_PORT', 5000))
+
 # 获取应用根目录
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 
@@ -20,9 +30,25 @@ else:
     # 在开发环境中，使用应用根目录作为资源路径
     RESOURCES_PATH = APP_ROOT
 
+# 记录启动阶段
+def mark_startup(name):
+    STARTUP_MARKS[name] = time.time()
+
+# 写出启动报告
+def write_startup_report():
+    report_path = os.environ.get('LOVE_STORY_STARTUP_REPORT')
+    if not report_path:
+        return
+    report = dict(STARTUP_MARKS, frozen=hasattr(sys, '_MEIPASS'), resources_path=RESOURCES_PATH)
+    try:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f)
+    except OSError as e:
+        print(f"写入启动报告失败: {str(e)}")
+
 # 确保数据目录存在
 def ensure_data_directory():
-    data_dir = os.path.join(os.path.expanduser("~"), ".love_story_app")
+    data_dir = os.environ.get("LOVE_STORY_APP_DATA_DIR") or os.path.join(os.path.expanduser("~"), ".love_story_app")
     if not os.path.exists(data_dir):
         os.makedirs(data_dir)
     return data_dir
@@ -51,29 +77,41 @@ def copy_required_files(data_dir):
     if not os.path.exists(backup_dir):
         os.makedirs(backup_dir)
 
-# 初始化示例数据
-def initialize_sample_data():
-    # 检查是否已经初始化过示例数据
-    data_dir = ensure_data_directory()
+# 检查是否需要初始化示例数据
+def needs_sample_data(data_dir):
     db_path = os.path.join(data_dir, "love_story.db")
     init_flag_path = os.path.join(data_dir, ".sample_data_initialized")
     
-    # 如果数据库文件存在但初始化标记不存在，运行初始化脚本
-    if os.path.exists(db_path) and not os.path.exists(init_flag_path):
-        print("正在初始化示例数据...")
-        try:
-            # 导入并运行初始化函数
-            from init_sample_data import generate_sample_data
-            generate_sample_data()
-            # 创建初始化标记文件
-            with open(init_flag_path, 'w') as f:
-                f.write(datetime.now().isoformat())
-            print("示例数据初始化完成")
-        except Exception as e:
-            print(f"初始化示例数据时出错: {str(e)}")
+    # 如果数据库文件存在但初始化标记不存在，需要运行初始化脚本
+    return os.path.exists(db_path) and not os.path.exists(init_flag_path)
+
+# 初始化示例数据（复用已创建的应用实例）
+def initialize_sample_data(app, data_dir):
+    init_flag_path = os.path.join(data_dir, ".sample_data_initialized")
+    print("正在初始化示例数据...")
+    try:
+        # 导入并运行初始化函数
+        from init_sample_data import generate_sample_data
+        generate_sample_data(app)
+        # 创建初始化标记文件
+        with open(init_flag_path, 'w') as f:
+            f.write(datetime.now().isoformat())
+        print("示例数据初始化完成")
+    except Exception as e:
+        print(f"初始化示例数据时出错: {str(e)}")
+
+# 创建监听套接字
+def create_listen_socket():
+    # 在导入Flask等较重的模块之前先开始监听，浏览器的连接会在队列中等待应用初始化完成
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if os.name != 'nt':
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('localhost', PORT))
+    sock.listen(128)
+    return sock
 
 # 启动Flask服务器
-def start_server():
+def start_server(listen_socket):
     # 设置环境变量
     data_dir = ensure_data_directory()
     os.environ["LOVE_STORY_APP_DATA_DIR"] = data_dir
@@ -83,19 +121,37 @@ def start_server():
     if backend_dir not in sys.path:
         sys.path.append(backend_dir)
     
-    # 初始化示例数据
-    initialize_sample_data()
+    # 需要在创建应用（可能新建数据库）之前判断
+    sample_data_needed = needs_sample_data(data_dir)
     
     # 正确导入Flask应用
     from backend.app import create_app
-    app = create_app()
-    app.run(host='localhost', port=5000, debug=False)
+    mark_startup('app_imported')
+    try:
+        app = create_app()
+    except Exception as e:
+        print(f"应用初始化失败: {str(e)}")
+        listen_socket.close()
+        return
+    
+    mark_startup('app_created')
+    
+    # 初始化示例数据
+    if sample_data_needed:
+        initialize_sample_data(app, data_dir)
+    
+    # 使用已经在监听的套接字
+    from werkzeug.serving import make_server
+    server = make_server('localhost', PORT, app, threaded=True, fd=listen_socket.fileno())
+    print(f"服务器已就绪: http://localhost:{PORT}/（启动用时 {(time.perf_counter() - STARTED_AT) * 1000:.0f} 毫秒）")
+    mark_startup('serving')
+    write_startup_report()
+    server.serve_forever()
 
 # 打开浏览器
 def open_browser():
-    # 等待服务器启动
-    time.sleep(2)
-    webbrowser.open('http://localhost:5000/')
+    import webbrowser
+    webbrowser.open(f'http://localhost:{PORT}/')
 
 # 主函数
 def main():
@@ -106,13 +162,22 @@ def main():
     print("正在启动恋爱故事记录应用...")
     print(f"数据将存储在: {data_dir}")
     
+    # 先开始监听端口
+    try:
+        listen_socket = create_listen_socket()
+    except OSError as e:
+        print(f"无法监听端口 {PORT}，请检查是否已有程序占用: {e}")
+        sys.exit(1)
+    mark_startup('listening')
+    
     # 启动服务器线程
-    server_thread = threading.Thread(target=start_server, daemon=True)
+    server_thread = threading.Thread(target=start_server, args=(listen_socket,), daemon=True)
     server_thread.start()
     
-    # 打开浏览器
-    browser_thread = threading.Thread(target=open_browser)
-    browser_thread.start()
+    # 套接字已经可以接受连接，立即打开浏览器（设置LOVE_STORY_NO_BROWSER=1时跳过）
+    if os.environ.get('LOVE_STORY_NO_BROWSER') != '1':
+        browser_thread = threading.Thread(target=open_browser, daemon=True)
+        browser_thread.start()
     
     try:
         # 保持主线程运行
@@ -123,4 +188,6 @@ def main():
         sys.exit(0)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # 打包后的程序中，缩略图重建使用的进程池需要由此启动工作进程
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+恋爱故事记录应用 - 维护命令行工具
+
+用法:
+    python manage.py migrate-layout [--batch-size 200] [--pause 0.05]
+    python manage.py backfill-exif [--batch-size 200] [--all]
+    python manage.py backfill-placeholders [--batch-size 200]
+    python manage.py regenerate-thumbnails [--workers N] [--force] [--restart]
+
+应用运行期间也可以执行，所有操作都按批次进行。
+"""
+
+import os
+import sys
+import time
+import argparse
+
+# 获取应用根目录
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+if APP_ROOT not in sys.path:
+    sys.path.insert(0, APP_ROOT)
+
+
+def create_cli_app(data_dir=None):
+    """创建用于命令行的Flask应用实例（不启动后台对账线程和任务工作线程）"""
+    if data_dir:
+        os.environ['LOVE_STORY_APP_DATA_DIR'] = data_dir
+    elif 'LOVE_STORY_APP_DATA_DIR' not in os.environ:
+        # 与main.py保持一致，默认使用用户主目录下的数据目录
+        os.environ['LOVE_STORY_APP_DATA_DIR'] = os.path.join(os.path.expanduser('~'), '.love_story_app')
+    os.environ['LOVE_STORY_STORAGE_RECONCILE_INTERVAL'] = '0'
+    os.environ['LOVE_STORY_JOB_WORKERS'] = '0'
+
+    from backend.app import create_app
+    return create_app()
+
+
+def migrate_layout(app, batch_size, pause):
+    """把平铺布局中的照片和缩略图按批迁移到分片布局"""
+    from backend.models import db, Photo
+    from backend.utils import migrate_photo_to_sharded_layout
+
+    upload_folder = app.config['UPLOAD_FOLDER']
+    with app.app_context():
+        total = db.session.query(Photo.id).count()
+        print(f"共 {total} 张照片，开始迁移到分片目录布局...")
+
+        processed = 0
+        moved = 0
+        last_id = 0
+        while True:
+            # 按主键分批读取，每批之后释放会话，避免长时间占用数据库
+            batch = db.session.query(Photo.id, Photo.filename) \
+                .filter(Photo.id > last_id).order_by(Photo.id).limit(batch_size).all()
+            db.session.remove()
+            if not batch:
+                break
+
+            for photo_id, filename in batch:
+                try:
+                    moved += migrate_photo_to_sharded_layout(upload_folder, filename)
+                except OSError as e:
+                    print(f"迁移文件失败 {filename}: {e}")
+                last_id = photo_id
+
+            processed += len(batch)
+            print(f"已处理 {processed}/{total} 张照片，移动了 {moved} 个文件")
+            if pause:
+                time.sleep(pause)
+
+        print(f"迁移完成，共移动 {moved} 个文件")
+    return moved
+
+
+def backfill_exif(app, batch_size, only_missing):
+    """为已有照片补齐EXIF元数据并报告进度"""
+    from backend.models import db
+    from backend.utils import backfill_photo_metadata
+
+    started = time.time()
+
+    def report(processed, total):
+        elapsed = max(time.time() - started, 1e-6)
+        print(f"已处理 {processed}/{total} 张照片（{processed / elapsed:.1f} 张/秒）")
+
+    with app.app_context():
+        processed = backfill_photo_metadata(
+            db, app.config['UPLOAD_FOLDER'],
+            batch_size=batch_size, only_missing=only_missing, progress=report
+        )
+    print(f"元数据补齐完成，共处理 {processed} 张照片")
+    return processed
+
+
+def backfill_placeholders(app, batch_size):
+    """为还没有占位图的照片生成占位图并报告进度"""
+    from backend.models import db
+    from backend.utils import backfill_photo_placeholders
+
+    started = time.time()
+
+    def report(processed, total):
+        elapsed = max(time.time() - started, 1e-6)
+        print(f"已处理 {processed}/{total} 张照片（{processed / elapsed:.1f} 张/秒）")
+
+    with app.app_context():
+        processed = backfill_photo_placeholders(
+            db, app.config['UPLOAD_FOLDER'], batch_size=batch_size, progress=report
+        )
+    print(f"占位图生成完成，共处理 {processed} 张照片")
+    return processed
+
+
+def regenerate_thumbnails(app, workers, force, batch_size, restart):
+    """用进程池重新生成缺失或过期的缩略图，中断后再次执行会从检查点继续"""
+    from backend.models import db
+    from backend.renditions import regenerate_thumbnails as regenerate, THUMBNAIL_CHECKPOINT_FILE
+
+    checkpoint_path = os.path.join(app.config['DATA_DIR'], THUMBNAIL_CHECKPOINT_FILE)
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    elif os.path.exists(checkpoint_path):
+        print("发现上次未完成的检查点，从中断处继续...")
+
+    def report(processed, total, stats):
+        print(f"已处理 {processed}/{total} 张照片，生成 {stats['generated']} 张缩略图"
+              f"（{stats['per_second']} 张/秒）")
+
+    with app.app_context():
+        stats = regenerate(
+            app.config['UPLOAD_FOLDER'], workers=workers, force=force,
+            checkpoint_path=checkpoint_path, batch_size=batch_size, progress=report
+        )
+        db.session.remove()
+    print(f"缩略图重建完成: 生成 {stats['generated']} 张，已是最新 {stats['current']} 张，"
+          f"原图缺失 {stats['missing']} 张，失败 {stats['failed']} 张，"
+          f"耗时 {stats['elapsed']:.1f} 秒（{stats['per_second']} 张/秒）")
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='恋爱故事记录应用维护工具')
+    parser.add_argument('--data-dir', help='数据目录，默认使用LOVE_STORY_APP_DATA_DIR或~/.love_story_app')
+    subparsers = parser.add_subparsers(dest='command')
+
+    layout_parser = subparsers.add_parser('migrate-layout', help='把上传文件迁移到分片目录布局')
+    layout_parser.add_argument('--batch-size', type=int, default=200, help='每批处理的照片数量')
+    layout_parser.add_argument('--pause', type=float, default=0.05, help='每批之间暂停的秒数')
+
+    exif_parser = subparsers.add_parser('backfill-exif', help='为已有照片提取EXIF元数据')
+    exif_parser.add_argument('--batch-size', type=int, default=200, help='每批处理的照片数量')
+    exif_parser.add_argument('--all', action='store_true', help='重新处理所有照片，而不仅是未提取过的')
+
+    placeholder_parser = subparsers.add_parser('backfill-placeholders', help='为已有照片生成列表占位图')
+    placeholder_parser.add_argument('--batch-size', type=int, default=200, help='每批处理的照片数量')
+
+    thumbs_parser = subparsers.add_parser('regenerate-thumbnails', help='并行重新生成缺失或过期的缩略图')
+    thumbs_parser.add_argument('--workers', type=int, default=None, help='工作进程数，默认使用所有CPU核心')
+    thumbs_parser.add_argument('--force', action='store_true', help='重新生成所有缩略图')
+    thumbs_parser.add_argument('--batch-size', type=int, default=200, help='每批处理的照片数量（检查点间隔）')
+    thumbs_parser.add_argument('--restart', action='store_true', help='忽略上次的检查点，从头开始')
+
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.print_help()
+        return 1
+
+    app = create_cli_app(args.data_dir)
+
+    if args.command == 'migrate-layout':
+        migrate_layout(app, args.batch_size, args.pause)
+    elif args.command == 'backfill-exif':
+        backfill_exif(app, args.batch_size, not args.all)
+    elif args.command == 'backfill-placeholders':
+        backfill_placeholders(app, args.batch_size)
+    elif args.command == 'regenerate-thumbnails':
+        regenerate_thumbnails(app, args.workers, args.force, args.batch_size, args.restart)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())